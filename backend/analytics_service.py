@@ -0,0 +1,153 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List
+from pymongo import UpdateOne, ASCENDING
+import logging
+
+from models import SAO_PAULO_TZ
+
+logger = logging.getLogger(__name__)
+
+# Event metrics recorded by the webhook pipeline
+METRICS = {
+    "messages_in",            # customer messages received
+    "messages_out",           # bot replies generated
+    "conversations_new",      # conversations opened
+    "transfer_keyword_hits",  # messages that matched a transfer keyword
+    "bot_response_ms",        # webhook receipt -> reply ready (excludes the fixed send delay)
+}
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# How long each bucket size is kept (None = forever)
+RETENTION = {
+    "minute": timedelta(days=7),
+    "hour": timedelta(days=180),
+    "day": None,
+}
+
+MAX_POINTS = 2000
+
+def fit_granularity(start: datetime, end: datetime, granularity: str) -> Optional[str]:
+    """
+    `granularity`, or the next coarser one when [start, end) would need more
+    than MAX_POINTS buckets; None when even days are too many.
+    """
+    names = list(GRANULARITIES)
+    for name in names[names.index(granularity):]:
+        # +1 for the partial bucket at the start
+        if (end - start) / GRANULARITIES[name] + 1 <= MAX_POINTS:
+            return name
+    return None
+
+def bucket_start(when: datetime, granularity: str) -> datetime:
+    """Align a timestamp to its bucket (days follow the São Paulo calendar)"""
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    if granularity == "minute":
+        return when.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return when.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    local = when.astimezone(SAO_PAULO_TZ)
+    midnight = datetime(local.year, local.month, local.day, tzinfo=SAO_PAULO_TZ)
+    return midnight.astimezone(timezone.utc)
+
+class AnalyticsService:
+    """
+    Time-series rollups in the `metrics_series` collection.
+    
+    Each event is folded into its minute, hour and day bucket with a single
+    `bulk_write` of upserts (`count`, `sum`, `min`, `max`), so reading a range
+    never touches the conversations collection. Minute and hour buckets expire
+    through a TTL index on `expires_at`.
+    """
+    def __init__(self, db):
+        self.db = db
+    
+    async def ensure_indexes(self):
+        await self.db.metrics_series.create_index(
+            [("metric", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+            unique=True
+        )
+        await self.db.metrics_series.create_index("expires_at", expireAfterSeconds=0)
+    
+    async def record(self, events: Dict[str, float], when: Optional[datetime] = None):
+        """Record {metric: value} events (value 1 for plain counters)"""
+        when = when or datetime.now(timezone.utc)
+        operations = []
+        for metric, value in events.items():
+            for granularity in GRANULARITIES:
+                bucket = bucket_start(when, granularity)
+                on_insert = {}
+                if RETENTION[granularity]:
+                    on_insert["expires_at"] = bucket + RETENTION[granularity]
+                update = {
+                    "$inc": {"count": 1, "sum": value},
+                    "$min": {"min": value},
+                    "$max": {"max": value},
+                }
+                if on_insert:
+                    update["$setOnInsert"] = on_insert
+                operations.append(UpdateOne(
+                    {"metric": metric, "granularity": granularity, "bucket": bucket},
+                    update,
+                    upsert=True
+                ))
+        if not operations:
+            return
+        try:
+            await self.db.metrics_series.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Analytics rollup error: {e}")
+    
+    async def series(
+        self,
+        metric: str,
+        granularity: str,
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        """
+        Return zero-filled points for [start, end) at the given granularity.
+        
+        Raises ValueError past MAX_POINTS; pick the granularity with
+        `fit_granularity` first.
+        """
+        first = bucket_start(start, granularity)
+        step = GRANULARITIES[granularity]
+        
+        stored = {}
+        cursor = self.db.metrics_series.find(
+            {"metric": metric, "granularity": granularity, "bucket": {"$gte": first, "$lt": end}},
+            {"_id": 0, "bucket": 1, "count": 1, "sum": 1, "min": 1, "max": 1}
+        )
+        async for doc in cursor:
+            bucket = doc["bucket"]
+            if bucket.tzinfo is None:
+                bucket = bucket.replace(tzinfo=timezone.utc)
+            stored[bucket] = doc
+        
+        points = []
+        bucket = first
+        while bucket < end:
+            if len(points) == MAX_POINTS:
+                raise ValueError(f"More than {MAX_POINTS} points; use a coarser granularity or a shorter range")
+            doc = stored.get(bucket, {})
+            count = doc.get("count", 0)
+            points.append({
+                "bucket": bucket.astimezone(SAO_PAULO_TZ).isoformat(),
+                "count": count,
+                "sum": doc.get("sum", 0),
+                "avg": doc["sum"] / count if count else None,
+                "min": doc.get("min"),
+                "max": doc.get("max"),
+            })
+            if granularity == "day":
+                # Re-align so days stay on local midnight even across DST changes
+                bucket = bucket_start(bucket + step + timedelta(hours=2), granularity)
+            else:
+                bucket = bucket + step
+        return points
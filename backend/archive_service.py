@@ -0,0 +1,175 @@
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne
+import asyncio
+import gzip
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", Path(__file__).parent / "archive"))
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+# Archived conversations keep their datetimes as {"$date": ...} and read back as aware UTC
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=True, tzinfo=timezone.utc)
+
+class ArchiveService:
+    """
+    Cold storage for closed conversations.
+    
+    Conversations closed for more than N days are appended to gzip NDJSON
+    segments in ARCHIVE_DIR and removed from the hot `conversations`
+    collection. Each conversation is written as its own gzip member, so a
+    segment is still a regular .ndjson.gz file (zcat works), and `archive_index`
+    keeps the segment, byte offset and length of each one. Restoring reads just
+    that slice. Segments are append-only; a restored conversation simply drops
+    its index entry.
+    """
+    def __init__(self, db, stats_service, change_tracker, event_bus=None, archive_dir: Path = ARCHIVE_DIR):
+        self.db = db
+        self.stats_service = stats_service
+        self.change_tracker = change_tracker
+        self.event_bus = event_bus
+        self.archive_dir = Path(archive_dir)
+    
+    async def ensure_indexes(self):
+        await self.db.archive_index.create_index("conversation_id", unique=True)
+        await self.db.archive_index.create_index([("phone_number", ASCENDING), ("last_message_at", DESCENDING)])
+    
+    def _new_segment(self) -> Path:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        return self.archive_dir / f"conversations-{stamp}.ndjson.gz"
+    
+    @staticmethod
+    def _append(path: Path, docs: List[Dict[str, Any]]) -> List[Dict[str, int]]:
+        """Append one gzip member per document and fsync; returns their offsets"""
+        locations = []
+        with open(path, "ab") as f:
+            offset = f.tell()
+            for doc in docs:
+                member = gzip.compress((json_util.dumps(doc, json_options=JSON_OPTIONS) + "\n").encode("utf-8"))
+                f.write(member)
+                locations.append({"offset": offset, "length": len(member)})
+                offset += len(member)
+            f.flush()
+            os.fsync(f.fileno())
+        return locations
+    
+    @staticmethod
+    def _read(path: Path, offset: int, length: int) -> Dict[str, Any]:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        return json_util.loads(data.decode("utf-8"), json_options=JSON_OPTIONS)
+    
+    async def archive(self, older_than_days: int, batch_size: int = 100, limit: Optional[int] = None) -> Dict[str, int]:
+        """Move conversations closed and idle for more than `older_than_days` into the archive"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        segment = self._new_segment()
+        archived = 0
+        skipped = 0
+        last_id = None
+        
+        while limit is None or archived < limit:
+            query = {"status": "closed", "last_message_at": {"$lt": cutoff}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            docs = await self.db.conversations.find(query).sort("_id", 1).limit(size).to_list(size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            
+            if segment.exists() and segment.stat().st_size >= SEGMENT_MAX_BYTES:
+                segment = self._new_segment()
+            
+            # 1. durable copy on disk, 2. index entry, 3. removal from the hot set
+            locations = await asyncio.to_thread(self._append, segment, docs)
+            now = datetime.now(timezone.utc)
+            entries = []
+            for doc, location in zip(docs, locations):
+                doc.pop("_id", None)
+                entries.append({
+                    "conversation_id": doc["id"],
+                    "phone_number": doc.get("phone_number"),
+                    "user_name": doc.get("user_name"),
+                    "started_at": doc.get("started_at"),
+                    "last_message_at": doc.get("last_message_at"),
+                    "message_count": len(doc.get("messages") or []),
+                    "segment": segment.name,
+                    **location,
+                    "archived_at": now
+                })
+            await self.db.archive_index.bulk_write([
+                ReplaceOne({"conversation_id": entry["conversation_id"]}, entry, upsert=True)
+                for entry in entries
+            ], ordered=False)
+            
+            # Only delete what is unchanged since it was read
+            result = await self.db.conversations.bulk_write([
+                DeleteOne({"id": doc["id"], "status": "closed", "changed_at": doc.get("changed_at")})
+                for doc in docs
+            ], ordered=False)
+            
+            kept = set()
+            if result.deleted_count < len(docs):
+                # Changed meanwhile: stays hot, and its archived copy is forgotten
+                remaining = await self.db.conversations.find(
+                    {"id": {"$in": [doc["id"] for doc in docs]}}, {"_id": 0, "id": 1}
+                ).to_list(len(docs))
+                kept = {d["id"] for d in remaining}
+                await self.db.archive_index.delete_many({"conversation_id": {"$in": list(kept)}})
+                skipped += len(kept)
+            
+            for doc in docs:
+                if doc["id"] not in kept:
+                    await self.change_tracker.record_deleted(doc["id"])
+            await self.stats_service.conversation_removed("closed", count=result.deleted_count)
+            archived += result.deleted_count
+            logger.info(f"Archived {archived} conversations into {segment.name}")
+        
+        if archived and self.event_bus:
+            await self.event_bus.publish("conversations_archived", None, count=archived)
+        return {"archived": archived, "skipped": skipped}
+    
+    async def find(self, phone_number: Optional[str] = None, conversation_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Index entries, most recent first"""
+        query = {}
+        if phone_number:
+            query["phone_number"] = phone_number
+        if conversation_id:
+            query["conversation_id"] = conversation_id
+        return await self.db.archive_index.find(
+            query, {"_id": 0, "segment": 0, "offset": 0, "length": 0}
+        ).sort("last_message_at", -1).limit(limit).to_list(limit)
+    
+    async def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Read an archived conversation without restoring it"""
+        entry = await self.db.archive_index.find_one({"conversation_id": conversation_id})
+        if not entry:
+            return None
+        return await asyncio.to_thread(self._read, self.archive_dir / entry["segment"], entry["offset"], entry["length"])
+    
+    async def restore(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Put an archived conversation back into the hot collection (as closed)"""
+        conversation = await self.load(conversation_id)
+        if conversation is None:
+            return None
+        
+        conversation.pop("_id", None)
+        conversation.update(self.change_tracker.stamp())
+        result = await self.db.conversations.update_one(
+            {"id": conversation_id},
+            {"$setOnInsert": conversation},
+            upsert=True
+        )
+        await self.db.archive_index.delete_one({"conversation_id": conversation_id})
+        if result.upserted_id is not None:
+            await self.stats_service.conversation_created(conversation.get("status") or "closed")
+            if self.event_bus:
+                await self.event_bus.publish("conversation_restored", conversation_id)
+        return conversation
@@ -1,23 +1,162 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, Security, Depends
+from fastapi import HTTPException, Security, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
 import os
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+# Tokens for ?token= URLs (the SSE stream) end up in access logs: keep them
+# single-purpose and valid only long enough to open the connection
+STREAM_TOKEN_SCOPE = "events"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.environ.get("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
+
+# bcrypt takes 100-300 ms of CPU; keep it off the event loop. The pool size
+# caps how many run at once, the rest wait in the executor's queue
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", "2"))
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="password-hash")
+
+_pwd_context = None
+
+def pwd_context():
+    """bcrypt CryptContext, built on first use (passlib is slow to import)"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+async def _run_hash(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+
+async def hash_password_async(password: str) -> str:
+    """hash_password in the password thread pool"""
+    return await _run_hash(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password in the password thread pool"""
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
+class LoginThrottle:
+    """
+    Per-key login failure counter.
+    
+    After `max_failures` failures within `window` seconds the key is locked
+    for `lockout` seconds. In-memory and per worker, which is enough to make
+    password guessing impractical without a shared store.
+    """
+    def __init__(self, max_failures: int = 5, window: int = 900, lockout: int = 900, max_entries: int = 10000):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_entries = max_entries
+        # key -> (failures, first_failure_at, locked_until)
+        self._entries: "OrderedDict[str, Tuple[int, float, float]]" = OrderedDict()
+    
+    def retry_after(self, *keys: str) -> int:
+        """Seconds until these keys may try again (0 = allowed)"""
+        now = time.monotonic()
+        wait = 0.0
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                wait = max(wait, entry[2] - now)
+        return int(wait) + 1 if wait else 0
+    
+    def failure(self, *keys: str):
+        now = time.monotonic()
+        for key in keys:
+            failures, first_at, locked_until = self._entries.pop(key, (0, now, 0.0))
+            if now - first_at > self.window:
+                failures, first_at = 0, now
+            failures += 1
+            if failures >= self.max_failures:
+                locked_until = now + self.lockout
+                failures, first_at = 0, now
+            self._entries[key] = (failures, first_at, locked_until)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def success(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+# Keyed on (username, client IP): a wrong password from one address never
+# locks the account out for everybody else
+login_throttle = LoginThrottle(
+    max_failures=int(os.environ.get("LOGIN_MAX_FAILURES", "5")),
+    lockout=int(os.environ.get("LOGIN_LOCKOUT_SECONDS", "900"))
+)
+# Keyed on the client IP alone, so one address can't walk through usernames
+login_ip_throttle = LoginThrottle(
+    max_failures=int(os.environ.get("LOGIN_IP_MAX_FAILURES", "20")),
+    lockout=int(os.environ.get("LOGIN_LOCKOUT_SECONDS", "900"))
+)
+
+def login_throttle_retry_after(username: str, ip: str) -> int:
+    """Seconds until `username` may try to log in again from `ip` (0 = allowed)"""
+    return max(login_throttle.retry_after(f"{username.lower()}|{ip}"), login_ip_throttle.retry_after(ip))
+
+def login_failed(username: str, ip: str):
+    login_throttle.failure(f"{username.lower()}|{ip}")
+    login_ip_throttle.failure(ip)
+
+def login_succeeded(username: str, ip: str):
+    # The per-IP count is left alone: knowing one password must not reset
+    # the budget for guessing the others
+    login_throttle.success(f"{username.lower()}|{ip}")
+
+class TokenCache:
+    """
+    Small LRU of verified tokens and their claims.
+    
+    Entries live for `ttl` seconds (never past the token's own `exp`), so an
+    admin panel polling every few seconds verifies its token about once a
+    minute instead of on every request.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: int = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+    
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            self._entries.pop(token, None)
+            return None
+        self._entries.move_to_end(token)
+        return claims
+    
+    def put(self, token: str, claims: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        self._entries[token] = (claims, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+
+token_cache = TokenCache(ttl=int(os.environ.get("TOKEN_CACHE_TTL", "60")))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -30,13 +169,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def decode_token(token: str):
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    token_cache.put(token, payload)
+    return payload
+
+def create_stream_token(user: dict) -> str:
+    """Short-lived token that only opens the event stream"""
+    return create_access_token(
+        {"sub": user.get("sub"), "email": user.get("email"), "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     token = credentials.credentials
     payload = decode_token(token)
-    return payload
\ No newline at end of file
+    if payload.get("scope"):
+        # A stream token lifted from a log can't be used on the API
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return payload
+
+async def get_stream_user(token: str = Query(...)):
+    """For clients that cannot send headers (EventSource): accepts stream tokens only"""
+    payload = decode_token(token)
+    if payload.get("scope") != STREAM_TOKEN_SCOPE:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return payload
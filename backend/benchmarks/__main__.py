@@ -0,0 +1,36 @@
+"""
+Run every benchmark module and keep the results in one JSON file.
+
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --baseline baseline.json           # exits 1 on regressions
+    python -m benchmarks --only bot_service --only models
+
+Case names are prefixed with the module ("models:message/construct"), so a
+baseline taken with --only can still be compared against a full run.
+"""
+import argparse
+import importlib
+import logging
+import sys
+
+from benchmarks.harness import add_common_arguments, run_cases, finish
+
+MODULES = ["bot_service", "models", "serialization"]
+
+def main(argv=None) -> int:
+    parser = add_common_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    parser.add_argument("--only", action="append", choices=MODULES, help="run just this module (repeatable)")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+    
+    results = {}
+    for name in args.only or MODULES:
+        print(f"\n[{name}]")
+        module = importlib.import_module(f"benchmarks.bench_{name}")
+        cases = {f"{name}:{case}": func for case, func in module.build_cases().items()}
+        results.update(run_cases(cases, repeat=args.repeat))
+    print()
+    return finish(args, results, {"modules": args.only or MODULES})
+
+if __name__ == "__main__":
+    sys.exit(main())
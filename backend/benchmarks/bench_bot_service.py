@@ -0,0 +1,95 @@
+"""
+Cost of the BotService text checks run on every incoming message.
+
+Covers menu/name/transfer detection, placeholder replacement on a
+multi-KB system prompt and the prompt assembly done before each LLM call
+(no model is called).
+
+    python -m benchmarks.bench_bot_service
+    python -m benchmarks.bench_bot_service --save before.json
+    python -m benchmarks.bench_bot_service --baseline before.json
+"""
+from typing import Callable, Dict, List
+import argparse
+import logging
+import sys
+
+from benchmarks.harness import add_common_arguments, run_cases, finish
+from bot_service import BotService
+
+PROMPT_SECTION = """
+## Atendimento de [Nome do Cliente]
+
+Você é Eduardo, consultor da empresa. Cumprimente {nome} pelo nome, seja cordial
+e objetivo. Faça uma pergunta por vez e aguarde a resposta antes de seguir.
+Pergunte o tipo de serviço (reforma, construção, manutenção), o endereço da obra,
+a metragem aproximada e o prazo desejado. Nunca passe valores sem visita técnica.
+Se o cliente pedir para falar com um responsável, informe que um atendente vai
+continuar a conversa em breve.
+"""
+
+MENU_MESSAGE = """Olá! Bem-vindo ao nosso atendimento.
+Digite a opção desejada:
+*1* - Comercial
+*2* - Financeiro
+*3* - Obras e engenharia
+*4* - Administrativo
+*5* - Trabalhe conosco"""
+
+PLAIN_MESSAGE = "Bom dia, gostaria de um orçamento para reformar a cozinha e o banheiro do meu apartamento"
+
+def make_prompt(sections: int) -> str:
+    """System prompt of roughly `sections` * 500 bytes with name placeholders"""
+    return "\n".join(PROMPT_SECTION for _ in range(sections))
+
+def make_keywords(count: int) -> List[str]:
+    return [f"palavra chave {i} para transferir" for i in range(count)]
+
+def make_history(count: int) -> List[dict]:
+    return [
+        {
+            "sender": "user" if i % 2 == 0 else "bot",
+            "content": f"Mensagem {i}: preciso de ajuda com a reforma, qual o prazo para começar?"
+        }
+        for i in range(count)
+    ]
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    cases = {}
+    bot = BotService("sk-benchmark", make_prompt(12))
+    
+    cases["detect_menu_options/menu"] = lambda: bot.detect_menu_options(MENU_MESSAGE)
+    cases["detect_menu_options/plain"] = lambda: bot.detect_menu_options(PLAIN_MESSAGE)
+    cases["detect_name_request/plain"] = lambda: bot.detect_name_request(PLAIN_MESSAGE)
+    cases["detect_name_request/match"] = lambda: bot.detect_name_request("Olá! Com quem eu falo, por favor?")
+    cases["detect_bot_response/plain"] = lambda: bot.detect_bot_response(PLAIN_MESSAGE)
+    
+    # No match is the worst case: every keyword is checked
+    cases["should_transfer/default_keywords"] = lambda: bot.should_transfer_to_human(PLAIN_MESSAGE)
+    for count in (100, 1000):
+        keywords = make_keywords(count)
+        cases[f"should_transfer/{count}_keywords"] = lambda keywords=keywords: bot.should_transfer_to_human(PLAIN_MESSAGE, keywords)
+    
+    for sections in (2, 12, 40):
+        prompt = make_prompt(sections)
+        cases[f"replace_name_placeholders/{len(prompt) / 1024:.0f}kb"] = (
+            lambda prompt=prompt: bot._replace_name_placeholders(prompt, "Maria Souza")
+        )
+    
+    for count in (0, 15, 200):
+        history = make_history(count)
+        cases[f"build_prompt/{count}_messages"] = (
+            lambda history=history: bot.build_prompt(PLAIN_MESSAGE, history, customer_name="Maria Souza")
+        )
+    return cases
+
+def main(argv=None) -> int:
+    parser = add_common_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    args = parser.parse_args(argv)
+    # Placeholder replacement logs at INFO; keep handlers out of the timings
+    logging.disable(logging.INFO)
+    results = run_cases(build_cases(), repeat=args.repeat)
+    return finish(args, results)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Pydantic costs on the webhook path.
+
+Each incoming message used to build and dump a `Message` for the customer
+and one for the bot reply, and a `Conversation` for new contacts; the webhook
+now uses the slotted records of records.py instead. This measures both, plus
+validating stored conversations of different sizes, a plain dict with the
+same fields as the floor, and decoding a `messages.upsert` body.
+
+    python -m benchmarks.bench_models
+    python -m benchmarks.bench_models --save before.json
+    python -m benchmarks.bench_models --baseline before.json
+"""
+from typing import Callable, Dict
+import argparse
+import json
+import sys
+import uuid
+
+from benchmarks.harness import add_common_arguments, run_cases, finish
+from benchmarks.bench_serialization import make_conversations
+from models import Message, Conversation, get_brazil_time
+from records import MessageRecord, ConversationRecord, decode_upsert
+from benchmarks.payloads import upsert_payload
+
+CONTENT = "Bom dia, gostaria de um orçamento para reformar a cozinha e o banheiro do meu apartamento"
+
+def plain_message() -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "conversation_id": "conv-1",
+        "sender": "user",
+        "content": CONTENT,
+        "message_type": "text",
+        "timestamp": get_brazil_time()
+    }
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    cases = {}
+    message = Message(conversation_id="conv-1", sender="user", content=CONTENT)
+    
+    cases["message/construct"] = lambda: Message(conversation_id="conv-1", sender="user", content=CONTENT)
+    cases["message/model_dump"] = message.model_dump
+    cases["message/construct_and_dump"] = (
+        lambda: Message(conversation_id="conv-1", sender="user", content=CONTENT).model_dump()
+    )
+    cases["message/plain_dict"] = plain_message
+    cases["message/record_to_doc"] = (
+        lambda: MessageRecord(conversation_id="conv-1", sender="user", content=CONTENT).to_doc()
+    )
+    
+    cases["conversation/new_and_dump"] = lambda: Conversation(
+        user_id="5511900000001",
+        phone_number="5511900000001",
+        user_name="Maria Souza",
+        messages=[]
+    ).model_dump()
+    cases["conversation/record_to_doc"] = lambda: ConversationRecord(
+        user_id="5511900000001",
+        phone_number="5511900000001",
+        user_name="Maria Souza"
+    ).to_doc()
+    
+    body = json.dumps(upsert_payload("5511900000001", "Maria Souza", CONTENT)).encode()
+    cases["webhook/json_loads"] = lambda: json.loads(body)
+    cases["webhook/decode_upsert"] = lambda: decode_upsert(body)
+    
+    for messages in (20, 200):
+        doc = make_conversations(1, messages=messages)[0]
+        conversation = Conversation(**doc)
+        cases[f"conversation/validate/{messages}_messages"] = lambda doc=doc: Conversation(**doc)
+        cases[f"conversation/model_dump/{messages}_messages"] = conversation.model_dump
+    return cases
+
+def main(argv=None) -> int:
+    parser = add_common_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    args = parser.parse_args(argv)
+    results = run_cases(build_cases(), repeat=args.repeat)
+    return finish(args, results)
+
+if __name__ == "__main__":
+    sys.exit(main())
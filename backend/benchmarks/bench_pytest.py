@@ -0,0 +1,31 @@
+"""
+The benchmark cases as pytest-benchmark tests.
+
+Same cases as `python -m benchmarks`, with pytest-benchmark's own storage
+and comparison (pip install pytest-benchmark). The file is not named
+test_*, so the regular test run doesn't collect it; give its path:
+
+    pytest benchmarks/bench_pytest.py --benchmark-autosave
+    pytest benchmarks/bench_pytest.py --benchmark-compare --benchmark-compare-fail=median:10%
+    pytest benchmarks/bench_pytest.py -k models
+"""
+import importlib
+import logging
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.__main__ import MODULES
+
+logging.disable(logging.INFO)
+
+def _cases():
+    for name in MODULES:
+        module = importlib.import_module(f"benchmarks.bench_{name}")
+        for case, func in module.build_cases().items():
+            yield pytest.param(func, id=f"{name}:{case}")
+
+@pytest.mark.parametrize("func", list(_cases()))
+def test_benchmark(benchmark, func):
+    benchmark(func)
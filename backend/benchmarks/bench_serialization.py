@@ -0,0 +1,110 @@
+"""
+Serialization cost of large conversation payloads.
+
+Compares the previous response path (build a Pydantic model per document,
+then let FastAPI validate and encode the list) with the trusted-document path
+used by the read endpoints now (shape the dicts, encode with orjson), and
+reports how much gzip/brotli shrink the body.
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --save before.json
+    python -m benchmarks.bench_serialization --baseline before.json
+"""
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+import argparse
+import gzip
+import json
+import sys
+
+from benchmarks.harness import add_common_arguments, run_cases, finish
+from pydantic import TypeAdapter
+from models import Conversation, get_brazil_time
+from fast_response import dumps, trusted_documents, brotli, orjson
+
+SIZES = [10, 100, 1000]
+MESSAGES_PER_CONVERSATION = 20
+
+def make_conversations(count: int, messages: int = MESSAGES_PER_CONVERSATION) -> List[dict]:
+    """Documents shaped like the ones stored in `conversations`"""
+    now = get_brazil_time()
+    docs = []
+    for i in range(count):
+        history = []
+        for j in range(messages):
+            history.append({
+                "id": f"msg-{i}-{j}",
+                "conversation_id": f"conv-{i}",
+                "sender": "user" if j % 2 == 0 else "bot",
+                "content": f"Mensagem {j} da conversa {i}: preciso de ajuda com o atendimento, é urgente?",
+                "message_type": "text",
+                "timestamp": (now - timedelta(minutes=messages - j)).isoformat()
+            })
+        docs.append({
+            "id": f"conv-{i}",
+            "user_id": f"user-{i}",
+            "phone_number": f"55119{i:08d}",
+            "user_name": f"Cliente {i}",
+            "status": "active",
+            "messages": history,
+            "started_at": (now - timedelta(hours=1)).isoformat(),
+            "last_message_at": now.isoformat(),
+            "transferred_to_human": False,
+            "notified_owner": False,
+            "unread_count": i % 3,
+            "changed_at": now
+        })
+    return docs
+
+def legacy_path(docs: List[dict], adapter: TypeAdapter) -> bytes:
+    # What the endpoint used to do: model per document, then FastAPI's
+    # response_model validation + jsonable encoding + stdlib json.dumps
+    models = [Conversation(**c) for c in docs]
+    validated = adapter.validate_python([m.model_dump() for m in models])
+    return json.dumps(adapter.dump_python(validated, mode="json"), ensure_ascii=False).encode("utf-8")
+
+def fast_path(docs: List[dict]) -> bytes:
+    return dumps(trusted_documents(Conversation, docs))
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    adapter = TypeAdapter(List[Conversation])
+    cases = {}
+    for count in SIZES:
+        docs = make_conversations(count)
+        cases[f"legacy_models_json/{count}"] = lambda docs=docs: legacy_path(docs, adapter)
+        cases[f"trusted_{'orjson' if orjson else 'json'}/{count}"] = lambda docs=docs: fast_path(docs)
+        body = fast_path(docs)
+        cases[f"gzip_level6/{count}"] = lambda body=body: gzip.compress(body, compresslevel=6)
+        if brotli:
+            cases[f"brotli_quality4/{count}"] = lambda body=body: brotli.compress(body, quality=4)
+    return cases
+
+def payload_sizes() -> Dict[int, Dict[str, Optional[int]]]:
+    sizes = {}
+    for count in SIZES:
+        body = fast_path(make_conversations(count))
+        sizes[count] = {
+            "raw": len(body),
+            "gzip": len(gzip.compress(body, compresslevel=6)),
+            "brotli": len(brotli.compress(body, quality=4)) if brotli else None
+        }
+    return sizes
+
+def main(argv=None) -> int:
+    parser = add_common_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    args = parser.parse_args(argv)
+    
+    results = run_cases(build_cases(), repeat=args.repeat)
+    sizes = payload_sizes()
+    
+    print()
+    for count, size in sizes.items():
+        line = f"{count:>5} conversations: {size['raw']:>9} bytes raw, {size['gzip']:>8} gzip"
+        if size["brotli"] is not None:
+            line += f", {size['brotli']:>8} brotli"
+        print(line)
+    
+    return finish(args, results, {"payload_bytes": sizes})
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Tiny timing harness shared by the benchmark scripts.
+
+Each benchmark is a zero-argument callable; `run_cases` times it with
+`time.perf_counter`, keeps the best-of-N and median per-call time and can
+save/compare the results as JSON so regressions show up between runs.
+"""
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional
+import json
+import platform
+import statistics
+import sys
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+def time_case(func: Callable[[], Any], repeat: int = 5, number: int = 0, min_time: float = 0.2) -> Dict[str, float]:
+    """Time `func`, auto-picking the loop count so one repeat lasts about `min_time` seconds"""
+    if number <= 0:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= min_time / 5 or number >= 1_000_000:
+                break
+            number *= 2
+    
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "best_us": min(samples) * 1e6,
+        "median_us": statistics.median(samples) * 1e6,
+        "loops": number,
+    }
+
+def run_cases(cases: Dict[str, Callable[[], Any]], repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, func in cases.items():
+        results[name] = time_case(func, repeat=repeat)
+        print(f"{name:<48} {results[name]['best_us']:>12.1f} us  (median {results[name]['median_us']:.1f} us)")
+    return results
+
+def save_results(path: str, results: Dict[str, Any], extra: Optional[Dict[str, Any]] = None):
+    payload = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if extra:
+        payload.update(extra)
+    Path(path).write_text(json.dumps(payload, indent=2))
+    print(f"Results saved to {path}")
+
+def compare_results(baseline_path: str, results: Dict[str, Dict[str, float]], threshold: float = 0.10) -> int:
+    """Print the change against a saved baseline; returns how many cases regressed by more than `threshold`"""
+    baseline = json.loads(Path(baseline_path).read_text()).get("results", {})
+    regressions = 0
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or "best_us" not in previous or "best_us" not in current:
+            continue
+        change = current["best_us"] / previous["best_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<48} {previous['best_us']:>12.1f} -> {current['best_us']:>12.1f} us ({change:+.1%}){flag}")
+    return regressions
+
+def add_common_arguments(parser):
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --baseline (0.10 = 10%%)")
+    return parser
+
+def finish(args, results: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> int:
+    if args.save:
+        save_results(args.save, results, extra)
+    if args.baseline:
+        return 1 if compare_results(args.baseline, results, args.threshold) else 0
+    return 0
@@ -0,0 +1,96 @@
+"""
+Import-time profile of the API process.
+
+Runs `python -X importtime -c "import server"` in fresh interpreters, reports
+the wall time of the import (best of --repeat runs) and the packages that
+cost the most, so a heavy dependency creeping back onto the startup path
+shows up. MONGO_URL/DB_NAME get harmless defaults; nothing is connected.
+
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --top 25 --save before.json
+    python -m benchmarks.import_profile --baseline before.json
+"""
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.harness import BACKEND_DIR, add_common_arguments, finish
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://127.0.0.1:27017")
+    env.setdefault("DB_NAME", "import_profile")
+    env["LOG_LEVEL"] = "WARNING"
+    return env
+
+def wall_time(module: str) -> float:
+    """Seconds to import `module` in a new interpreter (interpreter start-up excluded)"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=_env(),
+        capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+def import_tree(module: str) -> List[Tuple[int, int, str]]:
+    """(cumulative us, depth, name) for every module imported by `module`"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR, env=_env(),
+        capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    return rows
+
+def by_package(rows: List[Tuple[int, int, str]]) -> Dict[str, int]:
+    """
+    Import time per top-level package, including what it pulls in.
+    
+    A module counts toward its package when its parent belongs to another
+    package, so fastapi's submodules aren't added twice. The imported module
+    itself (depth 0) is the total and is left out.
+    """
+    packages = defaultdict(int)
+    stack: List[Tuple[int, str]] = []
+    # -X importtime prints children before their parent; walking backwards visits parents first
+    for cumulative, depth, name in reversed(rows):
+        root = name.split(".")[0]
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if depth > 0 and (not stack or stack[-1][1] != root):
+            packages[root] += cumulative
+        stack.append((depth, root))
+    return dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+def main(argv=None) -> int:
+    parser = add_common_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    parser.add_argument("--module", default="server", help="module to import (default: server)")
+    parser.add_argument("--top", type=int, default=15, help="packages to list and save")
+    args = parser.parse_args(argv)
+    
+    samples = [wall_time(args.module) for _ in range(args.repeat)]
+    packages = by_package(import_tree(args.module))
+    
+    print(f"import {args.module}: {min(samples) * 1000:.0f} ms (median {statistics.median(samples) * 1000:.0f} ms)\n")
+    top = list(packages.items())[:args.top]
+    for name, cumulative in top:
+        print(f"  {name:<32} {cumulative / 1000:>8.1f} ms")
+    print()
+    
+    results = {
+        f"import/{args.module}": {"best_us": min(samples) * 1e6, "median_us": statistics.median(samples) * 1e6},
+        **{f"package/{name}": {"best_us": float(cumulative)} for name, cumulative in top},
+    }
+    return finish(args, results, {"module": args.module})
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+Webhook bodies shaped like the ones Evolution sends, shared by the
+benchmarks and the load generator (loadtest/).
+"""
+from typing import Dict, Any
+import time
+import uuid
+
+def upsert_payload(phone_number: str, push_name: str, text: str, instance: str = "loadtest") -> Dict[str, Any]:
+    """A customer's `messages.upsert` event"""
+    return {
+        "event": "messages.upsert",
+        "instance": instance,
+        "pushName": push_name,
+        "data": {
+            "key": {
+                "remoteJid": f"{phone_number}@s.whatsapp.net",
+                "fromMe": False,
+                "id": uuid.uuid4().hex[:20].upper()
+            },
+            "pushName": push_name,
+            "message": {"conversation": text},
+            "messageType": "conversation",
+            "messageTimestamp": int(time.time())
+        }
+    }
@@ -1,10 +1,73 @@
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from functools import lru_cache
 from typing import Optional, Dict, Any, List
 import logging
+import os
 import re
+import time
+
+import metrics
 
 logger = logging.getLogger(__name__)
 
+def llm_backend() -> str:
+    """
+    "openai", or "stub" for canned replies with simulated latency (load
+    tests only, see loadtest/llm_stub.py): the stub also needs LOAD_TEST=1.
+    """
+    backend = os.environ.get("LLM_BACKEND", "openai")
+    if backend == "stub" and os.environ.get("LOAD_TEST") != "1":
+        raise RuntimeError("LLM_BACKEND=stub is for load tests only and needs LOAD_TEST=1")
+    return backend
+
+def chat_classes():
+    """(LlmChat, UserMessage) for the configured LLM backend"""
+    if llm_backend() == "stub":
+        from loadtest.llm_stub import StubLlmChat, UserMessage
+        return StubLlmChat, UserMessage
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    return LlmChat, UserMessage
+
+DEFAULT_TRANSFER_KEYWORDS = [
+    "falar com atendente",
+    "atendente humano",
+    "falar com alguém",
+    "preciso de ajuda humana",
+    "transferir",
+    "humano",
+    "falar com o dono",
+    "falar com dono",
+    "falar com gerente",
+    "falar com o gerente",
+    "falar com comercial",
+    "falar com o comercial",
+    "falar com responsável",
+    "falar com o responsável",
+    "falar com supervisor",
+    "falar com o supervisor",
+    "falar com vendedor",
+    "falar com o vendedor",
+    "quero falar com",
+    "passar para",
+    "me transfere",
+    "atendimento humano",
+    "pessoa real",
+    "falar com pessoa",
+    "falar com uma pessoa"
+]
+
+class KeywordMatcher:
+    """Case-insensitive "any keyword appears in the message", compiled into one regex"""
+    def __init__(self, keywords: List[str]):
+        self.keywords = [keyword.lower() for keyword in keywords]
+        self._pattern = re.compile("|".join(re.escape(keyword) for keyword in self.keywords)) if self.keywords else None
+    
+    def matches(self, message: str) -> bool:
+        return self._pattern is not None and self._pattern.search(message.lower()) is not None
+
+@lru_cache(maxsize=64)
+def keyword_matcher(keywords: tuple) -> KeywordMatcher:
+    return KeywordMatcher(list(keywords))
+
 class BotService:
     def __init__(self, api_key: str, system_message: str, model: str = "gpt-4o-mini"):
         self.api_key = api_key
@@ -120,38 +183,47 @@ class BotService:
         ]
         
         result = text
+        replaced = []
         for placeholder in placeholders:
             if placeholder in result:
-                logger.info(f"Replacing placeholder '{placeholder}' with '{customer_name}'")
+                replaced.append(placeholder)
                 result = result.replace(placeholder, customer_name)
         
+        if replaced:
+            logger.debug("Replaced placeholders %s with '%s'", replaced, customer_name)
         return result
     
+    def build_prompt(self, user_message: str, conversation_history: List[Dict] = None, customer_name: str = None) -> str:
+        """System prompt sent to the model: base prompt, recent history and the current message"""
+        # Replace name placeholders in system prompt
+        full_prompt = self._replace_name_placeholders(self.system_message, customer_name)
+        
+        # Build context from history - format it clearly for the AI
+        context = ""
+        if conversation_history and len(conversation_history) > 0:
+            context = "\n\n========================================\nHISTÓRICO DA CONVERSA ATUAL (use para manter contexto e NÃO repetir perguntas já feitas):\n========================================\n"
+            for msg in conversation_history[-15:]:  # Last 15 messages for better context
+                role = "CLIENTE" if msg["sender"] == "user" else "VOCÊ (Eduardo)"
+                context += f"{role}: {msg['content']}\n"
+            context += "========================================\n"
+            context += "\nIMPORTANTE: Baseado no histórico acima, continue a conversa de forma natural. NÃO repita perguntas que você já fez. Se o cliente já respondeu algo, siga para o próximo passo do fluxo.\n"
+        
+        # Add context to prompt
+        if context:
+            full_prompt += context
+        
+        # Add current message indicator
+        full_prompt += f"\nMENSAGEM ATUAL DO CLIENTE: {user_message}\n"
+        full_prompt += "\nSua resposta (lembre-se: uma pergunta por vez, aguarde resposta, não repita o que já perguntou):"
+        return full_prompt
+    
     async def generate_response(self, session_id: str, user_message: str, conversation_history: List[Dict] = None, customer_name: str = None) -> str:
         """Generate AI response using OpenAI with conversation history"""
         try:
-            # Replace name placeholders in system prompt
-            full_prompt = self._replace_name_placeholders(self.system_message, customer_name)
-            
-            # Build context from history - format it clearly for the AI
-            context = ""
-            if conversation_history and len(conversation_history) > 0:
-                context = "\n\n========================================\nHISTÓRICO DA CONVERSA ATUAL (use para manter contexto e NÃO repetir perguntas já feitas):\n========================================\n"
-                for msg in conversation_history[-15:]:  # Last 15 messages for better context
-                    role = "CLIENTE" if msg["sender"] == "user" else "VOCÊ (Eduardo)"
-                    context += f"{role}: {msg['content']}\n"
-                context += "========================================\n"
-                context += "\nIMPORTANTE: Baseado no histórico acima, continue a conversa de forma natural. NÃO repita perguntas que você já fez. Se o cliente já respondeu algo, siga para o próximo passo do fluxo.\n"
-            
-            # Add context to prompt
-            if context:
-                full_prompt += context
-            
-            # Add current message indicator
-            full_prompt += f"\nMENSAGEM ATUAL DO CLIENTE: {user_message}\n"
-            full_prompt += "\nSua resposta (lembre-se: uma pergunta por vez, aguarde resposta, não repita o que já perguntou):"
+            full_prompt = self.build_prompt(user_message, conversation_history, customer_name)
             
             # Use emergentintegrations
+            LlmChat, UserMessage = chat_classes()
             chat = LlmChat(
                 api_key=self.api_key,
                 session_id=session_id,
@@ -159,9 +231,16 @@ class BotService:
             ).with_model("openai", self.model)
             
             message = UserMessage(text=user_message)
-            response = await chat.send_message(message)
+            started = time.perf_counter()
+            try:
+                with metrics.LLM_IN_FLIGHT.track_inprogress():
+                    response = await chat.send_message(message)
+            except Exception:
+                metrics.LLM_SECONDS.labels("error").observe(time.perf_counter() - started)
+                raise
+            metrics.LLM_SECONDS.labels("ok").observe(time.perf_counter() - started)
             
-            logger.info(f"Generated response for session {session_id}: {response[:100]}...")
+            logger.info("Generated response for session %s: %.100s...", session_id, response)
             return response
         except Exception as e:
             logger.error(f"Error generating AI response: {e}")
@@ -169,37 +248,6 @@ class BotService:
     
     def should_transfer_to_human(self, message: str, custom_keywords: List[str] = None) -> bool:
         """Keyword detection for human transfer"""
-        # Default keywords if none provided
-        default_keywords = [
-            "falar com atendente",
-            "atendente humano",
-            "falar com alguém",
-            "preciso de ajuda humana",
-            "transferir",
-            "humano",
-            "falar com o dono",
-            "falar com dono",
-            "falar com gerente",
-            "falar com o gerente",
-            "falar com comercial",
-            "falar com o comercial",
-            "falar com responsável",
-            "falar com o responsável",
-            "falar com supervisor",
-            "falar com o supervisor",
-            "falar com vendedor",
-            "falar com o vendedor",
-            "quero falar com",
-            "passar para",
-            "me transfere",
-            "atendimento humano",
-            "pessoa real",
-            "falar com pessoa",
-            "falar com uma pessoa"
-        ]
-        
         # Use custom keywords if provided, otherwise use defaults
-        keywords = custom_keywords if custom_keywords and len(custom_keywords) > 0 else default_keywords
-        
-        message_lower = message.lower()
-        return any(keyword.lower() in message_lower for keyword in keywords)
\ No newline at end of file
+        keywords = custom_keywords if custom_keywords and len(custom_keywords) > 0 else DEFAULT_TRANSFER_KEYWORDS
+        return keyword_matcher(tuple(keywords)).matches(message)
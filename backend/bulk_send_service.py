@@ -0,0 +1,488 @@
+"""
+Bulk outbound messages (campaign follow-ups) tracked as jobs.
+
+Creating a job resolves the recipients (a phone list or a conversation
+filter) to their conversations and stores one row per recipient in
+`bulk_job_recipients`. Sending happens in the background: `concurrency`
+workers per job send through the instance's pooled HTTP client and its rate
+limiter, which spaces sends `60 / rate_per_minute` seconds apart (no bursts,
+to keep the WhatsApp number out of trouble). Client and limiter belong to
+the service and are shared by every job on the same instance, so jobs
+running side by side never add up to more than that rate; a job can ask
+for a lower rate for itself. Results are flushed in batches to the recipient rows and
+to the job's counters, together with a heartbeat; the same flush appends
+the messages that were actually sent to their conversations (one
+`bulk_write`) and mirrors them to Supabase, so failed or cancelled sends
+never show up in a conversation.
+
+When the server drains, workers stop after their current send and the job
+is left "interrupted"; on the next start it is picked up again (as is a
+"running" job whose heartbeat went stale because its worker died), and
+only recipients still "pending" are sent.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import re
+import time
+import uuid
+
+import httpx
+from pymongo import UpdateOne
+
+from evolution_service import EvolutionAPIService
+from models import get_brazil_time, parse_timestamp, SAO_PAULO_TZ
+from records import MessageRecord
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running", "interrupted")
+STALE_AFTER = timedelta(minutes=2)
+FINAL_FLUSH_ATTEMPTS = 3
+
+def normalize_phone(phone_number: str) -> str:
+    """"+55 (11) 99999-0000" or "5511999990000@s.whatsapp.net" -> "5511999990000\""""
+    return re.sub(r"\D", "", phone_number.split("@")[0])
+
+class RateLimiter:
+    """Hands out send slots evenly spaced at `rate_per_minute`"""
+    def __init__(self, rate_per_minute: int):
+        self.interval = 60.0 / rate_per_minute
+        self._next = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, halt: asyncio.Event) -> bool:
+        """Wait for the next slot; False if `halt` was set meanwhile"""
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            try:
+                await asyncio.wait_for(halt.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return not halt.is_set()
+
+class BulkSendService:
+    def __init__(
+        self,
+        db,
+        stats_service,
+        change_tracker,
+        event_bus,
+        supabase_getter: Callable[[], Any],
+        concurrency: int = 4,
+        rate_per_minute: int = 30,
+        max_recipients: int = 5000,
+        flush_interval: float = 1.0
+    ):
+        self.db = db
+        self.stats_service = stats_service
+        self.change_tracker = change_tracker
+        self.event_bus = event_bus
+        self.supabase_getter = supabase_getter
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.max_recipients = max_recipients
+        self.flush_interval = flush_interval
+        self._stopping = False
+        # One per running job, set to wake its workers on cancel or shutdown
+        self._halts: Set[asyncio.Event] = set()
+        # Per Evolution instance id, shared by all of its jobs
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+    
+    async def ensure_indexes(self):
+        await self.db.bulk_jobs.create_index("id", unique=True)
+        await self.db.bulk_jobs.create_index([("created_at", -1)])
+        await self.db.bulk_job_recipients.create_index([("job_id", 1), ("status", 1)])
+    
+    def stop(self):
+        """Stop dispatching (shutdown); running jobs end up "interrupted\""""
+        self._stopping = True
+        for halt in self._halts:
+            halt.set()
+    
+    async def close(self):
+        """Close the pooled HTTP clients (after the jobs have stopped)"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+    
+    def _limiter(self, instance_id: str) -> RateLimiter:
+        limiter = self._limiters.get(instance_id)
+        if limiter is None:
+            limiter = self._limiters[instance_id] = RateLimiter(self.rate_per_minute)
+        return limiter
+    
+    def _client(self, instance_id: str) -> httpx.AsyncClient:
+        client = self._clients.get(instance_id)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            client = self._clients[instance_id] = httpx.AsyncClient(timeout=30.0, limits=limits)
+        return client
+    
+    async def _find_conversations(
+        self,
+        tenant_id: Optional[str],
+        phone_numbers: Optional[List[str]],
+        status: Optional[str],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"tenant_id": tenant_id}
+        if phone_numbers is not None:
+            query["phone_number"] = {"$in": phone_numbers}
+        if status:
+            query["status"] = status
+        # Same window semantics as search and export
+        if start:
+            query["last_message_at"] = {"$gte": parse_timestamp(start, SAO_PAULO_TZ)}
+        if end:
+            query["started_at"] = {"$lt": parse_timestamp(end, SAO_PAULO_TZ)}
+        # One conversation per phone (its most recent), so the limit counts recipients
+        cursor = self.db.conversations.aggregate([
+            {"$match": query},
+            {"$sort": {"last_message_at": -1}},
+            {"$group": {"_id": "$phone_number", "id": {"$first": "$id"}, "last_message_at": {"$first": "$last_message_at"}}},
+            {"$sort": {"last_message_at": -1}},
+            {"$limit": self.max_recipients + 1},
+            {"$project": {"_id": 0, "id": 1, "phone_number": "$_id"}}
+        ])
+        return await cursor.to_list(None)
+    
+    async def create_job(
+        self,
+        message: str,
+        instance: dict,
+        phone_numbers: Optional[List[str]] = None,
+        status: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tenant_id: Optional[str] = None,
+        rate_per_minute: Optional[int] = None,
+        created_by: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Record the job and its recipients; the caller starts `run(job["id"])`.
+        
+        Raises ValueError when the recipients exceed `max_recipients` or
+        `rate_per_minute` is above the instance's rate.
+        """
+        if rate_per_minute and rate_per_minute > self.rate_per_minute:
+            raise ValueError(f"rate_per_minute can't be above {self.rate_per_minute} (the instance's rate)")
+        if phone_numbers is not None:
+            phone_numbers = list(dict.fromkeys(p for p in map(normalize_phone, phone_numbers) if p))
+        conversations = await self._find_conversations(tenant_id, phone_numbers, status, start, end)
+        by_phone = {conversation["phone_number"]: conversation for conversation in conversations}
+        if len(by_phone) > self.max_recipients or (phone_numbers and len(phone_numbers) > self.max_recipients):
+            raise ValueError(f"Too many recipients (max {self.max_recipients})")
+        
+        job_id = str(uuid.uuid4())
+        now = get_brazil_time()
+        targets = [by_phone[p] for p in (phone_numbers if phone_numbers is not None else by_phone) if p in by_phone]
+        
+        recipients = []
+        for conversation in targets:
+            recipients.append({
+                "job_id": job_id,
+                "phone_number": conversation["phone_number"],
+                "conversation_id": conversation["id"],
+                # Id of the conversation message written once the send succeeds
+                "message_id": str(uuid.uuid4()),
+                "status": "pending",
+                "error": None,
+                "updated_at": now
+            })
+        for phone_number in phone_numbers or []:
+            if phone_number not in by_phone:
+                recipients.append({
+                    "job_id": job_id,
+                    "phone_number": phone_number,
+                    "conversation_id": None,
+                    "message_id": None,
+                    "status": "skipped",
+                    "error": "no_conversation",
+                    "updated_at": now
+                })
+        
+        if recipients:
+            await self.db.bulk_job_recipients.insert_many(recipients, ordered=False)
+        
+        job = {
+            "id": job_id,
+            "status": "queued" if targets else "completed",
+            "message": message,
+            "tenant_id": tenant_id,
+            "instance_id": instance.get("id"),
+            "instance_name": instance["instance_name"],
+            "rate_per_minute": rate_per_minute or self.rate_per_minute,
+            "total": len(recipients),
+            "pending": len(targets),
+            "sent": 0,
+            "failed": 0,
+            "skipped": len(recipients) - len(targets),
+            "created_by": created_by,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None if targets else now,
+            "heartbeat_at": None
+        }
+        await self.db.bulk_jobs.insert_one(dict(job))
+        logger.info("Bulk job %s created: %d to send, %d skipped", job_id, job["pending"], job["skipped"])
+        return job
+    
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Mark the job running here, unless another worker has it"""
+        now = datetime.now(timezone.utc)
+        job = await self.db.bulk_jobs.find_one_and_update(
+            {
+                "id": job_id,
+                "$or": [
+                    {"status": {"$in": ["queued", "interrupted"]}},
+                    {"status": "running", "heartbeat_at": {"$lt": now - STALE_AFTER}},
+                ]
+            },
+            {"$set": {"status": "running", "heartbeat_at": now}},
+            projection={"_id": 0}
+        )
+        if job and job["started_at"] is None:
+            await self.db.bulk_jobs.update_one({"id": job_id}, {"$set": {"started_at": now}})
+        return job
+    
+    async def run(self, job_id: str):
+        """Send the job's pending messages; returns when done, cancelled or stopped"""
+        job = await self._claim(job_id)
+        if job is None:
+            return
+        instance = await self.db.evolution_instances.find_one({"id": job["instance_id"]}, {"_id": 0})
+        if not instance:
+            logger.error("Bulk job %s: Evolution instance %s no longer exists", job_id, job["instance_id"])
+            await self._finish(job_id, "failed")
+            return
+        
+        pending = await self.db.bulk_job_recipients.find(
+            {"job_id": job_id, "status": "pending"},
+            {"_id": 1, "phone_number": 1, "conversation_id": 1, "message_id": 1}
+        ).to_list(None)
+        queue: asyncio.Queue = asyncio.Queue()
+        for recipient in pending:
+            queue.put_nowait(recipient)
+        
+        # The instance's shared limiter, behind the job's own when it asked for less
+        limiters = [self._limiter(job["instance_id"])]
+        if job["rate_per_minute"] < self.rate_per_minute:
+            limiters.insert(0, RateLimiter(job["rate_per_minute"]))
+        results: List[tuple] = []
+        state = {"cancelled": False, "lost": False, "heartbeat": time.monotonic()}
+        halt = asyncio.Event()
+        if self._stopping:
+            halt.set()
+        
+        async def flush():
+            """Write the results gathered so far; on failure they go back to `results`"""
+            batch, results[:] = results[:], []
+            if not batch:
+                return
+            try:
+                now = datetime.now(timezone.utc)
+                delivered = [(recipient, sent_at) for recipient, status, _, sent_at in batch if status == "sent"]
+                if delivered:
+                    await self._record_sent(job_id, job["message"], delivered)
+                await self.db.bulk_job_recipients.bulk_write([
+                    UpdateOne({"_id": recipient["_id"]}, {"$set": {"status": status, "error": error, "updated_at": now}})
+                    for recipient, status, error, _ in batch
+                ], ordered=False)
+                sent = len(delivered)
+                await self.db.bulk_jobs.update_one(
+                    {"id": job_id},
+                    {"$inc": {"sent": sent, "failed": len(batch) - sent, "pending": -len(batch)}}
+                )
+            except Exception:
+                # Every write above is safe to repeat except the counters, which come last
+                results[:0] = batch
+                raise
+        
+        async def heartbeat():
+            job_doc = await self.db.bulk_jobs.find_one_and_update(
+                {"id": job_id},
+                {"$set": {"heartbeat_at": datetime.now(timezone.utc)}},
+                projection={"_id": 0, "status": 1}
+            )
+            state["heartbeat"] = time.monotonic()
+            # Cancelled through the API (possibly on another worker)
+            if job_doc and job_doc["status"] == "cancelled":
+                state["cancelled"] = True
+                halt.set()
+        
+        async def acquire() -> bool:
+            for limiter in limiters:
+                if not await limiter.acquire(halt):
+                    return False
+            return True
+        
+        async def worker(service: EvolutionAPIService):
+            while not halt.is_set():
+                try:
+                    recipient = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if not await acquire():
+                    queue.put_nowait(recipient)
+                    return
+                ok = await service.send_text_message(job["instance_name"], recipient["phone_number"], job["message"])
+                results.append((recipient, "sent" if ok else "failed", None if ok else "send_failed", get_brazil_time()))
+        
+        async def flusher():
+            # Heartbeats run even when nothing was sent, or when writing the results fails
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    await flush()
+                except Exception as e:
+                    logger.error("Bulk job %s: saving %d results failed, will retry: %s", job_id, len(results), e)
+                try:
+                    await heartbeat()
+                except Exception as e:
+                    logger.error("Bulk job %s: heartbeat failed: %s", job_id, e)
+                if time.monotonic() - state["heartbeat"] > STALE_AFTER.total_seconds() / 2:
+                    # Soon another worker may take the job over; stop before both send
+                    logger.error("Bulk job %s: no heartbeat for too long, stopping", job_id)
+                    state["lost"] = True
+                    halt.set()
+                    return
+        
+        logger.info("Bulk job %s: sending %d messages via %s", job_id, len(pending), job["instance_name"])
+        service = EvolutionAPIService(instance["api_url"], instance["api_key"], client=self._client(job["instance_id"]))
+        flush_task = asyncio.create_task(flusher())
+        self._halts.add(halt)
+        try:
+            await asyncio.gather(*(worker(service) for _ in range(self.concurrency)))
+        finally:
+            self._halts.discard(halt)
+            flush_task.cancel()
+            try:
+                await flush_task
+            except asyncio.CancelledError:
+                pass
+            for attempt in range(FINAL_FLUSH_ATTEMPTS):
+                try:
+                    await flush()
+                    break
+                except Exception as e:
+                    if attempt == FINAL_FLUSH_ATTEMPTS - 1:
+                        # These recipients stay "pending" and are sent again on resume
+                        logger.error("Bulk job %s: lost %d results: %s", job_id, len(results), e)
+                        state["lost"] = True
+                    else:
+                        await asyncio.sleep(2 ** attempt)
+        
+        if state["lost"]:
+            # Left "running": once its heartbeat is stale it is resumed from the stored results
+            return
+        if state["cancelled"]:
+            await self._finish(job_id, "cancelled")
+        elif self._stopping and not queue.empty():
+            await self.db.bulk_jobs.update_one({"id": job_id, "status": "running"}, {"$set": {"status": "interrupted"}})
+            logger.info("Bulk job %s interrupted with %d messages left", job_id, queue.qsize())
+        else:
+            await self._finish(job_id, "completed")
+    
+    async def _record_sent(self, job_id: str, message: str, delivered: List[tuple]):
+        """
+        Append sent messages to their conversations and mirror them to Supabase.
+        
+        Conversations that already hold the recipient's message_id (a flush
+        retried after a failed write, or a resumed job) are skipped for both,
+        so neither gets the message twice.
+        """
+        recorded = {
+            doc["id"] for doc in await self.db.conversations.find(
+                {
+                    "id": {"$in": [recipient["conversation_id"] for recipient, _ in delivered]},
+                    "messages.id": {"$in": [recipient["message_id"] for recipient, _ in delivered]}
+                },
+                {"_id": 0, "id": 1}
+            ).to_list(None)
+        }
+        # One recipient per conversation in a job, so a match is this recipient's message
+        fresh = [(recipient, sent_at) for recipient, sent_at in delivered if recipient["conversation_id"] not in recorded]
+        if not fresh:
+            return
+        
+        updates = []
+        for recipient, sent_at in fresh:
+            agent_message = MessageRecord(
+                conversation_id=recipient["conversation_id"], sender="agent", content=message,
+                id=recipient["message_id"], timestamp=sent_at
+            ).to_doc()
+            updates.append(UpdateOne(
+                {"id": recipient["conversation_id"], "messages.id": {"$ne": agent_message["id"]}},
+                {
+                    "$push": {"messages": agent_message},
+                    "$set": {"last_message_at": sent_at, "unread_count": 0, **self.change_tracker.stamp()}
+                }
+            ))
+        await self.db.conversations.bulk_write(updates, ordered=False)
+        await self.stats_service.message_added(len(fresh))
+        await self.event_bus.publish("messages_bulk", None, job_id=job_id, count=len(fresh))
+        supabase_service = self.supabase_getter()
+        if supabase_service:
+            await supabase_service.save_messages([
+                (recipient["conversation_id"], "agent", message) for recipient, _ in fresh
+            ])
+    
+    async def _finish(self, job_id: str, status: str):
+        """Close the job; recipients never sent are marked as such"""
+        left = await self.db.bulk_job_recipients.update_many(
+            {"job_id": job_id, "status": "pending"},
+            {"$set": {"status": status if status != "completed" else "failed", "updated_at": datetime.now(timezone.utc)}}
+        )
+        update: Dict[str, Any] = {"$set": {"status": status, "finished_at": get_brazil_time(), "pending": 0}}
+        if status != "cancelled" and left.modified_count:
+            update["$inc"] = {"failed": left.modified_count}
+        await self.db.bulk_jobs.update_one({"id": job_id}, update)
+        logger.info("Bulk job %s %s", job_id, status)
+    
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job; a worker running it stops at its next progress flush"""
+        before = await self.db.bulk_jobs.find_one_and_update(
+            {"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"$set": {"status": "cancelled"}},
+            projection={"_id": 0}
+        )
+        if before is None:
+            return await self.get_job(job_id)
+        heartbeat = parse_timestamp(before.get("heartbeat_at"))
+        stale = heartbeat is None or heartbeat < datetime.now(timezone.utc) - STALE_AFTER
+        if before["status"] != "running" or stale:
+            await self._finish(job_id, "cancelled")
+        return await self.get_job(job_id)
+    
+    async def resumable_jobs(self) -> List[str]:
+        """Jobs left interrupted, or running with a dead worker"""
+        stale_before = datetime.now(timezone.utc) - STALE_AFTER
+        jobs = await self.db.bulk_jobs.find(
+            {"$or": [
+                {"status": {"$in": ["queued", "interrupted"]}},
+                {"status": "running", "heartbeat_at": {"$lt": stale_before}},
+            ]},
+            {"_id": 0, "id": 1}
+        ).to_list(100)
+        return [job["id"] for job in jobs]
+    
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.bulk_jobs.find_one({"id": job_id}, {"_id": 0})
+    
+    async def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self.db.bulk_jobs.find({}, {"_id": 0, "message": 0}).sort("created_at", -1).to_list(limit)
+    
+    async def recipients(self, job_id: str, status: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"job_id": job_id}
+        if status:
+            query["status"] = status
+        cursor = self.db.bulk_job_recipients.find(query, {"_id": 0, "job_id": 0}).sort("_id", 1).skip(skip).limit(limit)
+        return await cursor.to_list(None)
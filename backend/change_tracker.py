@@ -0,0 +1,140 @@
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A write takes its stamp just before it reaches Mongo, so for a moment a reader
+# can see newer stamps but not that write yet. Cursors handed to clients stay
+# this far behind the read (and ETags only validate once the newest change is
+# this old), so such a write is always still ahead of them. It has to cover
+# the write latency plus the clock skew between API workers.
+SETTLE_SECONDS = 5
+
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+Cursor = Tuple[datetime, str]
+
+def _from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+def _to_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def _key(cursor: Cursor) -> Tuple[int, str]:
+    return _to_ms(cursor[0]), cursor[1]
+
+def encode_cursor(cursor: Cursor) -> str:
+    at, after_id = cursor
+    return f"{_to_ms(at)}:{after_id}" if after_id else str(_to_ms(at))
+
+def decode_cursor(value: str) -> Cursor:
+    """"<ms>" or "<ms>:<conversation id>"; raises ValueError when malformed"""
+    ms, _, after_id = value.partition(":")
+    return _from_ms(int(ms)), after_id
+
+class ChangeTracker:
+    """
+    Change stamps for conversations.
+    
+    Every conversation write sets `changed_at` in the same update (see
+    `stamp()`), so tracking costs no extra round trip; deletes leave a
+    tombstone in `conversation_tombstones`. Deltas are read in
+    (changed_at, id) order and paged, and the cursor returned for the next
+    poll is at most the read time minus SETTLE_SECONDS (see above).
+    """
+    def __init__(self, db):
+        self.db = db
+    
+    async def ensure_indexes(self):
+        await self.db.conversations.create_index([("changed_at", 1), ("id", 1)])
+        await self.db.conversation_tombstones.create_index("changed_at")
+        await self.db.conversation_tombstones.create_index("deleted_at", expireAfterSeconds=int(TOMBSTONE_RETENTION.total_seconds()))
+    
+    @staticmethod
+    def stamp() -> Dict[str, datetime]:
+        """Fields to `$set` (or insert) with every conversation write"""
+        return {"changed_at": datetime.now(timezone.utc)}
+    
+    async def latest_change(self) -> Optional[datetime]:
+        """Newest stamp on a conversation or a tombstone"""
+        latest = None
+        for collection in (self.db.conversations, self.db.conversation_tombstones):
+            doc = await collection.find_one(
+                {"changed_at": {"$exists": True}},
+                {"_id": 0, "changed_at": 1},
+                sort=[("changed_at", -1)]
+            )
+            if doc and (latest is None or _to_ms(doc["changed_at"]) > _to_ms(latest)):
+                latest = doc["changed_at"]
+        return latest
+    
+    async def list_etag(self) -> Optional[str]:
+        """
+        Validator for the full list, or None while the newest change is still settling.
+        
+        Tied to the newest stamp: a write landing late with an older stamp, or a
+        second write in the same millisecond, would not change it, so it is only
+        offered once those can no longer happen.
+        """
+        latest = await self.latest_change()
+        if latest is None:
+            return "0"
+        if _to_ms(latest) > _to_ms(self.settled_cursor()[0]):
+            return None
+        return str(_to_ms(latest))
+    
+    @staticmethod
+    def settled_cursor() -> Cursor:
+        """Cursor for "everything up to now" that is safe to hand out"""
+        return datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS), ""
+    
+    async def record_deleted(self, conversation_id: str):
+        await self.db.conversation_tombstones.insert_one({
+            "conversation_id": conversation_id,
+            **self.stamp(),
+            "deleted_at": datetime.now(timezone.utc)
+        })
+    
+    async def changes(
+        self,
+        since: Cursor,
+        limit: int,
+        query: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], List[str], Cursor, bool]:
+        """
+        Conversations changed after `since`: (docs, deleted ids, next cursor, has_more).
+        
+        Pages hold at most `limit` documents; with has_more, call again with the
+        returned cursor straight away.
+        """
+        settled = self.settled_cursor()
+        at, after_id = since
+        delta = {"$or": [{"changed_at": {"$gt": at}}, {"changed_at": at, "id": {"$gt": after_id}}]}
+        docs = await self.db.conversations.find(
+            {**(query or {}), **delta},
+            projection or {"_id": 0}
+        ).sort([("changed_at", 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        
+        tombstones = await self.db.conversation_tombstones.find(
+            {"changed_at": {"$gt": at}},
+            {"_id": 0, "conversation_id": 1}
+        ).to_list(10000)
+        deleted = [t["conversation_id"] for t in tombstones]
+        
+        next_cursor = settled
+        if has_more:
+            last = (docs[-1]["changed_at"], docs[-1]["id"])
+            if _key(last) <= _key(settled):
+                next_cursor = last
+            else:
+                # The rest is still settling; the next regular poll gets it
+                has_more = False
+        # Never move a client backwards (e.g. two polls inside the settle window)
+        next_cursor = max(next_cursor, since, key=_key)
+        return docs, deleted, next_cursor, has_more
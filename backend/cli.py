@@ -0,0 +1,138 @@
+"""
+Maintenance commands for the WhatsApp bot backend.
+
+Run from the backend directory (uses the same .env as server.py):
+
+    python cli.py rebuild-stats
+    python cli.py migrate-timestamps
+    python cli.py archive --older-than-days 90
+    python cli.py restore-archived <conversation_id>
+    python cli.py export --format csv --scope messages --output messages.csv.gz
+"""
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import timezone
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from stats_service import StatsService
+from migrations import TimestampMigration
+from archive_service import ArchiveService
+from export_service import ExportService, FORMATS, SCOPES
+from change_tracker import ChangeTracker
+from models import SAO_PAULO_TZ, parse_timestamp
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+async def rebuild_stats(db, args):
+    """Recompute dashboard counters from the conversations collection"""
+    result = await StatsService(db).rebuild(batch_size=args.batch_size)
+    print(result)
+
+async def migrate_timestamps(db, args):
+    """Convert ISO string timestamps to native datetimes (resumable)"""
+    naive_tz = SAO_PAULO_TZ if args.naive_tz == "sao-paulo" else timezone.utc
+    migration = TimestampMigration(db, batch_size=args.batch_size, naive_tz=naive_tz)
+    for result in await migration.run(restart=args.restart):
+        print(result)
+
+def archive_service(db) -> ArchiveService:
+    return ArchiveService(db, StatsService(db), ChangeTracker(db))
+
+async def archive(db, args):
+    """Move conversations closed more than N days ago to the compressed archive"""
+    if not await TimestampMigration(db).ready():
+        sys.exit("Run migrate-timestamps first: conversations with string timestamps would be skipped")
+    service = archive_service(db)
+    await service.ensure_indexes()
+    print(await service.archive(args.older_than_days, batch_size=args.batch_size, limit=args.limit))
+
+async def restore_archived(db, args):
+    """Bring an archived conversation back into the conversations collection"""
+    conversation = await archive_service(db).restore(args.conversation_id)
+    print("restored" if conversation else "not found in archive")
+
+async def export(db, args):
+    """Export conversations or messages as NDJSON or CSV (streamed, constant memory)"""
+    compress = args.gzip or (args.output or "").endswith(".gz")
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in ExportService(db).stream(
+            format=args.format, scope=args.scope, status=args.status,
+            start=args.start, end=args.end, compress=compress, batch_size=args.batch_size
+        ):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+
+def export_date(value: str):
+    # Naive dates are São Paulo time, as in the API
+    return parse_timestamp(value, SAO_PAULO_TZ)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="WhatsApp bot maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    rebuild = subparsers.add_parser("rebuild-stats", help=rebuild_stats.__doc__)
+    rebuild.add_argument("--batch-size", type=int, default=500)
+    rebuild.set_defaults(func=rebuild_stats)
+    
+    migrate = subparsers.add_parser("migrate-timestamps", help=migrate_timestamps.__doc__)
+    migrate.add_argument("--batch-size", type=int, default=200)
+    migrate.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start over")
+    migrate.add_argument(
+        "--naive-tz", choices=["utc", "sao-paulo"], default="utc",
+        help="timezone of stored timestamps without an offset; the app always wrote one (-03:00), "
+             "so only imported or hand-edited values lack it"
+    )
+    migrate.set_defaults(func=migrate_timestamps)
+    
+    archive_cmd = subparsers.add_parser("archive", help=archive.__doc__)
+    archive_cmd.add_argument("--older-than-days", type=int, default=int(os.environ.get("ARCHIVE_AFTER_DAYS", "90")))
+    archive_cmd.add_argument("--batch-size", type=int, default=100)
+    archive_cmd.add_argument("--limit", type=int, help="stop after this many conversations")
+    archive_cmd.set_defaults(func=archive)
+    
+    restore = subparsers.add_parser("restore-archived", help=restore_archived.__doc__)
+    restore.add_argument("conversation_id")
+    restore.set_defaults(func=restore_archived)
+    
+    export_cmd = subparsers.add_parser("export", help=export.__doc__)
+    export_cmd.add_argument("--format", choices=FORMATS, default="ndjson")
+    export_cmd.add_argument("--scope", choices=SCOPES, default="conversations")
+    export_cmd.add_argument("--status", help="only conversations with this status")
+    export_cmd.add_argument("--start", type=export_date, help="active since (e.g. 2024-01-01)")
+    export_cmd.add_argument("--end", type=export_date, help="started before (exclusive)")
+    export_cmd.add_argument("--gzip", action="store_true", help="gzip the output (implied by a .gz --output)")
+    export_cmd.add_argument("--batch-size", type=int, default=500)
+    export_cmd.add_argument("--output", "-o", help="file to write (default: stdout)")
+    export_cmd.set_defaults(func=export)
+    
+    return parser
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        await args.func(client[os.environ['DB_NAME']], args)
+    finally:
+        client.close()
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Callable
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_NAME = "Unknown"
+
+def is_known_name(name: Optional[str]) -> bool:
+    """A name is usable if it is present and not the Evolution placeholder"""
+    return bool(name) and name != UNKNOWN_NAME
+
+class ContactDirectory:
+    """
+    Phone number -> best-known contact name and last-seen time.
+    
+    Lookups go through an in-process LRU, then Redis (`contato.{phone}` hashes),
+    and only then Mongo. Misses are cached too (negative caching) so unknown
+    numbers don't hit Mongo on every message. A better pushName is written
+    through to both cache layers as soon as it arrives.
+    """
+    def __init__(
+        self,
+        db,
+        redis_getter: Callable[[], Any],
+        max_entries: int = 10000,
+        ttl: int = 600,
+        negative_ttl: int = 60,
+        redis_ttl: int = 604800,
+        touch_interval: int = 60
+    ):
+        self.db = db
+        self.redis_getter = redis_getter
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.redis_ttl = redis_ttl
+        self.touch_interval = touch_interval
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    def _cache_get(self, phone_number: str):
+        entry = self._cache.get(phone_number)
+        if entry is None:
+            return None
+        profile, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[phone_number]
+            return None
+        self._cache.move_to_end(phone_number)
+        return entry
+    
+    def _cache_set(self, phone_number: str, profile: Optional[Dict[str, Any]], ttl: int):
+        self._cache[phone_number] = (profile, time.monotonic() + ttl)
+        self._cache.move_to_end(phone_number)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+    
+    async def get(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """Return {"name", "last_seen"} for a phone number, or None if unknown"""
+        entry = self._cache_get(phone_number)
+        if entry is not None:
+            return entry[0]
+        
+        redis_service = self.redis_getter()
+        if redis_service:
+            cached = await redis_service.get_contact(phone_number)
+            if cached is not None:
+                profile = None if cached.get("missing") else {
+                    "name": cached.get("name"),
+                    "last_seen": float(cached.get("last_seen") or 0)
+                }
+                self._cache_set(phone_number, profile, self.ttl if profile else self.negative_ttl)
+                return profile
+        
+        conversation = await self.db.conversations.find_one(
+            {"phone_number": phone_number, "user_name": {"$nin": [None, "", UNKNOWN_NAME]}},
+            {"_id": 0, "user_name": 1}
+        )
+        if conversation:
+            profile = {"name": conversation["user_name"], "last_seen": 0.0}
+            await self._store(phone_number, profile)
+            return profile
+        
+        self._cache_set(phone_number, None, self.negative_ttl)
+        if redis_service:
+            await redis_service.set_contact(phone_number, {"missing": "1"}, self.negative_ttl)
+        return None
+    
+    async def _store(self, phone_number: str, profile: Dict[str, Any]):
+        self._cache_set(phone_number, profile, self.ttl)
+        redis_service = self.redis_getter()
+        if redis_service:
+            await redis_service.set_contact(
+                phone_number,
+                {"name": profile["name"], "last_seen": str(profile["last_seen"])},
+                self.redis_ttl
+            )
+    
+    async def resolve_name(self, phone_number: str, push_name: Optional[str]) -> str:
+        """
+        Pick the name to use for this message and record the contact as seen.
+        
+        A real pushName always wins (and is written through if it changed);
+        otherwise the stored name is used, falling back to "Unknown".
+        """
+        now = datetime.now(timezone.utc).timestamp()
+        
+        if is_known_name(push_name):
+            entry = self._cache_get(phone_number)
+            profile = entry[0] if entry else None
+            if (
+                not profile
+                or profile["name"] != push_name
+                or now - profile["last_seen"] >= self.touch_interval
+            ):
+                await self._store(phone_number, {"name": push_name, "last_seen": now})
+            return push_name
+        
+        profile = await self.get(phone_number)
+        if profile:
+            if now - profile["last_seen"] >= self.touch_interval:
+                await self._store(phone_number, {"name": profile["name"], "last_seen": now})
+            return profile["name"]
+        return push_name or UNKNOWN_NAME
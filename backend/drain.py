@@ -0,0 +1,110 @@
+"""
+Graceful shutdown: stop taking new work, let running work finish, then close.
+
+Draining starts on SIGTERM/SIGINT (or when the shutdown event runs, if that
+comes first). From then on /readyz answers 503, new webhooks get 503 with
+Retry-After and the live event streams are closed, so long-lived connections
+don't keep the server from reaching its shutdown event. That event then
+waits, all within SHUTDOWN_DRAIN_SECONDS, for:
+
+1. webhooks already running (LLM call, reply delay, WhatsApp send);
+2. background tasks they started (owner notifications);
+3. buffered writes (Supabase) and the sweeper's current pass,
+
+and only then closes the Mongo and Redis clients. Set supervisor's
+`stopwaitsecs` above SHUTDOWN_DRAIN_SECONDS so the process isn't killed first.
+"""
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Set
+import asyncio
+import logging
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class DrainGate:
+    def __init__(self, timeout: float = 25.0):
+        self.timeout = timeout
+        self.draining = False
+        self.in_flight = 0
+        self._deadline: Optional[float] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._callbacks: List[Callable[[], None]] = []
+    
+    def on_drain(self, callback: Callable[[], None]):
+        """Run `callback` once when draining starts"""
+        self._callbacks.append(callback)
+    
+    def begin(self):
+        if self.draining:
+            return
+        self.draining = True
+        self._deadline = time.monotonic() + self.timeout
+        logger.info("Draining: refusing new webhooks, %d in flight, %.0fs deadline", self.in_flight, self.timeout)
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Drain callback failed: %s", e)
+    
+    def remaining(self) -> float:
+        """Seconds left before the drain deadline (the full timeout if not draining yet)"""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+    
+    @contextmanager
+    def track(self):
+        """Count a unit of work (a webhook) as in flight"""
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+    
+    async def wait_idle(self) -> bool:
+        """Wait for in-flight work until the deadline; False if some is still running"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.remaining())
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def wait_tasks(self, tasks: Set[asyncio.Task]) -> int:
+        """
+        Wait for a live set of tasks until the deadline; returns how many are left.
+        
+        The set is re-read after each wait, so tasks started meanwhile (a
+        notification spawned by the last webhook) are waited for too.
+        """
+        while tasks and self.remaining() > 0:
+            await asyncio.wait(set(tasks), timeout=self.remaining())
+        return len(tasks)
+    
+    def install_signal_hook(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """
+        Start draining as soon as the server is told to stop.
+        
+        The server's own handler (uvicorn's) is kept and still called, so it
+        goes on closing its sockets and waiting for open connections.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                # Default/ignored: nobody is doing a graceful stop to hook into
+                continue
+            
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin)
+                previous(signum, frame)
+            
+            signal.signal(sig, handler)
@@ -0,0 +1,156 @@
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Set, List, Callable
+import asyncio
+import json
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class EventBus:
+    """
+    Conversation-level events (new message, status change, transfer...) for
+    the admin panel's live stream.
+    
+    With Redis, events are published on a pub/sub channel and every worker
+    runs one listener that fans them out to its local subscribers, so a
+    browser connected to any worker sees events produced by all of them.
+    Without Redis, events are delivered to this worker's subscribers only.
+    
+    If the pub/sub connection drops, the listener keeps resubscribing with
+    exponential backoff (up to `max_backoff` seconds). Meanwhile events are
+    delivered locally and the whatsapp_event_bus_degraded gauge is 1; once
+    back, local panels get a "resync" since they missed other workers' events.
+    
+    Workers can also listen for events themselves (`add_listener`); events
+    sent with `notify` reach those listeners on every worker but no panel.
+    """
+    CHANNEL = "conversation_events"
+    
+    def __init__(self, max_queue: int = 200, max_backoff: float = 30.0):
+        self.max_queue = max_queue
+        self.max_backoff = max_backoff
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self.connected = False
+    
+    async def start(self, redis_service=None):
+        """(Re)attach to Redis; call again whenever the Redis connection changes"""
+        await self.stop()
+        self._redis = redis_service
+        if redis_service is not None and redis_service.client:
+            self._listener = asyncio.create_task(self._listen())
+    
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        self._redis = None
+        self._set_connected(False)
+    
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        metrics.EVENT_BUS_DEGRADED.set(0 if connected or self._redis is None else 1)
+    
+    async def _listen(self):
+        backoff = 1.0
+        lost = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                if pubsub is None:
+                    raise ConnectionError("Redis client closed")
+                await pubsub.subscribe(self.CHANNEL)
+                if lost:
+                    lost = False
+                    logger.info("Event bus listener resubscribed to Redis")
+                    # Events published by other workers while we were away are lost
+                    self._dispatch({"type": "resync"})
+                self._set_connected(True)
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._dispatch(json.loads(message["data"]))
+                    except ValueError:
+                        logger.warning("Ignoring malformed event on pub/sub channel")
+                raise ConnectionError("pub/sub stream ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._set_connected(False)
+                lost = True
+                logger.error(f"Event bus listener lost Redis ({e}); events stay on this worker, retrying in {backoff:g}s")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(self.CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+            metrics.EVENT_BUS_RECONNECTS.inc()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+    
+    def _dispatch(self, event: Dict[str, Any]):
+        for callback in self._listeners.get(event.get("type"), ()):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Event listener for %s failed", event.get("type"))
+        if event.get("internal"):
+            return
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow client: drop its backlog and tell it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                continue
+            queue.put_nowait(event)
+    
+    async def publish(self, event_type: str, conversation_id: Optional[str] = None, **data):
+        """Emit an event to every connected admin panel"""
+        await self._emit({
+            "type": event_type,
+            "conversation_id": conversation_id,
+            "at": datetime.now(timezone.utc).isoformat(),
+            **data
+        })
+    
+    async def notify(self, event_type: str, **data):
+        """Emit an event to the listeners of every worker only"""
+        await self._emit({"type": event_type, "internal": True, **data})
+    
+    async def _emit(self, event: Dict[str, Any]):
+        if self._redis and self.connected:
+            if await self._redis.publish(self.CHANNEL, json.dumps(event)):
+                return
+        self._dispatch(event)
+    
+    def add_listener(self, event_type: str, callback: Callable[[Dict[str, Any]], None]):
+        """Call `callback(event)` on this worker for every `event_type` event ("resync" included)"""
+        self._listeners.setdefault(event_type, []).append(callback)
+    
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+    
+    def close_streams(self):
+        """Tell every live stream to end (None); browsers reconnect elsewhere"""
+        for queue in list(self._subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
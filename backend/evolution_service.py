@@ -1,13 +1,18 @@
 import httpx
 import logging
+import time
 from typing import Optional
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 class EvolutionAPIService:
-    def __init__(self, api_url: str, api_key: str):
+    def __init__(self, api_url: str, api_key: str, client: Optional[httpx.AsyncClient] = None):
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
+        # Shared pooled client for many sends (bulk jobs); None = one client per call
+        self.client = client
         self.headers = {
             "apikey": api_key,
             "Content-Type": "application/json"
@@ -37,15 +42,25 @@ class EvolutionAPIService:
                 "text": message
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=payload, headers=self.headers)
-                
-                if response.status_code == 200 or response.status_code == 201:
-                    logger.info(f"Message sent successfully to {phone_number}")
-                    return True
-                else:
-                    logger.error(f"Failed to send message. Status: {response.status_code}, Response: {response.text}")
-                    return False
+            started = time.perf_counter()
+            result = "exception"
+            try:
+                with metrics.EVOLUTION_IN_FLIGHT.track_inprogress():
+                    if self.client is not None:
+                        response = await self.client.post(url, json=payload, headers=self.headers)
+                    else:
+                        async with httpx.AsyncClient(timeout=30.0) as client:
+                            response = await client.post(url, json=payload, headers=self.headers)
+                result = "ok" if response.status_code in (200, 201) else "http_error"
+            finally:
+                metrics.EVOLUTION_SEND_SECONDS.labels(result).observe(time.perf_counter() - started)
+            
+            if result == "ok":
+                logger.info("Message sent successfully to %s", phone_number)
+                return True
+            else:
+                logger.error("Failed to send message. Status: %s, Response: %.500s", response.status_code, response.text)
+                return False
                     
         except Exception as e:
             logger.error(f"Error sending message via Evolution API: {e}")
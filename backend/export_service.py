@@ -0,0 +1,183 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List, AsyncIterator
+import csv
+import io
+import logging
+import zlib
+
+from models import Conversation, parse_timestamp, SAO_PAULO_TZ
+from fast_response import dumps, trusted_document
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+SCOPES = ("conversations", "messages")
+CHUNK_BYTES = 64 * 1024
+
+CONVERSATION_COLUMNS = [
+    "id", "user_id", "phone_number", "user_name", "status", "started_at", "last_message_at",
+    "message_count", "transferred_to_human", "notified_owner", "unread_count"
+]
+MESSAGE_COLUMNS = [
+    "conversation_id", "phone_number", "user_name", "message_id", "sender",
+    "message_type", "timestamp", "content"
+]
+
+def _cell(value: Any) -> Any:
+    # Same rendering as the JSON API: São Paulo time
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(SAO_PAULO_TZ)
+        return value.isoformat()
+    return "" if value is None else value
+
+class ExportService:
+    """
+    Streaming export of conversations or messages as NDJSON or CSV.
+    
+    Rows come from a Mongo cursor read `batch_size` documents at a time and are
+    yielded in ~64KB chunks, optionally gzipped on the fly, so memory stays the
+    same whatever the size of the export. In "messages" scope the transcripts
+    are unwound inside the aggregation and only one message per row is loaded.
+    """
+    def __init__(self, db):
+        self.db = db
+    
+    @staticmethod
+    def _pipeline(
+        scope: str,
+        status: Optional[str],
+        start: Optional[datetime],
+        end: Optional[datetime],
+        transcripts: bool
+    ) -> List[Dict[str, Any]]:
+        match: Dict[str, Any] = {}
+        if status:
+            match["status"] = status
+        message_conditions = []
+        if start:
+            start_at = parse_timestamp(start, SAO_PAULO_TZ)
+            match["last_message_at"] = {"$gte": start_at}
+            message_conditions.append({"$gte": ["$$m.timestamp", start_at]})
+        if end:
+            end_at = parse_timestamp(end, SAO_PAULO_TZ)
+            match["started_at"] = {"$lt": end_at}
+            message_conditions.append({"$lt": ["$$m.timestamp", end_at]})
+        
+        pipeline: List[Dict[str, Any]] = [{"$match": match}, {"$sort": {"_id": 1}}]
+        if scope == "messages":
+            messages: Any = "$messages"
+            if message_conditions:
+                messages = {"$filter": {"input": "$messages", "as": "m", "cond": {"$and": message_conditions}}}
+            pipeline += [
+                {"$project": {"_id": 0, "id": 1, "phone_number": 1, "user_name": 1, "messages": messages}},
+                {"$unwind": "$messages"},
+            ]
+        elif transcripts:
+            pipeline.append({"$project": {"_id": 0}})
+        else:
+            pipeline += [
+                {"$addFields": {"message_count": {"$size": {"$ifNull": ["$messages", []]}}}},
+                {"$project": {"_id": 0, "messages": 0}},
+            ]
+        return pipeline
+    
+    async def rows(
+        self,
+        scope: str = "conversations",
+        status: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        transcripts: bool = True,
+        batch_size: int = 200
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Export rows, one dict per conversation or per message.
+        
+        Without `transcripts`, conversations come with a message_count instead
+        of their messages.
+        """
+        cursor = self.db.conversations.aggregate(
+            self._pipeline(scope, status, start, end, transcripts),
+            batchSize=batch_size,
+            allowDiskUse=True
+        )
+        async for doc in cursor:
+            if scope == "messages":
+                message = doc["messages"]
+                yield {
+                    "conversation_id": doc.get("id"),
+                    "phone_number": doc.get("phone_number"),
+                    "user_name": doc.get("user_name"),
+                    "message_id": message.get("id"),
+                    "sender": message.get("sender"),
+                    "message_type": message.get("message_type", "text"),
+                    "timestamp": message.get("timestamp"),
+                    "content": message.get("content", "")
+                }
+            elif transcripts:
+                yield trusted_document(Conversation, doc)
+            else:
+                yield doc
+    
+    @staticmethod
+    def _csv_encoder(columns: List[str]):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        def encode(row: Optional[Dict[str, Any]]) -> bytes:
+            buffer.seek(0)
+            buffer.truncate()
+            if row is None:
+                writer.writerow(columns)
+            else:
+                writer.writerow([_cell(row.get(column)) for column in columns])
+            return buffer.getvalue().encode("utf-8")
+        return encode
+    
+    async def stream(
+        self,
+        format: str = "ndjson",
+        scope: str = "conversations",
+        status: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        compress: bool = False,
+        batch_size: int = 200
+    ) -> AsyncIterator[bytes]:
+        """Encoded export in chunks of about CHUNK_BYTES"""
+        # wbits=31 writes a gzip container, so the output is a plain .gz file
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        
+        if format == "csv":
+            columns = MESSAGE_COLUMNS if scope == "messages" else CONVERSATION_COLUMNS
+            encode = self._csv_encoder(columns)
+            pending = [encode(None)]
+        else:
+            def encode(row):
+                return dumps(row) + b"\n"
+            pending = []
+        
+        size = sum(len(p) for p in pending)
+        count = 0
+        # CSV has no room for transcripts, only their message count
+        rows = self.rows(scope, status=status, start=start, end=end, transcripts=format != "csv", batch_size=batch_size)
+        async for row in rows:
+            line = encode(row)
+            pending.append(line)
+            size += len(line)
+            count += 1
+            if size >= CHUNK_BYTES:
+                chunk = b"".join(pending)
+                pending, size = [], 0
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        
+        chunk = b"".join(pending)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+        logger.info(f"Exported {count} {scope} as {format}{' (gzip)' if compress else ''}")
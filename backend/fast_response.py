@@ -0,0 +1,138 @@
+from datetime import datetime, date
+from typing import Any, Dict, Iterable, List, Type
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from models import format_datetime
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+def _default(value: Any):
+    # Same rendering as the response models (ApiDatetime)
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps` (orjson when installed)"""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+_field_defaults_cache: Dict[Type[BaseModel], List[tuple]] = {}
+
+def _field_defaults(model: Type[BaseModel]) -> List[tuple]:
+    fields = _field_defaults_cache.get(model)
+    if fields is None:
+        fields = []
+        for name, info in model.model_fields.items():
+            if info.default_factory is not None:
+                fields.append((name, info.default_factory, True))
+            elif info.default is PydanticUndefined:
+                fields.append((name, None, False))
+            else:
+                fields.append((name, info.default, False))
+        _field_defaults_cache[model] = fields
+    return fields
+
+def trusted_document(model: Type[BaseModel], doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shape a document we wrote ourselves like `model` would, without validating it.
+    
+    Keeps only the model's fields (so internal fields such as changed_at
+    don't leak) and fills missing ones with the model defaults.
+    """
+    shaped = {}
+    for name, default, is_factory in _field_defaults(model):
+        if name in doc:
+            shaped[name] = doc[name]
+        elif is_factory:
+            shaped[name] = default()
+        else:
+            shaped[name] = default
+    return shaped
+
+def trusted_documents(model: Type[BaseModel], docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [trusted_document(model, doc) for doc in docs]
+
+class CompressionMiddleware:
+    """
+    Compress complete (non-streaming) responses above `minimum_size`.
+    
+    Uses brotli when the client accepts it and the `brotli` package is
+    installed, gzip otherwise. Streaming responses (SSE, exports) pass through
+    untouched so their chunks are not held back by the compressor.
+    """
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+    
+    def _pick_encoding(self, scope) -> str:
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and "br" in accept:
+            return "br"
+        if "gzip" in accept:
+            return "gzip"
+        return ""
+    
+    async def __call__(self, scope, receive, send):
+        encoding = self._pick_encoding(scope) if scope["type"] == "http" else ""
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        passthrough = False
+        
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start_message)
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            
+            if encoding == "br":
+                compressed = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                compressed = gzip.compress(body, compresslevel=self.gzip_level)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+        
+        await self.app(scope, receive, send_wrapper)
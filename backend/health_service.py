@@ -0,0 +1,89 @@
+"""
+Liveness and readiness for load balancers and process supervisors.
+
+/healthz only says the process is up and serving. /readyz runs the
+registered dependency probes (Mongo ping, Redis ping, ...) with a timeout
+each, and keeps the result for `cache_seconds` so frequent probes from
+several checkers don't turn into a ping per request. Only `required`
+dependencies decide readiness; optional ones (Redis, Supabase) are reported
+as "degraded" because the bot keeps working without them.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# A probe returns True/False, or a short status string ("disabled") that counts as healthy
+Probe = Callable[[], Awaitable[Any]]
+
+class HealthService:
+    def __init__(self, cache_seconds: float = 5.0, timeout: float = 2.0):
+        self.cache_seconds = cache_seconds
+        self.timeout = timeout
+        self.started = False
+        self.draining = False
+        self.started_at = time.time()
+        self._probes: Dict[str, Probe] = {}
+        self._required: Dict[str, bool] = {}
+        self._cached: Optional[Dict[str, Any]] = None
+        self._cached_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    def add_check(self, name: str, probe: Probe, required: bool = True):
+        self._probes[name] = probe
+        self._required[name] = required
+    
+    def mark_draining(self):
+        self.draining = True
+    
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started_at, 1)}
+    
+    async def _run_probe(self, name: str, probe: Probe) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(probe(), timeout=self.timeout)
+            ok = result is not False
+            entry = {"ok": ok}
+            if isinstance(result, str):
+                entry["detail"] = result
+        except asyncio.TimeoutError:
+            entry = {"ok": False, "detail": f"timeout after {self.timeout}s"}
+        except Exception as e:
+            entry = {"ok": False, "detail": str(e)[:200]}
+        entry["required"] = self._required[name]
+        entry["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return entry
+    
+    async def readiness(self) -> Dict[str, Any]:
+        """Probe results, re-run at most once per `cache_seconds`"""
+        async with self._lock:
+            age = time.monotonic() - self._cached_at
+            if self._cached is None or age >= self.cache_seconds:
+                names = list(self._probes)
+                results = await asyncio.gather(*(self._run_probe(name, self._probes[name]) for name in names))
+                self._cached = dict(zip(names, results))
+                self._cached_at = time.monotonic()
+                age = 0.0
+                for name, entry in self._cached.items():
+                    if not entry["ok"]:
+                        logger.warning("Readiness check %s failed: %s", name, entry.get("detail"))
+            checks = self._cached
+        
+        ready = self.started and not self.draining and all(
+            entry["ok"] for entry in checks.values() if entry["required"]
+        )
+        if not ready:
+            status = "starting" if not self.started else "draining" if self.draining else "unavailable"
+        elif all(entry["ok"] for entry in checks.values()):
+            status = "ok"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "ready": ready,
+            "checks": checks,
+            "cached_for_seconds": round(age, 1),
+        }
@@ -0,0 +1,159 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Callable, Tuple
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_RESET_AFTER = timedelta(hours=2)
+OPEN_STATUSES = ["active", "transferred"]
+CLOSE_BATCH_SIZE = 500
+
+class ConversationSweeper:
+    """
+    Periodic housekeeping for idle conversations, off the request path.
+    
+    Every `interval` seconds it:
+    - resets `notified_owner` on conversations idle for 2h, so the owner is
+      notified again when the customer comes back;
+    - closes conversations idle for longer than the `auto_close_after_hours`
+      setting (disabled when unset or 0) and drops their Redis state; a
+      tenant's own `auto_close_after_hours` applies to its conversations.
+    
+    Notification resets are a single `update_many`. Closing first selects the
+    idle conversations, then closes them by id (still guarded by the idle
+    condition, so one that just got a message stays open) and clears the Redis
+    state of those that ended up closed. With Redis, a lock with the same lifetime as the interval makes
+    one worker run the sweep per interval; without Redis every worker sweeps
+    (the updates are idempotent).
+    
+    Until the timestamp migration (`migration`) is done, sweeps are skipped:
+    conversations still holding string timestamps would never match the
+    idle conditions.
+    """
+    LOCK_KEY = "lock:conversation_sweeper"
+    
+    def __init__(
+        self,
+        db,
+        redis_getter: Callable[[], Any],
+        stats_service,
+        change_tracker,
+        event_bus,
+        interval: int = 60,
+        migration=None
+    ):
+        self.db = db
+        self._redis_getter = redis_getter
+        self.stats_service = stats_service
+        self.change_tracker = change_tracker
+        self.event_bus = event_bus
+        self.interval = interval
+        self.migration = migration
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._lock_token = str(uuid.uuid4())
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self, timeout: float = 0):
+        """Stop the loop, letting a sweep in progress finish for up to `timeout` seconds"""
+        if self._task:
+            self._stopping.set()
+            if timeout > 0:
+                await asyncio.wait({self._task}, timeout=timeout)
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.migration and not await self.migration.ready():
+                    logger.info("Conversation sweep waiting for the timestamp migration")
+                elif await self._acquire_lock():
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Conversation sweep error: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _acquire_lock(self) -> bool:
+        redis_service = self._redis_getter()
+        if not redis_service:
+            return True
+        # Not released after the sweep: expiring with the interval keeps it to one sweep per interval
+        return await redis_service.acquire_lock(self.LOCK_KEY, self._lock_token, self.interval)
+    
+    async def _update_many(self, query: Dict[str, Any], changes: Dict[str, Any]):
+        """update_many that also stamps the change time on what it modifies"""
+        return await self.db.conversations.update_many(query, {"$set": {**changes, **self.change_tracker.stamp()}})
+    
+    async def reset_notifications(self, now: datetime) -> int:
+        result = await self._update_many(
+            {"notified_owner": True, "last_message_at": {"$lt": now - NOTIFICATION_RESET_AFTER}},
+            {"notified_owner": False}
+        )
+        if result.modified_count:
+            logger.info(f"Reset notification status on {result.modified_count} idle conversations")
+            await self.event_bus.publish("notifications_reset", None, count=result.modified_count)
+        return result.modified_count
+    
+    async def close_idle(self, now: datetime, idle_for: timedelta, scope: Optional[Dict[str, Any]] = None) -> int:
+        """Close open conversations (matching `scope`) idle for longer than `idle_for`"""
+        closed = []
+        for status in OPEN_STATUSES:
+            query = {**(scope or {}), "status": status, "last_message_at": {"$lt": now - idle_for}}
+            idle = await self.db.conversations.find(query, {"_id": 0, "id": 1}).to_list(None)
+            for start in range(0, len(idle), CLOSE_BATCH_SIZE):
+                ids = [c["id"] for c in idle[start:start + CLOSE_BATCH_SIZE]]
+                # One update per previous status keeps the dashboard counters exact
+                result = await self._update_many({**query, "id": {"$in": ids}}, {"status": "closed"})
+                if not result.modified_count:
+                    continue
+                await self.stats_service.status_changed(status, "closed", count=result.modified_count)
+                closed += await self.db.conversations.find(
+                    {"id": {"$in": ids}, "status": "closed"},
+                    {"_id": 0, "id": 1, "phone_number": 1}
+                ).to_list(None)
+        
+        if closed:
+            redis_service = self._redis_getter()
+            if redis_service:
+                await redis_service.delete_conversations([c["phone_number"] for c in closed])
+            logger.info(f"Auto-closed {len(closed)} conversations idle for more than {idle_for}")
+            await self.event_bus.publish("conversations_closed", None, count=len(closed))
+        return len(closed)
+    
+    async def auto_close_scopes(self) -> List[Tuple[Dict[str, Any], int]]:
+        """(conversation filter, auto_close_after_hours) pairs covering every conversation"""
+        settings, tenants = await asyncio.gather(
+            self.db.settings.find_one({}, {"_id": 0, "auto_close_after_hours": 1}),
+            self.db.tenants.find(
+                {"auto_close_after_hours": {"$ne": None}}, {"_id": 0, "id": 1, "auto_close_after_hours": 1}
+            ).to_list(None)
+        )
+        # Conversations of tenants without their own value follow the global setting
+        scopes = [({"tenant_id": {"$nin": [t["id"] for t in tenants]}}, (settings or {}).get("auto_close_after_hours"))]
+        scopes += [({"tenant_id": t["id"]}, t["auto_close_after_hours"]) for t in tenants]
+        return scopes
+    
+    async def sweep(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.now(timezone.utc)
+        result = {"notifications_reset": await self.reset_notifications(now), "closed": 0}
+        
+        for scope, hours in await self.auto_close_scopes():
+            if hours:
+                result["closed"] += await self.close_idle(now, timedelta(hours=hours), scope)
+        return result
@@ -0,0 +1,111 @@
+"""
+Local stand-in for the Evolution API, for load tests.
+
+Accepts sendText calls after a configurable delay, counts them and can append
+every send to an NDJSON file. Point an Evolution instance at it (api_url
+http://127.0.0.1:8081, any api_key) and set it as default.
+
+    python -m loadtest.evolution_stub --port 8081 --latency-ms 150
+    curl http://127.0.0.1:8081/stats
+"""
+from collections import Counter, deque
+from typing import Optional
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+import uvicorn
+
+class SendRecorder:
+    def __init__(self, latency: float = 0.1, jitter: float = 0.05, error_rate: float = 0.0, record_path: Optional[str] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record_file = open(record_path, "a", encoding="utf-8") if record_path else None
+        self.reset()
+    
+    def reset(self):
+        self.started_at = time.time()
+        self.sent = 0
+        self.failed = 0
+        self.per_instance = Counter()
+        self.recipients = set()
+        self.recent = deque(maxlen=20)
+    
+    async def send(self, instance: str, payload: dict) -> bool:
+        await asyncio.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+        if self.error_rate and random.random() < self.error_rate:
+            self.failed += 1
+            return False
+        record = {
+            "at": time.time(),
+            "instance": instance,
+            "number": payload.get("number"),
+            "text": payload.get("text", "")
+        }
+        self.sent += 1
+        self.per_instance[instance] += 1
+        self.recipients.add(record["number"])
+        self.recent.append(record)
+        if self.record_file:
+            self.record_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return True
+    
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "recipients": len(self.recipients),
+            "per_instance": dict(self.per_instance),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "recent": list(self.recent)
+        }
+
+def create_app(recorder: SendRecorder) -> FastAPI:
+    app = FastAPI(title="Evolution API stub")
+    
+    @app.post("/message/sendText/{instance}", status_code=201)
+    async def send_text(instance: str, request: Request):
+        payload = await request.json()
+        if not await recorder.send(instance, payload):
+            raise HTTPException(status_code=500, detail="Simulated Evolution error")
+        return {
+            "key": {"remoteJid": payload.get("number"), "fromMe": True, "id": f"STUB{recorder.sent}"},
+            "status": "PENDING"
+        }
+    
+    @app.get("/instance/connectionState/{instance}")
+    async def connection_state(instance: str):
+        return {"instance": {"instanceName": instance, "state": "open"}}
+    
+    @app.get("/stats")
+    async def stats():
+        return recorder.stats()
+    
+    @app.post("/stats/reset")
+    async def reset():
+        recorder.reset()
+        return {"status": "reset"}
+    
+    return app
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sends answered with HTTP 500")
+    parser.add_argument("--record", help="append every send to this NDJSON file")
+    args = parser.parse_args(argv)
+    
+    recorder = SendRecorder(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.record)
+    uvicorn.run(create_app(recorder), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Offline stand-in for `LlmChat`, used for load tests.
+
+Enabled with LLM_BACKEND=stub together with LOAD_TEST=1. Answers after
+LLM_STUB_LATENCY_MS (+/- LLM_STUB_JITTER_MS) without calling any API;
+LLM_STUB_ERROR_RATE makes a fraction of the calls raise, like a provider
+error would.
+
+Since every customer would get canned replies, the backend refuses to start
+with the stub while the database looks like a real one (see `check_database`).
+"""
+from typing import List
+from urllib.parse import urlparse
+import asyncio
+import os
+import random
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+REPLIES = [
+    "Olá! Obrigado pelo contato. Poderia me contar um pouco mais sobre o que precisa?",
+    "Entendi. Qual seria o melhor horário para conversarmos?",
+    "Perfeito, já anotei. Tem mais alguma informação que queira acrescentar?",
+]
+
+class UserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+class StubLlmChat:
+    def __init__(self, api_key: str = None, session_id: str = None, system_message: str = None):
+        self.session_id = session_id
+        self.latency = float(os.environ.get("LLM_STUB_LATENCY_MS", "800")) / 1000
+        self.jitter = float(os.environ.get("LLM_STUB_JITTER_MS", "200")) / 1000
+        self.error_rate = float(os.environ.get("LLM_STUB_ERROR_RATE", "0"))
+    
+    def with_model(self, provider: str, model: str):
+        return self
+    
+    async def send_message(self, message) -> str:
+        await asyncio.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Stub LLM error")
+        return random.choice(REPLIES)
+
+async def check_database(db) -> List[str]:
+    """
+    Why this database can't be used with the stub (empty = fine): an OpenAI
+    key that looks real, or an Evolution instance outside this machine.
+    """
+    problems = []
+    settings = await db.settings.find_one({}, {"_id": 0, "openai_api_key": 1}) or {}
+    tenants = await db.tenants.find({"openai_api_key": {"$regex": "^sk-"}}, {"_id": 0, "id": 1}).to_list(None)
+    if (settings.get("openai_api_key") or "").startswith("sk-"):
+        problems.append("the settings hold an OpenAI key")
+    problems.extend(f"tenant {tenant['id']} holds an OpenAI key" for tenant in tenants)
+    async for instance in db.evolution_instances.find({}, {"_id": 0, "name": 1, "api_url": 1}):
+        if urlparse(instance.get("api_url") or "").hostname not in LOCAL_HOSTS:
+            problems.append(f"Evolution instance {instance.get('name')} points to {instance.get('api_url')}")
+    return problems
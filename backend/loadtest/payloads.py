@@ -0,0 +1,55 @@
+"""
+Webhook payloads for load tests: recorded ones read from a file, or
+synthesized `messages.upsert` events shaped like the ones Evolution sends.
+"""
+from pathlib import Path
+from typing import Dict, Any, Iterator, List
+import itertools
+import json
+import random
+
+from benchmarks.payloads import upsert_payload
+
+MESSAGES = [
+    "Olá, boa tarde!",
+    "Gostaria de um orçamento para reforma do meu apartamento",
+    "Vocês atendem na zona sul?",
+    "Qual o prazo para começar a obra?",
+    "Pode me mandar mais informações?",
+    "É uma casa de 120m², preciso trocar o piso e pintar",
+    "Qual a forma de pagamento?",
+    "Ok, obrigado",
+]
+TRANSFER_MESSAGES = [
+    "Quero falar com atendente",
+    "Pode me transferir para o comercial?",
+]
+
+def load_payloads(path: str) -> List[Dict[str, Any]]:
+    """Recorded payloads: a JSON list or one JSON payload per line (NDJSON)"""
+    text = Path(path).read_text(encoding="utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def synthesize(contacts: int = 100, transfer_ratio: float = 0.0, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Endless stream of customer messages spread over `contacts` phone numbers.
+    
+    Each contact walks through MESSAGES in order, so conversations grow like
+    real ones; `transfer_ratio` of the messages ask for a human instead.
+    """
+    rng = random.Random(seed)
+    progress = [0] * contacts
+    while True:
+        contact = rng.randrange(contacts)
+        if transfer_ratio and rng.random() < transfer_ratio:
+            text = rng.choice(TRANSFER_MESSAGES)
+        else:
+            text = MESSAGES[progress[contact] % len(MESSAGES)]
+            progress[contact] += 1
+        yield upsert_payload(f"55119{contact:08d}", f"Cliente {contact}", text)
+
+def replay(payloads: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Recorded payloads in order, over and over"""
+    return itertools.cycle(payloads)
@@ -0,0 +1,210 @@
+"""
+Webhook load generator.
+
+Sends `messages.upsert` payloads to /api/webhook/{webhook_id}, either at a
+fixed arrival rate (open loop, --rate) or with a fixed number of concurrent
+senders (closed loop, --concurrency), and reports throughput, latency
+percentiles and errors.
+
+Run the backend with the offline stubs so nothing external is called:
+
+    LOAD_TEST=1 LLM_BACKEND=stub LLM_STUB_LATENCY_MS=800 REPLY_DELAY_SECONDS=0 uvicorn server:app --port 8001
+    python -m loadtest.evolution_stub --port 8081
+    python -m loadtest.replay --url http://127.0.0.1:8001 --rate 20 --duration 60 \\
+        --evolution-stub http://127.0.0.1:8081 --save run.json
+
+Use --payloads to replay recorded webhook bodies (JSON list or NDJSON)
+instead of synthesized ones.
+"""
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Optional
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+
+import httpx
+
+from loadtest.payloads import load_payloads, replay, synthesize
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, url: str, payloads: Iterator[Dict[str, Any]]):
+        self.client = client
+        self.url = url
+        self.payloads = payloads
+        self.latencies: List[float] = []
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    async def send_one(self):
+        payload = next(self.payloads)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(self.url, json=payload)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                self.errors[f"http_{response.status_code}"] += 1
+                return
+            self.latencies.append(elapsed)
+            # The webhook answers 200 with status "error" when it is not configured
+            outcome = response.json().get("status", "unknown")
+            self.outcomes[outcome] += 1
+            if outcome == "error":
+                self.errors["status_error"] += 1
+        except httpx.HTTPError as e:
+            self.errors[type(e).__name__] += 1
+        finally:
+            self.in_flight -= 1
+    
+    async def run_closed(self, concurrency: int, deadline: float, requests: Optional[int]):
+        """`concurrency` senders, each sending its next request as soon as the previous one returns"""
+        budget = iter(range(requests)) if requests else None
+        
+        async def sender():
+            while time.perf_counter() < deadline:
+                if budget is not None and next(budget, None) is None:
+                    return
+                await self.send_one()
+        
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+    
+    async def run_open(self, rate: float, deadline: float, requests: Optional[int], max_in_flight: int):
+        """Requests started on a fixed schedule, whether or not earlier ones have returned"""
+        tasks = set()
+        interval = 1 / rate
+        next_at = time.perf_counter()
+        sent = 0
+        while time.perf_counter() < deadline and (not requests or sent < requests):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at += interval
+            if self.in_flight >= max_in_flight:
+                # The backend can't keep up; count the arrival as dropped instead of queueing it
+                self.errors["dropped_max_in_flight"] += 1
+                continue
+            task = asyncio.create_task(self.send_one())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+    
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        completed = len(latencies)
+        total = completed + sum(v for k, v in self.errors.items() if k != "status_error")
+        errors = sum(self.errors.values())
+        
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        
+        return {
+            "requests": total,
+            "completed": completed,
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput_rps": round(completed / elapsed, 2) if elapsed else 0,
+            "latency_ms": {
+                "p50": ms(percentile(latencies, 50)),
+                "p95": ms(percentile(latencies, 95)),
+                "p99": ms(percentile(latencies, 99)),
+                "max": ms(latencies[-1] if latencies else None),
+                "mean": ms(sum(latencies) / completed if completed else None),
+            },
+            "error_rate": round(errors / total, 4) if total else 0,
+            "errors": dict(self.errors),
+            "outcomes": dict(self.outcomes),
+            "max_in_flight": self.max_in_flight,
+        }
+
+async def stub_stats(client: httpx.AsyncClient, stub_url: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not stub_url:
+        return None
+    try:
+        response = await client.get(f"{stub_url.rstrip('/')}/stats")
+        return response.json()
+    except httpx.HTTPError:
+        return None
+
+async def run(args) -> Dict[str, Any]:
+    if args.payloads:
+        payloads = replay(load_payloads(args.payloads))
+    else:
+        payloads = synthesize(contacts=args.contacts, transfer_ratio=args.transfer_ratio, seed=args.seed)
+    
+    url = f"{args.url.rstrip('/')}/api/webhook/{args.webhook_id}"
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        before = await stub_stats(client, args.evolution_stub)
+        load = LoadRun(client, url, payloads)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rate:
+            await load.run_open(args.rate, deadline, args.requests, args.max_in_flight)
+        else:
+            await load.run_closed(args.concurrency, deadline, args.requests)
+        result = load.report(time.perf_counter() - start)
+        
+        after = await stub_stats(client, args.evolution_stub)
+        if before and after:
+            result["evolution_sends"] = after["sent"] - before["sent"]
+            result["evolution_failures"] = after["failed"] - before["failed"]
+    
+    result["mode"] = {"rate": args.rate} if args.rate else {"concurrency": args.concurrency}
+    return result
+
+def print_report(result: Dict[str, Any]):
+    latency = result["latency_ms"]
+    print(f"requests      {result['requests']} ({result['completed']} completed) in {result['elapsed_seconds']} s")
+    print(f"throughput    {result['throughput_rps']} req/s")
+    print(f"latency ms    p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"errors        {result['error_rate']:.2%} {result['errors'] or ''}")
+    print(f"outcomes      {result['outcomes']}")
+    if "evolution_sends" in result:
+        print(f"evolution     {result['evolution_sends']} sends, {result['evolution_failures']} failed")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="backend base URL")
+    parser.add_argument("--webhook-id", default="loadtest")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, help="arrivals per second (open loop)")
+    mode.add_argument("--concurrency", type=int, default=10, help="concurrent senders (closed loop)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="open loop: drop arrivals above this")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--payloads", help="recorded webhook payloads (JSON list or NDJSON)")
+    parser.add_argument("--contacts", type=int, default=100, help="synthesized: distinct phone numbers")
+    parser.add_argument("--transfer-ratio", type=float, default=0.0, help="synthesized: share of human transfer requests")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--evolution-stub", help="stub URL, to count the replies it received")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Report saved to {args.save}")
+    return 1 if result["completed"] == 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
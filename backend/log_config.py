@@ -0,0 +1,223 @@
+"""
+Logging setup: JSON records written by a background thread.
+
+Loggers only put records on a queue; formatting and stream I/O happen in a
+QueueListener thread, so a slow stdout/stderr never blocks the event loop.
+Before a record is queued it goes through:
+
+- level checks: use %-style arguments (`logger.info("x %s", value)`) so
+  nothing is formatted for records that are filtered out;
+- sampling: below WARNING, a logger category can keep only a fraction of its
+  records (LOG_SAMPLING="server.webhook=0.1");
+- redaction: secrets in dict arguments are masked and long strings/lists are
+  cut, so a big webhook payload costs a bounded amount to log.
+
+Settings (.env): LOG_LEVEL, LOG_LEVELS ("httpx=WARNING,server.webhook=DEBUG"),
+LOG_SAMPLING, LOG_FORMAT (json or text), LOG_MAX_FIELD_CHARS, LOG_QUEUE_SIZE.
+Levels and sampling can also be changed at runtime through /api/logging.
+"""
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+
+REDACTED_KEYS = {
+    "apikey", "api_key", "openai_api_key", "supabase_key", "password",
+    "hashed_password", "token", "access_token", "authorization"
+}
+MAX_LIST_ITEMS = 20
+MAX_DEPTH = 4
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def parse_pairs(value: Optional[str]) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, _, setting = item.partition("=")
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+def redact(value: Any, max_chars: int, depth: int = 0) -> Any:
+    """Copy of `value` with secrets masked and long strings/lists shortened"""
+    if depth >= MAX_DEPTH:
+        return "…"
+    if isinstance(value, dict):
+        return {
+            key: "***" if str(key).lower() in REDACTED_KEYS else redact(item, max_chars, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, max_chars, depth + 1) for item in value[:MAX_LIST_ITEMS]]
+        if len(value) > MAX_LIST_ITEMS:
+            items.append(f"… (+{len(value) - MAX_LIST_ITEMS} items)")
+        # A tuple stays a tuple: "%s" % (a, b) and "%s" % [a, b] don't format the same
+        return tuple(items) if isinstance(value, tuple) else items
+    if isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}… (+{len(value) - max_chars} chars)"
+    return value
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, `extra` fields and exc"""
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage(), self.max_chars * 4),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = "***" if key.lower() in REDACTED_KEYS else redact(value, self.max_chars)
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the sub-WARNING records of some logger categories"""
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.set_rates(rates)
+    
+    def set_rates(self, rates: Dict[str, float]):
+        self.rates = dict(rates)
+        self._cache: Dict[str, float] = {}
+    
+    def rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            # The most specific category wins: "server.webhook" over "server"
+            matches = [p for p in self.rates if name == p or name.startswith(p + ".")]
+            rate = self.rates[max(matches, key=len)] if matches else 1.0
+            self._cache[name] = rate
+        return rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+    
+    Arguments are redacted into copies here (so later changes to a dict being
+    logged don't leak into the record); when the queue is full the record is
+    dropped and counted instead of blocking the caller.
+    """
+    def __init__(self, log_queue: queue.Queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+        # Set once the listener is gone: records are then written synchronously
+        self.direct: Optional[logging.Handler] = None
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            if isinstance(record.args, dict):
+                record.args = redact(record.args, self.max_chars)
+            else:
+                record.args = tuple(redact(arg, self.max_chars) for arg in record.args)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.direct is not None:
+            self.direct.handle(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogManager:
+    """Installs the queue handler on the root logger and adjusts levels/sampling at runtime"""
+    def __init__(self):
+        self.handler: Optional[BackgroundQueueHandler] = None
+        self.sampling: Optional[SamplingFilter] = None
+        self.listener: Optional[QueueListener] = None
+        self.output: Optional[logging.Handler] = None
+    
+    def configure(self):
+        max_chars = int(os.environ.get("LOG_MAX_FIELD_CHARS", "500"))
+        log_queue = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+        
+        output = logging.StreamHandler(sys.stderr)
+        if os.environ.get("LOG_FORMAT", "json") == "text":
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+        else:
+            output.setFormatter(JsonFormatter(max_chars))
+        
+        self.handler = BackgroundQueueHandler(log_queue, max_chars)
+        self.sampling = SamplingFilter({
+            name: float(rate) for name, rate in parse_pairs(os.environ.get("LOG_SAMPLING")).items()
+        })
+        self.handler.addFilter(self.sampling)
+        
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+        root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+        for name, level in parse_pairs(os.environ.get("LOG_LEVELS")).items():
+            logging.getLogger(name).setLevel(level.upper())
+        
+        self.output = output
+        self.listener = QueueListener(log_queue, output, respect_handler_level=True)
+        self.listener.start()
+        # Also flush when the process ends without the shutdown event
+        atexit.register(self.stop)
+    
+    def stop(self):
+        """
+        Flush what is queued and stop the writer thread.
+        
+        Whatever is logged afterwards (uvicorn's own shutdown lines, atexit
+        hooks) goes straight to the output instead of into a queue nobody reads.
+        """
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+            if self.handler:
+                self.handler.direct = self.output
+    
+    def set_level(self, name: str, level: str):
+        logger = logging.getLogger(None if name in ("", "root") else name)
+        logger.setLevel(level.upper())
+    
+    def set_sampling(self, rates: Dict[str, float]):
+        if self.sampling:
+            self.sampling.set_rates({**self.sampling.rates, **rates})
+    
+    def status(self) -> Dict[str, Any]:
+        loggers = {
+            name: logging.getLevelName(logger.level)
+            for name, logger in logging.root.manager.loggerDict.items()
+            if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET
+        }
+        return {
+            "root": logging.getLevelName(logging.getLogger().level),
+            "loggers": loggers,
+            "sampling": self.sampling.rates if self.sampling else {},
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0,
+        }
+
+log_manager = LogManager()
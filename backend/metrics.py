@@ -0,0 +1,128 @@
+"""
+Prometheus metrics for the webhook pipeline.
+
+With several workers (uvicorn --workers N), set PROMETHEUS_MULTIPROC_DIR to
+an empty directory before starting: every worker then writes its samples
+there and /metrics aggregates all of them, whichever worker answers.
+"""
+from typing import Any, Awaitable, Dict, Optional
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram,
+    CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+
+WEBHOOK_SECONDS = Histogram(
+    "whatsapp_webhook_seconds", "Webhook handling time, by outcome",
+    ["outcome"], buckets=STAGE_BUCKETS
+)
+WEBHOOK_STAGE_SECONDS = Histogram(
+    "whatsapp_webhook_stage_seconds", "Time spent in each webhook pipeline stage",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+WEBHOOK_OUTCOMES = Counter(
+    "whatsapp_webhook_outcomes", "Webhooks by outcome (ai_reply, menu, name, human_handling, ignored, spam, ...)",
+    ["outcome"]
+)
+TRANSFER_KEYWORD_HITS = Counter("whatsapp_transfer_keyword_hits", "Messages matching a human transfer keyword")
+WEBHOOK_PARALLEL_SAVED_SECONDS = Histogram(
+    "whatsapp_webhook_parallel_saved_seconds",
+    "Time saved by running independent webhook steps concurrently (sum of the steps minus wall time)",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+TENANT_REJECTIONS = Counter(
+    "whatsapp_tenant_rejections", "Webhooks turned away by a tenant's limits (busy, llm_budget)",
+    ["tenant", "reason"]
+)
+EVENT_BUS_DEGRADED = Gauge(
+    "whatsapp_event_bus_degraded",
+    "1 while the Redis pub/sub listener is down and live events only reach this worker's panels",
+    multiprocess_mode="livemax"
+)
+EVENT_BUS_RECONNECTS = Counter("whatsapp_event_bus_reconnects", "Redis pub/sub listener reconnect attempts")
+SUPABASE_ROWS = Counter(
+    "whatsapp_supabase_rows", "Messages mirrored to Supabase, by result (written, spilled, replayed, dropped)",
+    ["result"]
+)
+WEBHOOK_IN_FLIGHT = Gauge("whatsapp_webhook_in_flight", "Webhooks being handled", multiprocess_mode="livesum")
+
+LLM_SECONDS = Histogram(
+    "whatsapp_llm_request_seconds", "LLM reply generation time",
+    ["result"], buckets=LLM_BUCKETS
+)
+LLM_IN_FLIGHT = Gauge("whatsapp_llm_in_flight", "LLM requests waiting for an answer", multiprocess_mode="livesum")
+
+EVOLUTION_SEND_SECONDS = Histogram(
+    "whatsapp_evolution_send_seconds", "Evolution API sendText time",
+    ["result"], buckets=STAGE_BUCKETS
+)
+EVOLUTION_IN_FLIGHT = Gauge("whatsapp_evolution_in_flight", "Evolution API sends in progress", multiprocess_mode="livesum")
+
+class WebhookTrace:
+    """
+    Times one webhook: `lap(stage)` records the time since the previous lap,
+    `finish()` the total under `outcome`.
+    
+    The handler sets `outcome` as it returns; it stays "error" if an
+    exception escapes.
+    """
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.outcome = "error"
+        self.timings: Dict[str, Any] = {}
+    
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        WEBHOOK_STAGE_SECONDS.labels(stage).observe(now - self.last)
+        self.timings[stage] = round((now - self.last) * 1000, 1)
+        self.last = now
+    
+    async def gather(self, stage: str, **steps: Awaitable) -> Dict[str, Any]:
+        """
+        Await independent steps concurrently and return their results by name.
+        
+        Records how long each step took on its own and how much wall time
+        running them together saved, under `stage`.
+        """
+        durations = {}
+        
+        async def timed(name: str, step: Awaitable):
+            start = time.perf_counter()
+            try:
+                return await step
+            finally:
+                durations[name] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        results = await asyncio.gather(*(timed(name, step) for name, step in steps.items()))
+        wall = time.perf_counter() - start
+        saved = max(0.0, sum(durations.values()) - wall)
+        WEBHOOK_PARALLEL_SAVED_SECONDS.labels(stage).observe(saved)
+        self.timings[f"{stage}_steps"] = {name: round(d * 1000, 1) for name, d in durations.items()}
+        self.timings[f"{stage}_saved"] = round(saved * 1000, 1)
+        return dict(zip(steps, results))
+    
+    def finish(self):
+        WEBHOOK_SECONDS.labels(self.outcome).observe(time.perf_counter() - self.started)
+        WEBHOOK_OUTCOMES.labels(self.outcome).inc()
+
+def render() -> bytes:
+    """Exposition text for /metrics, summed over all workers in multiprocess mode"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Drop this worker's live gauges on shutdown (multiprocess mode only)"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
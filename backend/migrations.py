@@ -0,0 +1,198 @@
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import logging
+
+from models import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Fields that older versions stored as isoformat() strings.
+# "messages.timestamp" is the timestamp of every embedded message.
+TIMESTAMP_FIELDS = {
+    "conversations": ["started_at", "last_message_at", "messages.timestamp"],
+    "admin_users": ["created_at"],
+    "settings": ["updated_at"],
+    "bot_prompts": ["created_at", "updated_at"],
+    "evolution_instances": ["created_at"],
+}
+
+MAX_ATTEMPTS = 3
+# Renewed after every batch; a worker that died mid-run is replaced after this long
+LEASE = timedelta(minutes=5)
+
+class TimestampMigration:
+    """
+    Convert ISO string timestamps to BSON UTC datetimes.
+    
+    Walks each collection in `_id` order, `batch_size` documents at a time, and
+    records the last `_id` done in the `migrations` collection, so an
+    interrupted run resumes where it stopped. Every update is guarded by the
+    old string values: if the webhook touched a document in between, the update
+    misses and the document is read again. Unparseable values are left alone
+    and counted as invalid.
+    
+    Every string the app itself wrote carries its UTC offset (older versions
+    saved `datetime.now(São Paulo).isoformat()`, e.g. "...-03:00"), so
+    `naive_tz` only applies to values without one. Those came from outside
+    the app (imports, hand edits, tools that write UTC), hence the UTC default.
+    
+    Until it has completed, range queries on these fields miss the documents
+    still holding strings: the server runs it at startup (`run_exclusive`, one
+    worker at a time) and range-based housekeeping waits for `ready()`.
+    """
+    NAME = "timestamps"
+    
+    def __init__(self, db, batch_size: int = 200, naive_tz=timezone.utc):
+        self.db = db
+        self.batch_size = batch_size
+        self.naive_tz = naive_tz
+        self.owner: Optional[str] = None
+        self._ready = False
+    
+    async def ready(self) -> bool:
+        """Whether every collection has been migrated (cached once true)"""
+        if not self._ready:
+            done = await self.db.migrations.count_documents({
+                "_id": {"$in": [f"{self.NAME}:{name}" for name in TIMESTAMP_FIELDS]},
+                "completed_at": {"$ne": None}
+            })
+            self._ready = done == len(TIMESTAMP_FIELDS)
+        return self._ready
+    
+    async def _hold_lease(self) -> bool:
+        """Take or renew the lease for `self.owner`; False if another worker holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.migrations.update_one(
+                {"_id": f"{self.NAME}:lease", "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + LEASE}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+    
+    def _convert(self, value) -> Optional[datetime]:
+        try:
+            return parse_timestamp(value, self.naive_tz)
+        except ValueError:
+            return None
+    
+    def _plan(self, doc: Dict[str, Any], fields: List[str]) -> Tuple[Optional[UpdateOne], int]:
+        """Build the guarded update for one document (None if nothing to convert) and count invalid values"""
+        values = {}
+        for field in fields:
+            if field == "messages.timestamp":
+                for i, message in enumerate(doc.get("messages") or []):
+                    values[f"messages.{i}.timestamp"] = message.get("timestamp")
+            else:
+                values[field] = doc.get(field)
+        
+        guard = {"_id": doc["_id"]}
+        changes = {}
+        invalid = 0
+        for path, value in values.items():
+            if not isinstance(value, str):
+                continue
+            converted = self._convert(value)
+            if converted is None:
+                invalid += 1
+                continue
+            guard[path] = value
+            changes[path] = converted
+        
+        if not changes:
+            return None, invalid
+        return UpdateOne(guard, {"$set": changes}), invalid
+    
+    async def _migrate_batch(self, collection, docs: List[Dict[str, Any]], projection: Dict[str, int], stats: Dict[str, int]):
+        fields = [f for f in projection if f != "_id"]
+        for attempt in range(MAX_ATTEMPTS):
+            ids = []
+            operations = []
+            for doc in docs:
+                operation, invalid = self._plan(doc, fields)
+                if attempt == 0:
+                    stats["invalid"] += invalid
+                if operation:
+                    ids.append(doc["_id"])
+                    operations.append(operation)
+            if not operations:
+                return
+            
+            result = await collection.bulk_write(operations, ordered=False)
+            stats["converted"] += result.modified_count
+            if result.matched_count == len(operations):
+                return
+            
+            # Someone wrote to some of these documents meanwhile; read them again
+            # (the ones already converted have nothing left to do)
+            stats["conflicts"] += len(operations) - result.matched_count
+            docs = await collection.find({"_id": {"$in": ids}}, projection).to_list(len(ids))
+        logger.warning(f"{collection.name}: documents still changing after {MAX_ATTEMPTS} attempts, run the migration again")
+    
+    async def migrate_collection(self, name: str, restart: bool = False) -> Dict[str, Any]:
+        collection = self.db[name]
+        checkpoint_id = f"{self.NAME}:{name}"
+        
+        if restart:
+            await self.db.migrations.delete_one({"_id": checkpoint_id})
+        checkpoint = await self.db.migrations.find_one({"_id": checkpoint_id}) or {}
+        if checkpoint.get("completed_at"):
+            logger.info(f"{name}: already migrated")
+            return {"collection": name, "skipped": True}
+        
+        last_id = checkpoint.get("last_id")
+        projection = {"_id": 1, **{f: 1 for f in TIMESTAMP_FIELDS[name]}}
+        
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = await collection.find(query, projection).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+            if not docs:
+                break
+            
+            stats = {"scanned": len(docs), "converted": 0, "conflicts": 0, "invalid": 0}
+            await self._migrate_batch(collection, docs, projection, stats)
+            last_id = docs[-1]["_id"]
+            
+            if self.owner and not await self._hold_lease():
+                raise RuntimeError("timestamp migration lease taken over by another worker")
+            checkpoint = await self.db.migrations.find_one_and_update(
+                {"_id": checkpoint_id},
+                {
+                    "$set": {"last_id": last_id, "updated_at": datetime.now(timezone.utc)},
+                    "$inc": stats
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info(f"{name}: {checkpoint['scanned']} documents scanned, {checkpoint['converted']} converted")
+        
+        checkpoint = await self.db.migrations.find_one_and_update(
+            {"_id": checkpoint_id},
+            {"$set": {"completed_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return {
+            "collection": name,
+            **{key: checkpoint.get(key, 0) for key in ("scanned", "converted", "conflicts", "invalid")}
+        }
+    
+    async def run(self, restart: bool = False) -> List[Dict[str, Any]]:
+        """Migrate every collection in TIMESTAMP_FIELDS"""
+        results = [await self.migrate_collection(name, restart=restart) for name in TIMESTAMP_FIELDS]
+        self._ready = True
+        return results
+    
+    async def run_exclusive(self, owner: str) -> Optional[List[Dict[str, Any]]]:
+        """run() unless another worker is already running it (then None)"""
+        self.owner = owner
+        if not await self._hold_lease():
+            return None
+        try:
+            return await self.run()
+        finally:
+            await self.db.migrations.delete_one({"_id": f"{self.NAME}:lease", "owner": owner})
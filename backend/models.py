@@ -1,21 +1,50 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, Field, PlainSerializer
+from typing import Optional, List, Dict, Any, Literal, Annotated
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import uuid
-import pytz
 
 # Fuso horário de São Paulo
-SAO_PAULO_TZ = pytz.timezone('America/Sao_Paulo')
+SAO_PAULO_TZ = ZoneInfo('America/Sao_Paulo')
 
 def get_brazil_time():
     return datetime.now(SAO_PAULO_TZ)
 
+def parse_timestamp(value, naive_tz=timezone.utc) -> Optional[datetime]:
+    """
+    Read a timestamp as an aware UTC datetime.
+    
+    Accepts datetimes and the ISO strings written by older versions; naive
+    values are taken to be in `naive_tz`. Returns None for anything else.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=naive_tz)
+    return value.astimezone(timezone.utc)
+
+def format_datetime(value: datetime) -> str:
+    """
+    How the API renders every timestamp: ISO 8601 in São Paulo time.
+    
+    Used both by the response models (`ApiDatetime`) and by FastJSONResponse
+    for the documents served without validation, so a timestamp reads the
+    same whichever path the endpoint takes. Naive values are taken as UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(SAO_PAULO_TZ).isoformat()
+
+ApiDatetime = Annotated[datetime, PlainSerializer(format_datetime, return_type=str, when_used="json")]
+
 class AdminUser(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
     email: str
     hashed_password: str
-    created_at: datetime = Field(default_factory=get_brazil_time)
+    created_at: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class AdminUserCreate(BaseModel):
     username: str
@@ -44,7 +73,8 @@ class Settings(BaseModel):
     notification_whatsapp: Optional[str] = None  # WhatsApp para receber notificações de transferência
     transfer_keywords: Optional[List[str]] = None  # Palavras-chave que ativam transferência
     notify_every_keyword: bool = False  # Se True, notifica a cada keyword detectada; se False, apenas uma vez por conversa
-    updated_at: datetime = Field(default_factory=get_brazil_time)
+    auto_close_after_hours: Optional[int] = None  # Encerra conversas sem mensagens há N horas (None = nunca)
+    updated_at: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class SettingsUpdate(BaseModel):
     openai_api_key: Optional[str] = None
@@ -58,14 +88,15 @@ class SettingsUpdate(BaseModel):
     notification_whatsapp: Optional[str] = None
     transfer_keywords: Optional[List[str]] = None
     notify_every_keyword: Optional[bool] = None
+    auto_close_after_hours: Optional[int] = Field(None, ge=0)
 
 class BotPrompt(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     system_prompt: str
     is_active: bool = True
-    created_at: datetime = Field(default_factory=get_brazil_time)
-    updated_at: datetime = Field(default_factory=get_brazil_time)
+    created_at: ApiDatetime = Field(default_factory=get_brazil_time)
+    updated_at: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class BotPromptCreate(BaseModel):
     name: str
@@ -81,8 +112,8 @@ class WhatsAppUser(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     phone_number: str
     name: str
-    created_at: datetime = Field(default_factory=get_brazil_time)
-    last_interaction: datetime = Field(default_factory=get_brazil_time)
+    created_at: ApiDatetime = Field(default_factory=get_brazil_time)
+    last_interaction: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -90,7 +121,7 @@ class Message(BaseModel):
     sender: str  # 'user' or 'bot'
     content: str
     message_type: str = "text"
-    timestamp: datetime = Field(default_factory=get_brazil_time)
+    timestamp: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class Conversation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -98,11 +129,56 @@ class Conversation(BaseModel):
     phone_number: str
     user_name: str
     status: str = "active"  # active, transferred, closed
-    started_at: datetime = Field(default_factory=get_brazil_time)
-    last_message_at: datetime = Field(default_factory=get_brazil_time)
+    started_at: ApiDatetime = Field(default_factory=get_brazil_time)
+    last_message_at: ApiDatetime = Field(default_factory=get_brazil_time)
     messages: List[Message] = []
     transferred_to_human: bool = False
     notified_owner: bool = False  # Track if owner was notified about this conversation
+    unread_count: int = 0  # Customer messages not yet seen in the admin panel
+    tenant_id: Optional[str] = None  # Tenant whose webhook received it (None = default)
+
+class ConversationSummary(BaseModel):
+    """Conversation list entry without the embedded messages"""
+    id: str
+    user_id: str
+    phone_number: str
+    user_name: str
+    status: str = "active"
+    started_at: ApiDatetime
+    last_message_at: ApiDatetime
+    transferred_to_human: bool = False
+    notified_owner: bool = False
+    unread_count: int = 0
+    last_message_preview: Optional[str] = None
+    last_message_sender: Optional[str] = None
+
+class MessagePage(BaseModel):
+    messages: List[Message]  # Oldest first
+    has_more: bool = False  # More messages exist beyond this window in the requested direction
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page
+    since: Optional[str] = None  # Pass as ?since= to get only what changed after this response
+    deleted: List[str] = []  # Delta mode: conversations deleted (archived) since the cursor
+    has_more: bool = False  # Delta mode: more changes are waiting, call again with `since`
+
+class SearchMatch(BaseModel):
+    """A message that matched a search, cut down to a snippet"""
+    message_id: str
+    sender: str
+    timestamp: ApiDatetime
+    snippet: str
+    highlights: List[List[int]] = []  # [start, end) offsets of the matched terms in snippet
+
+class SearchHit(ConversationSummary):
+    score: float = 0
+    match_count: int = 0  # Matching messages in the conversation (only the latest few are in matches)
+    matches: List[SearchMatch] = []
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_offset: Optional[int] = None  # Pass as ?offset= to get the next page
 
 class WebhookPayload(BaseModel):
     data: Dict[str, Any]
@@ -113,6 +189,18 @@ class WebhookPayload(BaseModel):
 class SendMessageRequest(BaseModel):
     phone_number: str
     message: str
+    conversation_id: Optional[str] = None  # The exact conversation (the panel always sends it)
+    tenant_id: Optional[str] = None  # Otherwise the phone's latest conversation with this tenant (None = default)
+
+class BulkSendRequest(BaseModel):
+    """Same message to a list of phones, or to the conversations matching a filter"""
+    message: str = Field(..., min_length=1, max_length=4096)
+    phone_numbers: Optional[List[str]] = Field(None, max_length=5000)
+    status: Optional[Literal["active", "transferred", "closed"]] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    tenant_id: Optional[str] = None
+    rate_per_minute: Optional[int] = Field(None, ge=1, le=600)
 
 class EvolutionInstance(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -121,10 +209,66 @@ class EvolutionInstance(BaseModel):
     api_key: str
     instance_name: str = "default"
     is_default: bool = False
-    created_at: datetime = Field(default_factory=get_brazil_time)
+    created_at: ApiDatetime = Field(default_factory=get_brazil_time)
 
 class EvolutionInstanceCreate(BaseModel):
     name: str
     api_url: str
     api_key: str
-    instance_name: str = "default"
\ No newline at end of file
+    instance_name: str = "default"
+
+class Tenant(BaseModel):
+    """A business served by this deployment, reached through its own webhook URL"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    webhook_id: str  # Evolution posts to /api/webhook/{webhook_id}
+    prompt_id: Optional[str] = None  # None = the active prompt
+    instance_id: Optional[str] = None  # None = the default Evolution instance
+    # Overrides of the global settings (None = use the global value)
+    openai_api_key: Optional[str] = None
+    notification_whatsapp: Optional[str] = None
+    transfer_keywords: Optional[List[str]] = None
+    notify_every_keyword: Optional[bool] = None
+    auto_close_after_hours: Optional[int] = None  # 0 = never, even if the global setting closes
+    # Isolation limits per worker (None = server default, 0 = unlimited)
+    max_concurrent_webhooks: Optional[int] = None
+    max_concurrent_llm: Optional[int] = None
+    llm_requests_per_minute: Optional[int] = None
+    is_active: bool = True
+    created_at: ApiDatetime = Field(default_factory=get_brazil_time)
+    updated_at: ApiDatetime = Field(default_factory=get_brazil_time)
+
+class TenantCreate(BaseModel):
+    name: str
+    webhook_id: str = Field(..., min_length=1, max_length=100, pattern=r"^[A-Za-z0-9_-]+$")
+    prompt_id: Optional[str] = None
+    instance_id: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    notification_whatsapp: Optional[str] = None
+    transfer_keywords: Optional[List[str]] = None
+    notify_every_keyword: Optional[bool] = None
+    auto_close_after_hours: Optional[int] = Field(None, ge=0)
+    max_concurrent_webhooks: Optional[int] = Field(None, ge=0)
+    max_concurrent_llm: Optional[int] = Field(None, ge=0)
+    llm_requests_per_minute: Optional[int] = Field(None, ge=0)
+    is_active: bool = True
+
+class TenantUpdate(BaseModel):
+    name: Optional[str] = None
+    webhook_id: Optional[str] = Field(None, min_length=1, max_length=100, pattern=r"^[A-Za-z0-9_-]+$")
+    prompt_id: Optional[str] = None
+    instance_id: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    notification_whatsapp: Optional[str] = None
+    transfer_keywords: Optional[List[str]] = None
+    notify_every_keyword: Optional[bool] = None
+    auto_close_after_hours: Optional[int] = Field(None, ge=0)
+    max_concurrent_webhooks: Optional[int] = Field(None, ge=0)
+    max_concurrent_llm: Optional[int] = Field(None, ge=0)
+    llm_requests_per_minute: Optional[int] = Field(None, ge=0)
+    is_active: Optional[bool] = None
+
+class LoggingUpdate(BaseModel):
+    """Runtime logging changes for this worker (see log_config.py)"""
+    levels: Dict[str, Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]] = {}  # logger name ("root" for all) -> level
+    sampling: Dict[str, float] = {}  # logger category -> share of sub-WARNING records kept (0-1)
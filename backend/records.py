@@ -0,0 +1,128 @@
+"""
+Plain record types for the webhook hot path.
+
+Every incoming message used to build a Pydantic `Message` (and a
+`Conversation` for new contacts) only to `model_dump()` it straight into
+Mongo, and the payload went through FastAPI's JSON parsing and `dict`
+validation before being walked with chained `.get` calls. The classes here
+use `__slots__` and build the stored documents directly, and
+`decode_upsert` reads the raw body with orjson into just the fields the bot
+uses. The documents are identical to the Pydantic dumps; the models in
+models.py stay for the admin API (request validation, response schemas).
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import json
+import uuid
+
+from models import get_brazil_time
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # stdlib parser, same result
+    _loads = json.loads
+
+class MessageRecord:
+    """One chat message, as stored in `conversations.messages`"""
+    __slots__ = ("id", "conversation_id", "sender", "content", "message_type", "timestamp")
+    
+    def __init__(self, conversation_id: str, sender: str, content: str, message_type: str = "text",
+                 id: Optional[str] = None, timestamp: Optional[datetime] = None):
+        self.id = id or str(uuid.uuid4())
+        self.conversation_id = conversation_id
+        self.sender = sender
+        self.content = content
+        self.message_type = message_type
+        self.timestamp = timestamp or get_brazil_time()
+    
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "conversation_id": self.conversation_id,
+            "sender": self.sender,
+            "content": self.content,
+            "message_type": self.message_type,
+            "timestamp": self.timestamp
+        }
+
+class ConversationRecord:
+    """A new conversation document (same fields and defaults as `Conversation`)"""
+    __slots__ = (
+        "id", "user_id", "phone_number", "user_name", "status", "started_at", "last_message_at",
+        "messages", "transferred_to_human", "notified_owner", "unread_count", "tenant_id"
+    )
+    
+    def __init__(self, user_id: str, phone_number: str, user_name: str, tenant_id: Optional[str] = None,
+                 messages: Optional[List[MessageRecord]] = None, status: str = "active"):
+        now = get_brazil_time()
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.user_name = user_name
+        self.status = status
+        self.started_at = now
+        self.last_message_at = now
+        self.messages = messages or []
+        self.transferred_to_human = False
+        self.notified_owner = False
+        self.unread_count = 0
+        self.tenant_id = tenant_id
+    
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "phone_number": self.phone_number,
+            "user_name": self.user_name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "last_message_at": self.last_message_at,
+            "messages": [message.to_doc() for message in self.messages],
+            "transferred_to_human": self.transferred_to_human,
+            "notified_owner": self.notified_owner,
+            "unread_count": self.unread_count,
+            "tenant_id": self.tenant_id
+        }
+
+class InboundMessage:
+    """What the bot needs from an Evolution `messages.upsert` webhook"""
+    __slots__ = ("event", "from_me", "phone_number", "push_name", "content")
+    
+    def __init__(self, event: str, from_me: bool, phone_number: str, push_name: str, content: str):
+        self.event = event
+        self.from_me = from_me
+        self.phone_number = phone_number
+        self.push_name = push_name
+        self.content = content
+    
+    def __repr__(self) -> str:
+        return (
+            f"InboundMessage(event={self.event!r}, from_me={self.from_me}, phone_number={self.phone_number!r}, "
+            f"push_name={self.push_name!r}, content={self.content!r})"
+        )
+
+def _dict(value: Any) -> dict:
+    return value if isinstance(value, dict) else {}
+
+def _str(value: Any, default: str = "") -> str:
+    return value if isinstance(value, str) else default
+
+def decode_upsert(body: bytes) -> InboundMessage:
+    """
+    Decode a webhook body; missing or mistyped fields come back empty.
+    
+    Raises ValueError when the body isn't a JSON object.
+    """
+    payload = _loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook payload must be a JSON object")
+    data = _dict(payload.get("data"))
+    key = _dict(data.get("key"))
+    return InboundMessage(
+        event=_str(payload.get("event")),
+        from_me=bool(key.get("fromMe")),
+        phone_number=_str(key.get("remoteJid")).split("@")[0],
+        push_name=_str(payload.get("pushName"), "Unknown"),
+        content=_str(_dict(data.get("message")).get("conversation"))
+    )
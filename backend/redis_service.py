@@ -1,5 +1,5 @@
 import redis.asyncio as redis
-from typing import Optional
+from typing import Optional, Dict, List
 import logging
 
 logger = logging.getLogger(__name__)
@@ -57,4 +57,66 @@ class RedisService:
         try:
             await self.client.delete(f"atendimento.{phone_number}")
         except Exception as e:
-            logger.error(f"Redis delete error: {e}")
\ No newline at end of file
+            logger.error(f"Redis delete error: {e}")
+    
+    async def delete_conversations(self, phone_numbers: List[str], chunk_size: int = 500):
+        """Delete many conversations from cache in a few round trips"""
+        if not self.client or not phone_numbers:
+            return
+        try:
+            for i in range(0, len(phone_numbers), chunk_size):
+                await self.client.delete(*[f"atendimento.{p}" for p in phone_numbers[i:i + chunk_size]])
+        except Exception as e:
+            logger.error(f"Redis bulk delete error: {e}")
+    
+    async def acquire_lock(self, key: str, token: str, ttl: int) -> bool:
+        """SET NX lock that expires after `ttl` seconds (False if someone else holds it or on error)"""
+        if not self.client:
+            return False
+        try:
+            return bool(await self.client.set(key, token, nx=True, ex=ttl))
+        except Exception as e:
+            logger.error(f"Redis lock error: {e}")
+            return False
+    
+    async def get_contact(self, phone_number: str) -> Optional[Dict[str, str]]:
+        """Get cached contact profile (None when not cached)"""
+        if not self.client:
+            return None
+        try:
+            result = await self.client.hgetall(f"contato.{phone_number}")
+            return result or None
+        except Exception as e:
+            logger.error(f"Redis get contact error: {e}")
+            return None
+    
+    async def set_contact(self, phone_number: str, profile: Dict[str, str], ttl: int = 604800):
+        """Cache contact profile with TTL"""
+        if not self.client:
+            return
+        try:
+            key = f"contato.{phone_number}"
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping=profile)
+                pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis set contact error: {e}")
+    
+    async def publish(self, channel: str, message: str) -> bool:
+        """Publish a message on a pub/sub channel"""
+        if not self.client:
+            return False
+        try:
+            await self.client.publish(channel, message)
+            return True
+        except Exception as e:
+            logger.error(f"Redis publish error: {e}")
+            return False
+    
+    def pubsub(self):
+        """New pub/sub connection (None without Redis)"""
+        if not self.client:
+            return None
+        return self.client.pubsub()
\ No newline at end of file
@@ -0,0 +1,182 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from pymongo import TEXT
+import logging
+import re
+import unicodedata
+
+from models import parse_timestamp, SAO_PAULO_TZ
+
+logger = logging.getLogger(__name__)
+
+MAX_MATCHES_PER_HIT = 3
+SNIPPET_CHARS = 160
+SNIPPET_LEAD = 50
+
+# Accent-insensitive character classes used to highlight terms
+ACCENT_CLASSES = {
+    "a": "[aáàâãä]",
+    "e": "[eéèêë]",
+    "i": "[iíìîï]",
+    "o": "[oóòôõö]",
+    "u": "[uúùûü]",
+    "c": "[cç]",
+    "n": "[nñ]",
+}
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents ("Orçamento" -> "orcamento")"""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def search_terms(query: str) -> List[str]:
+    """Words to highlight: quoted phrases are split, negated terms (-word) dropped"""
+    terms = []
+    for token in re.findall(r'-?"[^"]*"|\S+', query):
+        if token.startswith("-"):
+            continue
+        for word in re.findall(r"\w+", token.strip('"')):
+            word = fold(word)
+            if len(word) > 2 and word not in terms:
+                terms.append(word)
+    return terms
+
+def term_pattern(term: str) -> str:
+    """
+    Regex for a folded term that tolerates accents and inflected endings.
+    
+    The text index stems Portuguese words, so "reformas" finds "reforma";
+    dropping the last letters of longer terms lets the highlight follow
+    (prefix "refor" matches both, and the rest of the word is highlighted).
+    """
+    if len(term) > 4:
+        term = term[:max(4, len(term) - 2)]
+    return "".join(ACCENT_CLASSES.get(ch, re.escape(ch)) for ch in term)
+
+def highlight_pattern(terms: List[str]) -> Optional[str]:
+    if not terms:
+        return None
+    alternatives = "|".join(term_pattern(t) for t in sorted(terms, key=len, reverse=True))
+    return rf"(?<!\w)(?:{alternatives})\w*"
+
+def build_snippet(content: str, regex: Optional["re.Pattern"]) -> Dict[str, Any]:
+    """Cut `content` around its first match and return highlight offsets within the snippet"""
+    spans = [m.span() for m in regex.finditer(content)] if regex else []
+    start = max(0, spans[0][0] - SNIPPET_LEAD) if spans else 0
+    end = min(len(content), start + SNIPPET_CHARS)
+    
+    snippet = content[start:end]
+    shift = -start
+    if start > 0:
+        snippet = "…" + snippet
+        shift += 1
+    if end < len(content):
+        snippet += "…"
+    
+    highlights = [
+        [s + shift, e + shift]
+        for s, e in spans
+        if s >= start and e <= end
+    ]
+    return {"snippet": snippet, "highlights": highlights}
+
+class SearchService:
+    """
+    Full-text search over conversation messages.
+    
+    Backed by a Mongo text index on `messages.content` with Portuguese stemming
+    (the text index also folds accents). Matching messages are filtered and cut
+    down inside the aggregation, so transcripts never leave the database; only
+    the latest few matches per conversation are returned as highlighted snippets.
+    """
+    def __init__(self, db):
+        self.db = db
+    
+    async def ensure_indexes(self):
+        # A collection can only have one text index
+        await self.db.conversations.create_index(
+            [("messages.content", TEXT)],
+            name="messages_text",
+            default_language="portuguese",
+            language_override="search_language"
+        )
+    
+    async def search(
+        self,
+        query: str,
+        status: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """Conversations matching `query`, best match first, with highlighted snippets"""
+        pattern = highlight_pattern(search_terms(query))
+        
+        match: Dict[str, Any] = {"$text": {"$search": query}}
+        if status:
+            match["status"] = status
+        message_conditions = []
+        if start:
+            start_at = parse_timestamp(start, SAO_PAULO_TZ)
+            match["last_message_at"] = {"$gte": start_at}
+            message_conditions.append({"$gte": ["$$m.timestamp", start_at]})
+        if end:
+            end_at = parse_timestamp(end, SAO_PAULO_TZ)
+            match["started_at"] = {"$lt": end_at}
+            message_conditions.append({"$lt": ["$$m.timestamp", end_at]})
+        if pattern:
+            message_conditions.append({"$regexMatch": {"input": "$$m.content", "regex": pattern, "options": "i"}})
+        
+        matches = "$messages"
+        if message_conditions:
+            matches = {"$filter": {"input": "$messages", "as": "m", "cond": {"$and": message_conditions}}}
+        
+        pipeline = [
+            {"$match": match},
+            {"$project": {
+                "_id": 0,
+                "id": 1,
+                "user_id": 1,
+                "phone_number": 1,
+                "user_name": 1,
+                "status": 1,
+                "started_at": 1,
+                "last_message_at": 1,
+                "transferred_to_human": 1,
+                "notified_owner": 1,
+                "unread_count": 1,
+                "score": {"$meta": "textScore"},
+                "matches": matches
+            }},
+        ]
+        if start or end:
+            # The text index matches whole transcripts; drop those whose hits are all outside the range
+            pipeline.append({"$match": {"matches.0": {"$exists": True}}})
+        pipeline += [
+            {"$addFields": {
+                "match_count": {"$size": "$matches"},
+                "matches": {"$slice": ["$matches", -MAX_MATCHES_PER_HIT]}
+            }},
+            {"$sort": {"score": -1, "last_message_at": -1}},
+            {"$skip": offset},
+            {"$limit": limit + 1},
+        ]
+        docs = await self.db.conversations.aggregate(pipeline).to_list(limit + 1)
+        
+        regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+        items = []
+        for doc in docs[:limit]:
+            doc["matches"] = [
+                {
+                    "message_id": m.get("id"),
+                    "sender": m.get("sender"),
+                    "timestamp": m.get("timestamp"),
+                    **build_snippet(m.get("content", ""), regex)
+                }
+                for m in reversed(doc.get("matches") or [])
+            ]
+            items.append(doc)
+        
+        next_offset = offset + limit if len(docs) > limit else None
+        return {"items": items, "next_offset": next_offset}
@@ -1,16 +1,24 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
+import asyncio
+import base64
+import hashlib
+import json
 import logging
+import time
+import uuid
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional
-import pytz
+from typing import List, Optional, Set
+from zoneinfo import ZoneInfo
 
 # Fuso horário de São Paulo/Brasil
-SAO_PAULO_TZ = pytz.timezone('America/Sao_Paulo')
+SAO_PAULO_TZ = ZoneInfo('America/Sao_Paulo')
 
 def get_brazil_time():
     """Retorna a hora atual no fuso horário de São Paulo"""
@@ -26,53 +34,218 @@ from models import (
     AdminUserCreate, AdminUserLogin, TokenResponse,
     Settings, SettingsUpdate,
     BotPrompt, BotPromptCreate, BotPromptUpdate,
-    Conversation, Message, WebhookPayload, SendMessageRequest,
-    EvolutionInstance, EvolutionInstanceCreate
+    Conversation, ConversationSummary, ConversationPage, SearchHit, SearchPage,
+    Message, MessagePage, WebhookPayload, SendMessageRequest, BulkSendRequest,
+    EvolutionInstance, EvolutionInstanceCreate, LoggingUpdate,
+    Tenant, TenantCreate, TenantUpdate,
+    parse_timestamp
 )
-from auth import hash_password, verify_password, create_access_token, get_current_user
-from bot_service import BotService
+from auth import (
+    hash_password_async, verify_password_async, create_access_token,
+    get_current_user, get_stream_user, create_stream_token,
+    login_throttle_retry_after, login_failed, login_succeeded, STREAM_TOKEN_EXPIRE_SECONDS
+)
+from bot_service import llm_backend
 from redis_service import RedisService
 from supabase_service import SupabaseService
 from evolution_service import EvolutionAPIService
+from contact_service import ContactDirectory
+from stats_service import StatsService
+from analytics_service import AnalyticsService, METRICS, GRANULARITIES, MAX_POINTS, fit_granularity
+from event_bus import EventBus
+from change_tracker import ChangeTracker, encode_cursor as encode_change_cursor, decode_cursor as decode_change_cursor
+from search_service import SearchService
+from lifecycle_service import ConversationSweeper
+from migrations import TimestampMigration
+from archive_service import ArchiveService
+from export_service import ExportService
+from health_service import HealthService
+from drain import DrainGate
+from tenant_service import TenantRegistry, TenantBusy, TenantContext
+from bulk_send_service import BulkSendService
+from records import MessageRecord, ConversationRecord, InboundMessage, decode_upsert
+import metrics
+from log_config import log_manager
+from fast_response import FastJSONResponse, CompressionMiddleware, trusted_document, trusted_documents
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: datetimes come back as aware UTC values
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# JSON records written by a background thread (see log_config.py)
+log_manager.configure()
 logger = logging.getLogger(__name__)
+# Hot path; can be sampled on its own with LOG_SAMPLING=server.webhook=0.1
+webhook_logger = logging.getLogger("server.webhook")
 
 redis_service: Optional[RedisService] = None
 supabase_service: Optional[SupabaseService] = None
 evolution_service: Optional[EvolutionAPIService] = None
+contact_directory = ContactDirectory(db, lambda: redis_service)
+stats_service = StatsService(db)
+analytics_service = AnalyticsService(db)
+event_bus = EventBus()
+change_tracker = ChangeTracker(db)
+search_service = SearchService(db)
+archive_service = ArchiveService(db, stats_service, change_tracker, event_bus)
+export_service = ExportService(db)
+timestamp_migration = TimestampMigration(db)
+conversation_sweeper = ConversationSweeper(
+    db, lambda: redis_service, stats_service, change_tracker, event_bus,
+    interval=int(os.environ.get('SWEEP_INTERVAL_SECONDS', '60')),
+    migration=timestamp_migration
+)
+tenant_registry = TenantRegistry(
+    db,
+    ttl=float(os.environ.get('TENANT_CACHE_SECONDS', '30')),
+    max_concurrent_webhooks=int(os.environ.get('TENANT_MAX_CONCURRENT_WEBHOOKS', '0')),
+    max_concurrent_llm=int(os.environ.get('TENANT_MAX_CONCURRENT_LLM', '0')),
+    llm_requests_per_minute=int(os.environ.get('TENANT_LLM_REQUESTS_PER_MINUTE', '0')),
+    queue_timeout=float(os.environ.get('TENANT_QUEUE_TIMEOUT_SECONDS', '10')),
+    event_bus=event_bus
+)
+bulk_send_service = BulkSendService(
+    db, stats_service, change_tracker, event_bus, lambda: supabase_service,
+    concurrency=int(os.environ.get('BULK_SEND_CONCURRENCY', '4')),
+    rate_per_minute=int(os.environ.get('BULK_SEND_RATE_PER_MINUTE', '30')),
+    max_recipients=int(os.environ.get('BULK_SEND_MAX_RECIPIENTS', '5000'))
+)
+health = HealthService(
+    cache_seconds=float(os.environ.get('READINESS_CACHE_SECONDS', '5')),
+    timeout=float(os.environ.get('READINESS_TIMEOUT_SECONDS', '2'))
+)
+# Budget for finishing in-flight work on shutdown (keep supervisor's stopwaitsecs above it)
+drain = DrainGate(timeout=float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', '25')))
+drain.on_drain(health.mark_draining)
+drain.on_drain(event_bus.close_streams)
+drain.on_drain(bulk_send_service.stop)
+# Each dependency gets this long at startup; a slow one is skipped, not waited on
+STARTUP_TIMEOUT_SECONDS = float(os.environ.get('STARTUP_TIMEOUT_SECONDS', '5'))
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize Redis on startup"""
+async def connect_supabase(settings: dict):
+    """(Re)connect Supabase and start its buffered message writer"""
+    global supabase_service
+    
+    if supabase_service:
+        await supabase_service.close()
+        supabase_service = None
+    
+    try:
+        service = SupabaseService(
+            settings["supabase_url"],
+            settings["supabase_key"]
+        )
+        # Off the event loop: the first connect also imports the Supabase SDK
+        await asyncio.to_thread(service.connect)
+        service.start_writer(spill=db.supabase_spill)
+        supabase_service = service
+    except Exception as e:
+        logger.error(f"Failed to connect to Supabase: {e}")
+
+async def ensure_conversation_indexes():
+    """Indexes backing the webhook lookups and the conversation list"""
+    await db.conversations.create_index("id")
+    await db.conversations.create_index([("phone_number", 1), ("status", 1)])
+    await db.conversations.create_index([("last_message_at", -1), ("id", -1)])
+    await db.conversations.create_index([("status", 1), ("last_message_at", -1), ("id", -1)])
+    await db.conversations.create_index(
+        [("notified_owner", 1), ("last_message_at", 1)],
+        partialFilterExpression={"notified_owner": True}
+    )
+
+async def startup_redis():
+    """Connect the local Redis used for conversation memory"""
     global redis_service
     
-    # Try to connect to local Redis
     redis_url = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+    service = RedisService(redis_url, None)
     try:
-        redis_service = RedisService(redis_url, None)
-        await redis_service.connect()
-        if redis_service.client:
-            logger.info("✓ Redis initialized successfully for conversation memory")
-        else:
-            logger.warning("Redis not available - conversation memory disabled")
-            redis_service = None
+        await service.connect()
+    except BaseException:
+        # Timed out mid-ping: don't leave a half-open client behind
+        await service.disconnect()
+        raise
+    if service.client:
+        redis_service = service
+        logger.info("✓ Redis initialized successfully for conversation memory")
+    else:
+        logger.warning("Redis not available - conversation memory disabled")
+
+async def startup_indexes():
+    await ensure_conversation_indexes()
+    await change_tracker.ensure_indexes()
+    await analytics_service.ensure_indexes()
+    await search_service.ensure_indexes()
+    await archive_service.ensure_indexes()
+    await tenant_registry.ensure_indexes()
+    await bulk_send_service.ensure_indexes()
+
+async def startup_supabase():
+    settings = await db.settings.find_one({}, {"_id": 0})
+    if settings and settings.get("supabase_url") and settings.get("supabase_key"):
+        await connect_supabase(settings)
+
+async def startup_step(name: str, step):
+    """Run one startup step under STARTUP_TIMEOUT_SECONDS; failures are logged, not raised"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(step, timeout=STARTUP_TIMEOUT_SECONDS)
+        logger.info("Startup step %s done in %.0f ms", name, (time.perf_counter() - start) * 1000)
+    except asyncio.TimeoutError:
+        logger.warning("Startup step %s timed out after %ss, continuing without it", name, STARTUP_TIMEOUT_SECONDS)
     except Exception as e:
-        logger.warning(f"Redis not available: {e}")
-        redis_service = None
+        logger.warning("Startup step %s failed: %s", name, e)
+
+@app.on_event("startup")
+async def startup_event():
+    """Connect Redis and Supabase and create indexes, all at the same time"""
+    if llm_backend() == "stub":
+        from loadtest.llm_stub import check_database
+        problems = await check_database(db)
+        if problems:
+            raise RuntimeError("Refusing to start with LLM_BACKEND=stub on a real database: " + "; ".join(problems))
+    
+    await asyncio.gather(
+        startup_step("redis", startup_redis()),
+        startup_step("indexes", startup_indexes()),
+        startup_step("supabase", startup_supabase()),
+    )
+    await event_bus.start(redis_service)
+    
+    if llm_backend() == "stub":
+        logger.warning("LLM_BACKEND=stub: bot replies are simulated, OpenAI is not called")
+    
+    conversation_sweeper.start()
+    drain.install_signal_hook()
+    health.started = True
+    run_in_background(resume_bulk_jobs(), name="bulk-resume")
+    run_in_background(migrate_timestamps(), name="timestamp-migration")
+
+async def migrate_timestamps():
+    """Convert timestamps older versions stored as strings; one worker runs it, the others wait"""
+    owner = str(uuid.uuid4())
+    while not await timestamp_migration.ready():
+        try:
+            results = await timestamp_migration.run_exclusive(owner)
+            if results is not None:
+                logger.info("Timestamp migration done: %s", results)
+                return
+        except Exception as e:
+            logger.error(f"Timestamp migration failed, retrying: {e}")
+        await asyncio.sleep(60)
+
+async def resume_bulk_jobs():
+    """Pick up bulk jobs interrupted by a restart (or orphaned by a dead worker)"""
+    for job_id in await bulk_send_service.resumable_jobs():
+        logger.info(f"Resuming bulk send job {job_id}")
+        run_in_background(bulk_send_service.run(job_id), name=f"bulk-{job_id}")
 
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(user_data: AdminUserCreate):
@@ -89,12 +262,12 @@ async def register(user_data: AdminUserCreate):
             detail="Username or email already registered"
         )
     
-    hashed_pwd = hash_password(user_data.password)
+    hashed_pwd = await hash_password_async(user_data.password)
     user_doc = {
         "username": user_data.username,
         "email": user_data.email,
         "hashed_password": hashed_pwd,
-        "created_at": get_brazil_time().isoformat()
+        "created_at": get_brazil_time()
     }
     
     await db.admin_users.insert_one(user_doc)
@@ -111,15 +284,27 @@ async def register(user_data: AdminUserCreate):
     }
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(credentials: AdminUserLogin):
+async def login(credentials: AdminUserLogin, request: Request):
+    ip = request.client.host if request.client else ""
+    retry_after = login_throttle_retry_after(credentials.username, ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
     user = await db.admin_users.find_one({"username": credentials.username}, {"_id": 0})
     
-    if not user or not verify_password(credentials.password, user["hashed_password"]):
+    if not user or not await verify_password_async(credentials.password, user["hashed_password"]):
+        login_failed(credentials.username, ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    login_succeeded(credentials.username, ip)
+    
     token = create_access_token({"sub": user["username"], "email": user["email"]})
     
     return {
@@ -131,10 +316,27 @@ async def login(credentials: AdminUserLogin):
         }
     }
 
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
 @api_router.get("/settings", response_model=Settings)
-async def get_settings(current_user: dict = Depends(get_current_user)):
+async def get_settings(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
     settings = await db.settings.find_one({}, {"_id": 0})
     
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+    etag = f'W/"{digest[:20]}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     if not settings:
         return Settings()
     
@@ -145,7 +347,7 @@ async def update_settings(
     settings_update: SettingsUpdate,
     current_user: dict = Depends(get_current_user)
 ):
-    global redis_service, supabase_service, evolution_service
+    global redis_service, evolution_service
     
     existing = await db.settings.find_one({}, {"_id": 0})
     
@@ -160,16 +362,17 @@ async def update_settings(
         update_data["transfer_keywords"] = settings_update.transfer_keywords
         logger.info(f"Salvando {len(settings_update.transfer_keywords)} palavras-chave")
     
-    update_data["updated_at"] = get_brazil_time().isoformat()
+    update_data["updated_at"] = get_brazil_time()
     
     if existing:
         await db.settings.update_one({}, {"$set": update_data})
         settings = await db.settings.find_one({}, {"_id": 0})
     else:
         settings_doc = Settings(**update_data).model_dump()
-        settings_doc["updated_at"] = get_brazil_time().isoformat()
+        settings_doc["updated_at"] = get_brazil_time()
         await db.settings.insert_one(settings_doc)
         settings = settings_doc
+    await tenant_registry.changed()
     
     if settings.get("redis_url"):
         try:
@@ -189,15 +392,10 @@ async def update_settings(
     else:
         logger.info("Redis not configured - system will work without cache")
     
+    await event_bus.start(redis_service)
+    
     if settings.get("supabase_url") and settings.get("supabase_key"):
-        try:
-            supabase_service = SupabaseService(
-                settings["supabase_url"],
-                settings["supabase_key"]
-            )
-            supabase_service.connect()
-        except Exception as e:
-            logger.error(f"Failed to connect to Supabase: {e}")
+        await connect_supabase(settings)
     
     if settings.get("evolution_api_url") and settings.get("evolution_api_key"):
         try:
@@ -214,7 +412,8 @@ async def update_settings(
 @api_router.get("/prompts", response_model=List[BotPrompt])
 async def get_prompts(current_user: dict = Depends(get_current_user)):
     prompts = await db.bot_prompts.find({}, {"_id": 0}).to_list(1000)
-    return [BotPrompt(**p) for p in prompts]
+    # Documents were validated on write; skip re-validating them on the way out
+    return FastJSONResponse(trusted_documents(BotPrompt, prompts))
 
 @api_router.post("/prompts", response_model=BotPrompt)
 async def create_prompt(
@@ -223,10 +422,9 @@ async def create_prompt(
 ):
     prompt = BotPrompt(**prompt_data.model_dump())
     prompt_doc = prompt.model_dump()
-    prompt_doc["created_at"] = prompt_doc["created_at"].isoformat()
-    prompt_doc["updated_at"] = prompt_doc["updated_at"].isoformat()
     
     await db.bot_prompts.insert_one(prompt_doc)
+    await tenant_registry.changed()
     return prompt
 
 @api_router.put("/prompts/{prompt_id}", response_model=BotPrompt)
@@ -241,9 +439,10 @@ async def update_prompt(
         raise HTTPException(status_code=404, detail="Prompt not found")
     
     update_data = prompt_update.model_dump(exclude_unset=True)
-    update_data["updated_at"] = get_brazil_time().isoformat()
+    update_data["updated_at"] = get_brazil_time()
     
     await db.bot_prompts.update_one({"id": prompt_id}, {"$set": update_data})
+    await tenant_registry.changed()
     
     updated = await db.bot_prompts.find_one({"id": prompt_id}, {"_id": 0})
     return BotPrompt(**updated)
@@ -257,6 +456,7 @@ async def delete_prompt(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Prompt not found")
+    await tenant_registry.changed()
     
     return {"message": "Prompt deleted successfully"}
 
@@ -273,17 +473,171 @@ async def get_active_prompt():
     
     return BotPrompt(**prompt)
 
+DELTA_PAGE_SIZE = 500
+
+def parse_since(since: str):
+    try:
+        return decode_change_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since cursor")
+
 @api_router.get("/conversations", response_model=List[Conversation])
 async def get_conversations(
+    request: Request,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Conversation list, or only what changed with ?since=<X-Change-Version>.
+    
+    Full lists carry an ETag, so an unchanged poll with If-None-Match gets a
+    bodiless 304. Deltas come in pages of up to 500 changed conversations
+    (all statuses, so ones leaving the `status` filter show up too), with
+    the deleted ids in X-Deleted-Conversations. Always continue from the
+    returned X-Change-Version; X-Has-More: true means call again right away.
+    """
+    if since is None:
+        cursor = change_tracker.settled_cursor()
+        version = await change_tracker.list_etag()
+        headers = {"X-Change-Version": encode_change_cursor(cursor)}
+        if version is not None:
+            headers["ETag"] = f'W/"{version}-{status or "all"}"'
+            if etag_matches(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+        query = {"status": status} if status else {}
+        conversations = await db.conversations.find(query, {"_id": 0}).sort("last_message_at", -1).to_list(1000)
+    else:
+        conversations, deleted, cursor, has_more = await change_tracker.changes(parse_since(since), DELTA_PAGE_SIZE)
+        headers = {
+            "X-Change-Version": encode_change_cursor(cursor),
+            "X-Has-More": "true" if has_more else "false",
+            "X-Deleted-Conversations": ",".join(deleted)
+        }
+    
+    # Documents were validated on write; skip re-validating them on the way out
+    return FastJSONResponse(trusted_documents(Conversation, conversations), headers=headers)
+
+def encode_cursor(last_message_at, conversation_id: str) -> str:
+    raw = json.dumps([parse_timestamp(last_message_at).isoformat(), conversation_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        last_message_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return parse_timestamp(last_message_at), conversation_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def summary_item(doc: dict) -> dict:
+    """Summary of a conversation loaded with only its last message"""
+    messages = doc.pop("messages", None) or []
+    if messages:
+        doc["last_message_preview"] = messages[-1].get("content", "")[:200]
+        doc["last_message_sender"] = messages[-1].get("sender")
+    return trusted_document(ConversationSummary, doc)
+
+@api_router.get("/conversations/summary", response_model=ConversationPage)
+async def get_conversation_summaries(
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: dict = Depends(get_current_user)
 ):
+    """
+    Conversation list without transcripts, newest first.
+    
+    Keyset-paginated on (last_message_at, id): pass the returned next_cursor to
+    get the following page. The first page also returns `since`; passing it
+    back returns only the conversations changed after it (all statuses, so the
+    client can drop ones that left its filter) and the deleted ids, with the
+    `since` to use next.
+    """
+    if since is not None:
+        docs, deleted, next_since, has_more = await change_tracker.changes(
+            parse_since(since), DELTA_PAGE_SIZE, projection={"_id": 0, "messages": {"$slice": -1}}
+        )
+        return FastJSONResponse({
+            "items": [summary_item(doc) for doc in docs],
+            "next_cursor": None,
+            "since": encode_change_cursor(next_since),
+            "deleted": deleted,
+            "has_more": has_more
+        })
+    
+    # Taken before the read, so nothing written meanwhile is behind it
+    page_since = None if cursor else encode_change_cursor(change_tracker.settled_cursor())
     query = {}
     if status:
         query["status"] = status
+    if cursor:
+        last_message_at, conversation_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"last_message_at": {"$lt": last_message_at}},
+            {"last_message_at": last_message_at, "id": {"$lt": conversation_id}}
+        ]
+    
+    # Only the last message is loaded, for the preview
+    docs = await db.conversations.find(
+        query,
+        {"_id": 0, "messages": {"$slice": -1}}
+    ).sort([("last_message_at", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    
+    items = [summary_item(doc) for doc in docs[:limit]]
     
-    conversations = await db.conversations.find(query, {"_id": 0}).sort("last_message_at", -1).to_list(1000)
-    return [Conversation(**c) for c in conversations]
+    next_cursor = None
+    if len(docs) > limit:
+        last = docs[limit - 1]
+        next_cursor = encode_cursor(last["last_message_at"], last["id"])
+    
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor, "since": page_since, "deleted": [], "has_more": False})
+
+@api_router.get("/conversations/search", response_model=SearchPage)
+async def search_conversations(
+    q: str = Query(..., min_length=2, max_length=200),
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    offset: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Full-text search over message content, best match first.
+    
+    Supports Portuguese stemming, accents, "quoted phrases" and -exclusions.
+    `start`/`end` restrict the matching messages to a period (naive values are
+    São Paulo time). Pass the returned next_offset to get the following page.
+    """
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    try:
+        page = await search_service.search(q, status=status, start=start, end=end, offset=offset, limit=limit)
+    except OperationFailure as e:
+        # e.g. the text index is still being built
+        logger.error(f"Search error: {e}")
+        raise HTTPException(status_code=503, detail="Search is not available right now")
+    
+    return FastJSONResponse({"items": trusted_documents(SearchHit, page["items"]), "next_offset": page["next_offset"]})
+
+@api_router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(
+    conversation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Reset the unread counter once an agent has seen the conversation"""
+    result = await db.conversations.update_one(
+        {"id": conversation_id},
+        {"$set": {"unread_count": 0, **change_tracker.stamp()}}
+    )
+    
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    await event_bus.publish("conversation_updated", conversation_id, unread_count=0)
+    return {"message": "Conversation marked as read"}
 
 @api_router.get("/conversations/{conversation_id}", response_model=Conversation)
 async def get_conversation(
@@ -295,26 +649,73 @@ async def get_conversation(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    return Conversation(**conversation)
+    return FastJSONResponse(trusted_document(Conversation, conversation))
 
-@api_router.post("/conversations/{conversation_id}/transfer")
-async def transfer_to_human(
+@api_router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
     conversation_id: str,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: dict = Depends(get_current_user)
 ):
-    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
-    
-    if not conversation:
+    """
+    A window of a conversation's messages, oldest first.
+    
+    Without cursors returns the newest page. `before=<timestamp>` pages back
+    through older messages; `after=<timestamp>` returns what arrived since.
+    Filtering and slicing happen inside Mongo, so only the window is sent back.
+    """
+    conditions = []
+    if before:
+        conditions.append({"$lt": ["$$m.timestamp", parse_timestamp(before, SAO_PAULO_TZ)]})
+    if after:
+        conditions.append({"$gt": ["$$m.timestamp", parse_timestamp(after, SAO_PAULO_TZ)]})
+    
+    messages = "$messages"
+    if conditions:
+        messages = {"$filter": {"input": "$messages", "as": "m", "cond": {"$and": conditions}}}
+    
+    # Asking for one extra message tells us whether there is more
+    oldest_first = bool(after) and not before
+    window = {"$slice": [messages, limit + 1 if oldest_first else -(limit + 1)]}
+    
+    result = await db.conversations.aggregate([
+        {"$match": {"id": conversation_id}},
+        {"$project": {"_id": 0, "messages": window}}
+    ]).to_list(1)
+    
+    if not result:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    await db.conversations.update_one(
+    page = result[0].get("messages") or []
+    has_more = len(page) > limit
+    if has_more:
+        page = page[:limit] if oldest_first else page[1:]
+    
+    return FastJSONResponse({"messages": trusted_documents(Message, page), "has_more": has_more})
+
+@api_router.post("/conversations/{conversation_id}/transfer")
+async def transfer_to_human(
+    conversation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    previous = await db.conversations.find_one_and_update(
         {"id": conversation_id},
         {"$set": {
             "transferred_to_human": True,
-            "status": "transferred"
-        }}
+            "status": "transferred",
+            **change_tracker.stamp()
+        }},
+        projection={"_id": 0, "status": 1}
     )
     
+    if not previous:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    await stats_service.status_changed(previous.get("status"), "transferred")
+    await event_bus.publish("status_changed", conversation_id, status="transferred")
+    
     return {"message": "Conversation transferred to human agent"}
 
 @api_router.post("/conversations/{conversation_id}/close")
@@ -324,15 +725,17 @@ async def close_conversation(
 ):
     global redis_service
     
-    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
+    conversation = await db.conversations.find_one_and_update(
+        {"id": conversation_id},
+        {"$set": {"status": "closed", **change_tracker.stamp()}},
+        projection={"_id": 0, "status": 1, "phone_number": 1}
+    )
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"status": "closed"}}
-    )
+    await stats_service.status_changed(conversation.get("status"), "closed")
+    await event_bus.publish("status_changed", conversation_id, status="closed")
     
     if redis_service:
         await redis_service.delete_conversation(conversation["phone_number"])
@@ -346,13 +749,18 @@ async def delete_conversation(
 ):
     global redis_service
     
-    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
+    # Delete conversation from database
+    conversation = await db.conversations.find_one_and_delete(
+        {"id": conversation_id},
+        projection={"_id": 0, "status": 1, "phone_number": 1}
+    )
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Delete conversation from database
-    await db.conversations.delete_one({"id": conversation_id})
+    await stats_service.conversation_removed(conversation.get("status"))
+    await change_tracker.record_deleted(conversation_id)
+    await event_bus.publish("conversation_deleted", conversation_id)
     
     # Clear from Redis if available
     if redis_service:
@@ -375,30 +783,132 @@ async def reset_notification_status(
     
     await db.conversations.update_one(
         {"id": conversation_id},
-        {"$set": {"notified_owner": False}}
+        {"$set": {"notified_owner": False, **change_tracker.stamp()}}
     )
     
+    await event_bus.publish("conversation_updated", conversation_id, notified_owner=False)
     logger.info(f"Notification status reset for conversation {conversation_id}")
     return {"message": "Notification status reset - new keywords will trigger notification"}
 
 
+# Fire-and-forget work started by requests (kept referenced until done)
+background_tasks: Set[asyncio.Task] = set()
+
+def run_in_background(coro, name: Optional[str] = None) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+def _background_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+async def notify_owner(conversation_id: str, user_name: str, phone_number: str, notification_phone: str, default_instance: dict):
+    """Send the owner a WhatsApp alert with the customer's last 3 messages"""
+    started = time.perf_counter()
+    clean_notification_phone = notification_phone.replace("+", "").replace("-", "").replace(" ", "").replace("(", "").replace(")", "")
+    
+    # Get last 3 messages from CLIENT only (not bot)
+    conversation_for_notification = await db.conversations.find_one(
+        {"id": conversation_id},
+        {"_id": 0, "messages": 1}
+    )
+    
+    client_messages = []
+    if conversation_for_notification and conversation_for_notification.get("messages"):
+        for msg in conversation_for_notification["messages"]:
+            if msg.get("sender") == "user":
+                client_messages.append(msg.get("content", ""))
+    
+    # Get last 3 client messages
+    last_3_client_msgs = client_messages[-3:] if len(client_messages) >= 3 else client_messages
+    
+    # Format messages
+    messages_text = ""
+    for msg in last_3_client_msgs:
+        messages_text += f'• "{msg}"\n'
+    
+    notification_message = f"""🔔 NOVO ATENDIMENTO SOLICITADO
+
+Cliente: {user_name}
+https://wa.me/+{phone_number}
+
+Últimas mensagens do cliente:
+{messages_text}"""
+    
+    instance_service = EvolutionAPIService(
+        default_instance["api_url"],
+        default_instance["api_key"]
+    )
+    instance_name = default_instance["instance_name"]
+    
+    webhook_logger.info("Sending notification to %s - conversation continues normally", clean_notification_phone)
+    await event_bus.publish("transfer_requested", conversation_id)
+    await instance_service.send_text_message(instance_name, clean_notification_phone, notification_message)
+    metrics.WEBHOOK_STAGE_SECONDS.labels("owner_notification").observe(time.perf_counter() - started)
+
+# Load tests set it to 0 to measure the backend itself
+REPLY_DELAY_SECONDS = float(os.environ.get('REPLY_DELAY_SECONDS', '3'))
+
 @api_router.post("/webhook/{webhook_id}")
-async def webhook_handler(webhook_id: str, payload: dict):
+async def webhook_handler(webhook_id: str, request: Request):
+    trace = metrics.WebhookTrace()
+    if drain.draining:
+        # Shutting down: don't start work this process may not get to finish
+        trace.outcome = "draining"
+        trace.finish()
+        return FastJSONResponse(
+            {"detail": "Server is shutting down"},
+            status_code=503,
+            headers={"Retry-After": "5"}
+        )
+    with drain.track(), metrics.WEBHOOK_IN_FLIGHT.track_inprogress():
+        try:
+            # Raw body straight into the few fields used (see records.py)
+            try:
+                inbound = decode_upsert(await request.body())
+            except ValueError as e:
+                trace.outcome = "invalid"
+                raise HTTPException(status_code=422, detail=f"Invalid webhook payload: {e}")
+            
+            # Which business this webhook belongs to (cached; see tenant_service.py)
+            tenant = await tenant_registry.resolve(webhook_id)
+            async with tenant.limits.webhook_slot():
+                return await handle_webhook(inbound, trace, tenant)
+        except TenantBusy:
+            webhook_logger.warning("Tenant %s busy: no webhook slot within %ss", tenant.name, tenant_registry.queue_timeout)
+            metrics.TENANT_REJECTIONS.labels(tenant.key, "busy").inc()
+            trace.outcome = "tenant_busy"
+            return FastJSONResponse(
+                {"detail": "Too many messages being handled for this account"},
+                status_code=429,
+                headers={"Retry-After": "5"}
+            )
+        finally:
+            trace.finish()
+
+async def handle_webhook(inbound: InboundMessage, trace: metrics.WebhookTrace, tenant: TenantContext):
+    """Incoming WhatsApp message: store it, generate the reply and send it back"""
+    received_at = time.monotonic()
     try:
-        logger.info(f"Received webhook: {payload}")
+        if not tenant.active:
+            trace.outcome = "ignored"
+            return {"status": "ignored", "reason": "Tenant disabled"}
         
-        data = payload.get("data", {})
-        message_data = data.get("message", {})
-        key = data.get("key", {})
+        webhook_logger.debug("Received webhook: %s", inbound)
         
-        if key.get("fromMe"):
+        if inbound.from_me:
+            trace.outcome = "ignored"
             return {"status": "ignored", "reason": "Message from bot"}
         
-        phone_number = key.get("remoteJid", "").split("@")[0]
-        push_name = payload.get("pushName", "Unknown")
-        message_content = message_data.get("conversation", "")
+        phone_number = inbound.phone_number
+        push_name = inbound.push_name
+        message_content = inbound.content
         
         if not message_content or not phone_number:
+            trace.outcome = "ignored"
             return {"status": "ignored", "reason": "No message content or phone"}
         
         # Detect and ignore bot/automated messages
@@ -423,100 +933,95 @@ async def webhook_handler(webhook_id: str, payload: dict):
         message_lower = message_content.lower()
         for indicator in bot_indicators:
             if indicator.lower() in message_lower:
-                logger.info(f"Ignoring bot/spam message: {message_content[:50]}...")
+                webhook_logger.info("Ignoring bot/spam message: %.50s...", message_content)
+                trace.outcome = "spam"
                 return {"status": "ignored", "reason": "bot_or_spam_detected"}
         
-        # Check if we already have a conversation with this number to get saved name
-        existing_conversation = await db.conversations.find_one(
-            {"phone_number": phone_number}, 
-            {"_id": 0, "user_name": 1}
-        )
-        
-        # Use saved name if available and not "Unknown", otherwise use pushName
-        if existing_conversation and existing_conversation.get("user_name") and existing_conversation.get("user_name") != "Unknown":
-            user_name = existing_conversation["user_name"]
-        else:
-            user_name = push_name
-            
-        # Update user_name if pushName is better (not Unknown and different)
-        if push_name and push_name != "Unknown" and push_name != user_name:
-            user_name = push_name
+        trace.lap("parse")
         
-        settings = await db.settings.find_one({}, {"_id": 0})
-        if not settings or not settings.get("openai_api_key"):
-            logger.error("OpenAI API key not configured")
+        # Settings, prompt and Evolution instance come from the tenant's cached config
+        settings = tenant.settings
+        default_instance = tenant.instance
+        if not settings.get("openai_api_key"):
+            webhook_logger.error("OpenAI API key not configured (tenant %s)", tenant.name)
+            trace.outcome = "not_configured"
             return {"status": "error", "message": "API key not configured"}
         
-        active_prompt = await db.bot_prompts.find_one({"is_active": True}, {"_id": 0})
-        system_prompt = active_prompt["system_prompt"] if active_prompt else "Você é um assistente virtual útil."
-        
-        # Get default Evolution instance early (needed for transfer notifications)
-        default_instance = await db.evolution_instances.find_one({"is_default": True}, {"_id": 0})
+        # Independent lookups, run together
+        lookups = await trace.gather(
+            "lookups",
+            # pushName wins when it is a real name, otherwise fall back to the saved one
+            user_name=contact_directory.resolve_name(phone_number, push_name),
+            conversation=db.conversations.find_one(
+                {"phone_number": phone_number, "tenant_id": tenant.tenant_id, "status": {"$ne": "closed"}},
+                {"_id": 0}
+            )
+        )
+        trace.lap("lookups")
+        user_name = lookups["user_name"]
+        conversation = lookups["conversation"]
         
-        bot_service = BotService(settings["openai_api_key"], system_prompt)
-        # Get custom transfer keywords from settings
-        custom_keywords = settings.get("transfer_keywords")
-        logger.info(f"Custom keywords loaded: {len(custom_keywords) if custom_keywords else 0} keywords")
-        should_transfer = bot_service.should_transfer_to_human(message_content, custom_keywords)
-        logger.info(f"Message: '{message_content}' | Should transfer: {should_transfer}")
+        bot_service = tenant.bot_service
+        should_transfer = tenant.transfer_matcher.matches(message_content)
+        webhook_logger.debug("Message: '%s' | Should transfer: %s", message_content, should_transfer)
+        if should_transfer:
+            metrics.TRANSFER_KEYWORD_HITS.inc()
+        trace.lap("message_checks")
         
-        conversation = await db.conversations.find_one({"phone_number": phone_number, "status": {"$ne": "closed"}}, {"_id": 0})
+        inbound_events = {"messages_in": 1}
+        if should_transfer:
+            inbound_events["transfer_keyword_hits"] = 1
         
         if not conversation:
-            conversation = Conversation(
+            inbound_events["conversations_new"] = 1
+            conversation = ConversationRecord(
                 user_id=phone_number,
                 phone_number=phone_number,
                 user_name=user_name,
-                messages=[]
-            ).model_dump()
-            conversation["started_at"] = conversation["started_at"].isoformat()
-            conversation["last_message_at"] = conversation["last_message_at"].isoformat()
+                tenant_id=tenant.tenant_id
+            ).to_doc()
+            conversation.update(change_tracker.stamp())
             await db.conversations.insert_one(conversation)
+            await stats_service.conversation_created(conversation["status"])
         else:
             # Update user_name in conversation if we have a better name now
             if user_name != "Unknown" and conversation.get("user_name") == "Unknown":
                 await db.conversations.update_one(
                     {"id": conversation["id"]},
-                    {"$set": {"user_name": user_name}}
+                    {"$set": {"user_name": user_name, **change_tracker.stamp()}}
                 )
                 conversation["user_name"] = user_name
-            
-            # Auto-reset notified_owner after 2 hours of inactivity
-            # This allows new notifications when the customer comes back later
-            if conversation.get("notified_owner") and conversation.get("last_message_at"):
-                try:
-                    last_msg_time = conversation["last_message_at"]
-                    if isinstance(last_msg_time, str):
-                        last_msg_time = datetime.fromisoformat(last_msg_time.replace('Z', '+00:00'))
-                    if last_msg_time.tzinfo is None:
-                        last_msg_time = SAO_PAULO_TZ.localize(last_msg_time)
-                    
-                    hours_since_last_msg = (get_brazil_time() - last_msg_time).total_seconds() / 3600
-                    
-                    if hours_since_last_msg >= 2:
-                        logger.info(f"Auto-resetting notification status for {phone_number} (inactive for {hours_since_last_msg:.1f}h)")
-                        await db.conversations.update_one(
-                            {"id": conversation["id"]},
-                            {"$set": {"notified_owner": False}}
-                        )
-                        conversation["notified_owner"] = False
-                except Exception as e:
-                    logger.warning(f"Error checking last message time: {e}")
-        
-        user_message = Message(
+        trace.lap("conversation_load")
+        
+        user_message = MessageRecord(
             conversation_id=conversation["id"],
             sender="user",
             content=message_content
-        ).model_dump()
-        user_message["timestamp"] = user_message["timestamp"].isoformat()
+        ).to_doc()
         
         await db.conversations.update_one(
             {"id": conversation["id"]},
             {
                 "$push": {"messages": user_message},
-                "$set": {"last_message_at": get_brazil_time().isoformat()}
+                "$set": {
+                    "last_message_at": get_brazil_time(),
+                    **change_tracker.stamp()
+                },
+                "$inc": {"unread_count": 1}
             }
         )
+        side_effects = {
+            "stats": stats_service.message_added(),
+            "analytics": analytics_service.record(inbound_events),
+            "event": event_bus.publish(
+                "message", conversation["id"],
+                sender="user", new_conversation="conversations_new" in inbound_events
+            ),
+        }
+        if supabase_service:
+            side_effects["supabase"] = supabase_service.save_message(conversation["id"], "user", message_content)
+        await trace.gather("user_message_side_effects", **side_effects)
+        trace.lap("save_user_message")
         
         # If keyword detected, send notification but continue conversation normally
         # Check if we should notify (either notify_every_keyword is True, or conversation not yet notified)
@@ -528,54 +1033,25 @@ async def webhook_handler(webhook_id: str, payload: dict):
             if not notify_every_keyword:
                 await db.conversations.update_one(
                     {"id": conversation["id"]},
-                    {"$set": {"notified_owner": True}}
+                    {"$set": {"notified_owner": True, **change_tracker.stamp()}}
                 )
             
-            # Send notification to owner's WhatsApp
+            # Sent in the background: the customer's reply doesn't wait for it
             notification_phone = settings.get("notification_whatsapp")
-            logger.info(f"Notification check: notify_every_keyword={notify_every_keyword}, should_notify={should_notify}, notification_phone={notification_phone}, has_instance={default_instance is not None}")
+            webhook_logger.info(
+                "Notification check: notify_every_keyword=%s, should_notify=%s, notification_phone=%s, has_instance=%s",
+                notify_every_keyword, should_notify, notification_phone, default_instance is not None
+            )
             if notification_phone and default_instance:
-                clean_notification_phone = notification_phone.replace("+", "").replace("-", "").replace(" ", "").replace("(", "").replace(")", "")
-                
-                # Get last 3 messages from CLIENT only (not bot)
-                conversation_for_notification = await db.conversations.find_one(
-                    {"id": conversation["id"]},
-                    {"_id": 0, "messages": 1}
-                )
-                
-                client_messages = []
-                if conversation_for_notification and conversation_for_notification.get("messages"):
-                    for msg in conversation_for_notification["messages"]:
-                        if msg.get("sender") == "user":
-                            client_messages.append(msg.get("content", ""))
-                
-                # Get last 3 client messages
-                last_3_client_msgs = client_messages[-3:] if len(client_messages) >= 3 else client_messages
-                
-                # Format messages
-                messages_text = ""
-                for msg in last_3_client_msgs:
-                    messages_text += f'• "{msg}"\n'
-                
-                notification_message = f"""🔔 NOVO ATENDIMENTO SOLICITADO
-
-Cliente: {user_name}
-https://wa.me/+{phone_number}
-
-Últimas mensagens do cliente:
-{messages_text}"""
-                
-                instance_service = EvolutionAPIService(
-                    default_instance["api_url"],
-                    default_instance["api_key"]
+                run_in_background(
+                    notify_owner(conversation["id"], user_name, phone_number, notification_phone, default_instance),
+                    name=f"notify_owner:{conversation['id']}"
                 )
-                instance_name = default_instance["instance_name"]
-                
-                logger.info(f"Sending notification to {clean_notification_phone} - conversation continues normally")
-                await instance_service.send_text_message(instance_name, clean_notification_phone, notification_message)
+            trace.lap("notification_flag")
         
         # Handle manual transfer request (when user explicitly asks for human)
         if conversation.get("transferred_to_human"):
+            trace.outcome = "human_handling"
             return {"status": "transferred_to_human"}
         
         # Get conversation history for context
@@ -583,8 +1059,9 @@ https://wa.me/+{phone_number}
             {"id": conversation["id"]},
             {"_id": 0}
         )
+        trace.lap("history_load")
         
-        session_id = f"session_{phone_number}"
+        session_id = f"{tenant.session_prefix}{phone_number}"
         conversation_history = conversation_with_history.get("messages", [])
         
         # Check for menu options or name request BEFORE calling AI
@@ -596,40 +1073,66 @@ https://wa.me/+{phone_number}
         # If it's a menu with options, respond with the best option number
         if menu_result["is_menu"] and menu_result["best_option"]:
             ai_response = str(menu_result["best_option"])
-            logger.info(f"Menu detected! Responding with option: {ai_response}")
+            trace.outcome = "menu"
+            webhook_logger.info("Menu detected! Responding with option: %s", ai_response)
         
         # If asking for name, respond with "Eduardo"
         elif is_name_request:
             ai_response = "Eduardo"
-            logger.info("Name request detected! Responding with: Eduardo")
+            trace.outcome = "name"
+            webhook_logger.info("Name request detected! Responding with: Eduardo")
+        
+        # Tenant out of LLM budget: keep the message for a human, don't reply
+        elif not tenant.limits.take_llm_budget():
+            webhook_logger.warning("Tenant %s over its LLM budget; message stored without a reply", tenant.name)
+            metrics.TENANT_REJECTIONS.labels(tenant.key, "llm_budget").inc()
+            trace.outcome = "llm_budget"
+            return {"status": "llm_budget_exceeded"}
         
         # Otherwise, generate normal AI response
         else:
-            ai_response = await bot_service.generate_response(
-                session_id, 
-                message_content,
-                conversation_history,
-                customer_name=user_name
-            )
+            async with tenant.limits.llm_slot():
+                ai_response = await bot_service.generate_response(
+                    session_id, 
+                    message_content,
+                    conversation_history,
+                    customer_name=user_name
+                )
+            trace.outcome = "ai_reply"
+        trace.lap("reply_generation")
         
-        bot_message = Message(
+        bot_message = MessageRecord(
             conversation_id=conversation["id"],
             sender="bot",
             content=ai_response
-        ).model_dump()
-        bot_message["timestamp"] = bot_message["timestamp"].isoformat()
+        ).to_doc()
         
         await db.conversations.update_one(
             {"id": conversation["id"]},
             {
                 "$push": {"messages": bot_message},
-                "$set": {"last_message_at": get_brazil_time().isoformat()}
+                "$set": {
+                    "last_message_at": get_brazil_time(),
+                    **change_tracker.stamp()
+                }
             }
         )
+        side_effects = {
+            "stats": stats_service.message_added(),
+            "analytics": analytics_service.record({
+                "messages_out": 1,
+                "bot_response_ms": (time.monotonic() - received_at) * 1000
+            }),
+            "event": event_bus.publish("message", conversation["id"], sender="bot"),
+        }
+        if supabase_service:
+            side_effects["supabase"] = supabase_service.save_message(conversation["id"], "bot", ai_response)
+        await trace.gather("bot_message_side_effects", **side_effects)
+        trace.lap("save_bot_message")
         
         # Add 3 second delay before sending response (more natural conversation flow)
-        import asyncio
-        await asyncio.sleep(3)
+        await asyncio.sleep(REPLY_DELAY_SECONDS)
+        trace.lap("reply_delay")
         
         # Send response back via Evolution API
         if default_instance:
@@ -639,17 +1142,18 @@ https://wa.me/+{phone_number}
             )
             instance_name = default_instance["instance_name"]
             
-            logger.info(f"Attempting to send message to {phone_number} via instance {instance_name}")
-            logger.info(f"Message content: {ai_response[:100]}...")
+            webhook_logger.debug("Sending reply to %s via instance %s: %.100s...", phone_number, instance_name, ai_response)
             
             success = await instance_service.send_text_message(instance_name, phone_number, ai_response)
             
             if success:
-                logger.info(f"✓ Message sent successfully to {phone_number}")
+                webhook_logger.info("✓ Message sent successfully to %s", phone_number)
             else:
-                logger.error(f"✗ Failed to send message to {phone_number}")
+                webhook_logger.error("✗ Failed to send message to %s", phone_number)
         else:
-            logger.warning("No default Evolution instance configured - message not sent to WhatsApp")
+            webhook_logger.warning("No default Evolution instance configured - message not sent to WhatsApp")
+        trace.lap("whatsapp_send")
+        webhook_logger.debug("Webhook timings (ms): %s", trace.timings)
         
         return {
             "status": "success",
@@ -658,74 +1162,184 @@ https://wa.me/+{phone_number}
         }
         
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
+        webhook_logger.exception("Webhook error: %s", e)
+        trace.outcome = "error"
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/dashboard/stats")
-async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    active_conversations = await db.conversations.count_documents({"status": "active"})
-    transferred = await db.conversations.count_documents({"status": "transferred"})
+@api_router.get("/archive")
+async def list_archived_conversations(
+    phone_number: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    """Archived conversations (index entries only), most recent first"""
+    entries = await archive_service.find(phone_number=phone_number, conversation_id=conversation_id, limit=limit)
+    return FastJSONResponse(entries)
+
+@api_router.get("/archive/{conversation_id}", response_model=Conversation)
+async def get_archived_conversation(
+    conversation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Read an archived conversation without bringing it back"""
+    try:
+        conversation = await archive_service.load(conversation_id)
+    except OSError as e:
+        logger.error(f"Archive read error ({conversation_id}): {e}")
+        raise HTTPException(status_code=500, detail="Archive segment unavailable")
     
-    today = get_brazil_time().replace(hour=0, minute=0, second=0, microsecond=0)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Archived conversation not found")
     
-    all_conversations = await db.conversations.find({}, {"_id": 0, "messages": 1}).to_list(10000)
-    messages_today = 0
-    for conv in all_conversations:
-        for msg in conv.get("messages", []):
-            try:
-                if isinstance(msg["timestamp"], str):
-                    msg_time = datetime.fromisoformat(msg["timestamp"])
-                    if msg_time.tzinfo is None:
-                        msg_time = msg_time.replace(tzinfo=timezone.utc)
-                else:
-                    msg_time = msg["timestamp"]
-                    if msg_time.tzinfo is None:
-                        msg_time = msg_time.replace(tzinfo=timezone.utc)
-                
-                if msg_time >= today:
-                    messages_today += 1
-            except:
-                pass
-    
-    total_users = await db.conversations.count_documents({})
+    return FastJSONResponse(trusted_document(Conversation, conversation))
+
+@api_router.post("/archive/{conversation_id}/restore")
+async def restore_archived_conversation(
+    conversation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Move an archived conversation back into the conversation list"""
+    try:
+        conversation = await archive_service.restore(conversation_id)
+    except OSError as e:
+        logger.error(f"Archive read error ({conversation_id}): {e}")
+        raise HTTPException(status_code=500, detail="Archive segment unavailable")
     
-    return {
-        "active_conversations": active_conversations,
-        "transferred_conversations": transferred,
-        "messages_today": messages_today,
-        "total_users": total_users
-    }
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Archived conversation not found")
+    
+    logger.info(f"Conversation {conversation_id} restored from archive")
+    return {"message": "Conversation restored", "id": conversation_id}
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+@api_router.get("/export")
+async def export_conversations(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    scope: str = Query("conversations", pattern="^(conversations|messages)$"),
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    compress: bool = Query(False, alias="gzip"),
+    batch_size: int = Query(200, ge=1, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Download every matching conversation (or message) as NDJSON or CSV.
+    
+    Streamed straight from a Mongo cursor, so there is no size limit and memory
+    use doesn't grow with the export. `start`/`end` select conversations active
+    in the period (naive values are São Paulo time); in messages scope only the
+    messages inside it are exported. ?gzip=true returns a .gz file.
+    """
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    filename = f"{scope}-{get_brazil_time().strftime('%Y%m%d-%H%M%S')}.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    logger.info(f"Export of {scope} as {format} requested by {current_user.get('email')}")
+    return StreamingResponse(
+        export_service.stream(
+            format=format, scope=scope, status=status, start=start, end=end,
+            compress=compress, batch_size=batch_size
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+@api_router.get("/dashboard/stats")
+async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
+    # Counters are maintained on write by StatsService (backfill with `python cli.py rebuild-stats`)
+    return FastJSONResponse(await stats_service.get_dashboard())
+
+@api_router.get("/analytics/series")
+async def get_analytics_series(
+    metric: str,
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Time series for a metric, served from the pre-aggregated buckets.
+    
+    A range that needs more than MAX_POINTS buckets is served one granularity
+    coarser (minute -> hour -> day), with `coarsened` set in the response.
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Use one of: {', '.join(sorted(METRICS))}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown granularity. Use one of: {', '.join(GRANULARITIES)}")
+    
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=SAO_PAULO_TZ)
+    default_span = {"minute": timedelta(hours=2), "hour": timedelta(days=1), "day": timedelta(days=30)}
+    start = start or end - default_span[granularity]
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=SAO_PAULO_TZ)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    # Coarsen instead of cutting the range short; the response says which granularity was used
+    used = fit_granularity(start, end, granularity)
+    if used is None:
+        raise HTTPException(status_code=400, detail=f"Range too long: more than {MAX_POINTS} daily points")
+    points = await analytics_service.series(metric, used, start, end)
+    return FastJSONResponse({
+        "metric": metric,
+        "granularity": used,
+        "requested_granularity": granularity,
+        "coarsened": used != granularity,
+        "points": points
+    })
 
 @api_router.post("/send-message")
 async def send_message(
     request: SendMessageRequest,
     current_user: dict = Depends(get_current_user)
 ):
-    conversation = await db.conversations.find_one(
-        {"phone_number": request.phone_number},
-        {"_id": 0}
-    )
+    # The same phone can talk to several tenants: never pick a conversation across them
+    if request.conversation_id:
+        query = {"id": request.conversation_id, "phone_number": request.phone_number}
+    else:
+        tenant_id = None if request.tenant_id in (None, "default") else request.tenant_id
+        query = {"phone_number": request.phone_number, "tenant_id": tenant_id}
+    conversation = await db.conversations.find_one(query, {"_id": 0}, sort=[("last_message_at", -1)])
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    bot_message = Message(
+    bot_message = MessageRecord(
         conversation_id=conversation["id"],
         sender="agent",
         content=request.message
-    ).model_dump()
-    bot_message["timestamp"] = bot_message["timestamp"].isoformat()
+    ).to_doc()
     
     await db.conversations.update_one(
         {"id": conversation["id"]},
         {
             "$push": {"messages": bot_message},
-            "$set": {"last_message_at": get_brazil_time().isoformat()}
+            "$set": {
+                "last_message_at": get_brazil_time(),
+                "unread_count": 0,
+                **change_tracker.stamp()
+            }
         }
     )
+    await stats_service.message_added()
+    await event_bus.publish("message", conversation["id"], sender="agent")
     
-    # Send via Evolution API
-    default_instance = await db.evolution_instances.find_one({"is_default": True}, {"_id": 0})
+    if supabase_service:
+        await supabase_service.save_message(conversation["id"], "agent", request.message)
+    
+    # Send via Evolution API, through the instance of the conversation's tenant
+    default_instance = (await tenant_registry.get(conversation.get("tenant_id"))).instance
     
     if default_instance:
         instance_service = EvolutionAPIService(
@@ -747,6 +1361,74 @@ async def send_message(
         logger.warning("No default Evolution instance configured")
         return {"status": "saved", "sent": False, "message": "Evolution API not configured"}
 
+@api_router.post("/events/token")
+async def get_stream_token(current_user: dict = Depends(get_current_user)):
+    """Token for /events/stream: only valid there, and only for a minute"""
+    return {"token": create_stream_token(current_user), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@api_router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    current_user: dict = Depends(get_stream_user)
+):
+    """
+    Server-sent events with conversation changes, replacing list polling.
+    
+    Authenticated with ?token= because EventSource cannot send headers; the
+    token comes from POST /events/token (the login token is refused here, so
+    it never shows up in access logs). It is only checked when connecting.
+    """
+    queue = event_bus.subscribe()
+    
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    # Server draining; EventSource reconnects after `retry`
+                    break
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            event_bus.unsubscribe(queue)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/logging")
+async def get_logging(current_user: dict = Depends(get_current_user)):
+    """Log levels, sampling rates and queue state of the worker answering"""
+    return log_manager.status()
+
+@api_router.put("/logging")
+async def update_logging(
+    update: LoggingUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Change log levels and sampling without a restart.
+    
+    Applies to the worker that handles the request; with several workers, use
+    LOG_LEVELS/LOG_SAMPLING in .env for a lasting change.
+    """
+    for name, rate in update.sampling.items():
+        if not 0 <= rate <= 1:
+            raise HTTPException(status_code=400, detail=f"Sampling rate for {name} must be between 0 and 1")
+    for name, level in update.levels.items():
+        log_manager.set_level(name, level)
+    if update.sampling:
+        log_manager.set_sampling(update.sampling)
+    logger.warning(f"Logging changed by {current_user.get('email')}: {update.model_dump()}")
+    return log_manager.status()
+
 @api_router.get("/evolution/test")
 async def test_evolution_connection(current_user: dict = Depends(get_current_user)):
     """Test Evolution API connection"""
@@ -772,7 +1454,7 @@ async def test_evolution_connection(current_user: dict = Depends(get_current_use
 async def get_evolution_instances(current_user: dict = Depends(get_current_user)):
     """Get all Evolution API instances"""
     instances = await db.evolution_instances.find({}, {"_id": 0}).to_list(1000)
-    return [EvolutionInstance(**inst) for inst in instances]
+    return FastJSONResponse(trusted_documents(EvolutionInstance, instances))
 
 @api_router.post("/evolution-instances", response_model=EvolutionInstance)
 async def create_evolution_instance(
@@ -789,9 +1471,9 @@ async def create_evolution_instance(
         is_default=is_default
     )
     instance_doc = instance.model_dump()
-    instance_doc["created_at"] = instance_doc["created_at"].isoformat()
     
     await db.evolution_instances.insert_one(instance_doc)
+    await tenant_registry.changed()
     return instance
 
 @api_router.delete("/evolution-instances/{instance_id}")
@@ -804,6 +1486,7 @@ async def delete_evolution_instance(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Instance not found")
+    await tenant_registry.changed()
     
     return {"message": "Instance deleted successfully"}
 
@@ -824,6 +1507,7 @@ async def set_default_instance(
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Instance not found")
+    await tenant_registry.changed()
     
     return {"message": "Default instance set successfully"}
 
@@ -848,6 +1532,161 @@ async def test_instance_connection(
         "connection": status
     }
 
+# ============ TENANTS ============
+@api_router.get("/tenants", response_model=List[Tenant])
+async def get_tenants(current_user: dict = Depends(get_current_user)):
+    tenants = await db.tenants.find({}, {"_id": 0}).sort("name", 1).to_list(1000)
+    return FastJSONResponse(trusted_documents(Tenant, tenants))
+
+async def check_tenant_references(data: dict):
+    if data.get("prompt_id") and not await db.bot_prompts.find_one({"id": data["prompt_id"]}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Prompt not found")
+    if data.get("instance_id") and not await db.evolution_instances.find_one({"id": data["instance_id"]}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Instance not found")
+
+@api_router.post("/tenants", response_model=Tenant)
+async def create_tenant(
+    tenant_data: TenantCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a tenant; point its Evolution webhook at /api/webhook/{webhook_id}"""
+    await check_tenant_references(tenant_data.model_dump())
+    tenant = Tenant(**tenant_data.model_dump())
+    try:
+        await db.tenants.insert_one(tenant.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="webhook_id already in use")
+    await tenant_registry.changed()
+    return tenant
+
+@api_router.put("/tenants/{tenant_id}", response_model=Tenant)
+async def update_tenant(
+    tenant_id: str,
+    tenant_update: TenantUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    update_data = tenant_update.model_dump(exclude_unset=True)
+    await check_tenant_references(update_data)
+    update_data["updated_at"] = get_brazil_time()
+    try:
+        result = await db.tenants.update_one({"id": tenant_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="webhook_id already in use")
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    await tenant_registry.changed()
+    
+    updated = await db.tenants.find_one({"id": tenant_id}, {"_id": 0})
+    return Tenant(**updated)
+
+@api_router.delete("/tenants/{tenant_id}")
+async def delete_tenant(
+    tenant_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a tenant; its webhook id then falls back to the default configuration"""
+    result = await db.tenants.delete_one({"id": tenant_id})
+    
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    await tenant_registry.changed()
+    
+    return {"message": "Tenant deleted successfully"}
+
+@api_router.get("/tenants/{tenant_id}/usage")
+async def get_tenant_usage(
+    tenant_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Limits and live counters of the worker answering ("default" = no tenant)"""
+    tenant_id = None if tenant_id == "default" else tenant_id
+    if tenant_id and not await db.tenants.find_one({"id": tenant_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    return {"tenant_id": tenant_id, "usage": tenant_registry.usage(tenant_id)}
+
+@api_router.post("/bulk-send", status_code=202)
+async def create_bulk_send(
+    request: BulkSendRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Send one message to many customers.
+    
+    Recipients are `phone_numbers` or, without them, every conversation
+    matching `status`/`start`/`end` (same filters as the export). Sending
+    happens in the background at `rate_per_minute` (BULK_SEND_RATE_PER_MINUTE
+    by default), and each message joins its conversation once it was sent.
+    Follow the returned job at /bulk-send/{id}.
+    """
+    if request.phone_numbers is None and not (request.status or request.start or request.end):
+        raise HTTPException(status_code=400, detail="Give phone_numbers or a filter (status, start, end)")
+    if request.start and request.end and request.start >= request.end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    tenant_id = None if request.tenant_id in (None, "default") else request.tenant_id
+    if tenant_id and not await db.tenants.find_one({"id": tenant_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    instance = (await tenant_registry.get(tenant_id)).instance
+    if not instance:
+        raise HTTPException(status_code=400, detail="No Evolution instance configured")
+    
+    try:
+        job = await bulk_send_service.create_job(
+            request.message, instance,
+            phone_numbers=request.phone_numbers, status=request.status,
+            start=request.start, end=request.end, tenant_id=tenant_id,
+            rate_per_minute=request.rate_per_minute, created_by=current_user.get("email")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if job["status"] == "queued":
+        run_in_background(bulk_send_service.run(job["id"]), name=f"bulk-{job['id']}")
+    logger.info(f"Bulk send {job['id']} to {job['total']} recipients requested by {current_user.get('email')}")
+    return FastJSONResponse(job, status_code=202)
+
+@api_router.get("/bulk-send")
+async def list_bulk_sends(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    return FastJSONResponse(await bulk_send_service.list_jobs(limit))
+
+@api_router.get("/bulk-send/{job_id}")
+async def get_bulk_send(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Job progress: counters of pending, sent, failed and skipped recipients"""
+    job = await bulk_send_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk send not found")
+    return FastJSONResponse(job)
+
+@api_router.get("/bulk-send/{job_id}/recipients")
+async def get_bulk_send_recipients(
+    job_id: str,
+    status: Optional[str] = Query(None, pattern="^(pending|sent|failed|skipped|cancelled)$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-recipient status, optionally only one status (e.g. the failed ones)"""
+    if not await bulk_send_service.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Bulk send not found")
+    return FastJSONResponse(await bulk_send_service.recipients(job_id, status=status, skip=skip, limit=limit))
+
+@api_router.post("/bulk-send/{job_id}/cancel")
+async def cancel_bulk_send(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stop sending; messages already sent stay sent"""
+    job = await bulk_send_service.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk send not found")
+    return FastJSONResponse(job)
+
 app.include_router(api_router)
 
 app.add_middleware(
@@ -856,10 +1695,63 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Change-Version", "X-Has-More", "X-Deleted-Conversations"],
 )
 
+# gzip/brotli for large JSON bodies (streaming responses are left alone)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get('COMPRESS_MIN_SIZE', '1024')))
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (not under /api, so nginx doesn't expose it)"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+async def mongo_probe():
+    await db.command("ping")
+
+async def redis_probe():
+    if not redis_service or not redis_service.client:
+        return "disabled"
+    return await redis_service.client.ping()
+
+async def supabase_probe():
+    if not supabase_service:
+        return "disabled"
+    return supabase_service.client is not None
+
+health.add_check("mongo", mongo_probe)
+health.add_check("redis", redis_probe, required=False)
+health.add_check("supabase", supabase_probe, required=False)
+
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """Liveness: the process answers; no dependency is checked"""
+    return health.liveness()
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """Readiness: 503 until startup finished and while MongoDB is unreachable"""
+    result = await health.readiness()
+    return FastJSONResponse(result, status_code=200 if result["ready"] else 503)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    """Drain (see drain.py), then close the clients"""
+    drain.begin()
+    if not await drain.wait_idle():
+        logger.warning("Drain deadline reached with %d webhooks still running", drain.in_flight)
+    # Owner notifications started by those webhooks
+    left = await drain.wait_tasks(background_tasks)
+    if left:
+        logger.warning("Drain deadline reached with %d background tasks still running", left)
+    await conversation_sweeper.stop(timeout=drain.remaining())
+    await event_bus.stop()
+    await bulk_send_service.close()
+    if supabase_service:
+        # Always give buffered messages a moment, even past the deadline
+        await supabase_service.close(timeout=max(drain.remaining(), 2.0))
     client.close()
     if redis_service:
         await redis_service.disconnect()
+    metrics.mark_process_dead()
+    log_manager.stop()
@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional, Dict, Any
+import logging
+
+from models import get_brazil_time, parse_timestamp, SAO_PAULO_TZ
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_STATUSES = ["active", "transferred", "closed"]
+
+class StatsService:
+    """
+    Pre-aggregated dashboard counters kept in the `stats` collection.
+    
+    - `{"_id": "conversations", "total": n, "active": n, "transferred": n, "closed": n}`
+    - `{"_id": "messages:YYYY-MM-DD", "count": n}` (São Paulo calendar day)
+    
+    Counters are updated with `$inc` on every write, so reading them is O(1).
+    `rebuild()` recomputes everything from the conversations collection.
+    """
+    CONVERSATIONS_ID = "conversations"
+    
+    def __init__(self, db):
+        self.db = db
+    
+    @staticmethod
+    def day_id(when: Optional[datetime] = None) -> str:
+        when = when or get_brazil_time()
+        if when.tzinfo is not None:
+            when = when.astimezone(SAO_PAULO_TZ)
+        return f"messages:{when.strftime('%Y-%m-%d')}"
+    
+    async def _inc(self, doc_id: str, inc: Dict[str, int]):
+        try:
+            await self.db.stats.update_one({"_id": doc_id}, {"$inc": inc}, upsert=True)
+        except Exception as e:
+            logger.error(f"Stats update error ({doc_id}): {e}")
+    
+    async def conversation_created(self, status: str = "active"):
+        await self._inc(self.CONVERSATIONS_ID, {"total": 1, status: 1})
+    
+    async def conversation_removed(self, status: Optional[str], count: int = 1):
+        if count:
+            await self._inc(self.CONVERSATIONS_ID, {"total": -count, status or "active": -count})
+    
+    async def status_changed(self, old_status: Optional[str], new_status: str, count: int = 1):
+        old_status = old_status or "active"
+        if old_status != new_status:
+            await self._inc(self.CONVERSATIONS_ID, {old_status: -count, new_status: count})
+    
+    async def message_added(self, count: int = 1):
+        await self._inc(self.day_id(), {"count": count})
+    
+    async def get_dashboard(self) -> Dict[str, int]:
+        """Read the counters needed by /dashboard/stats in one round trip"""
+        today_id = self.day_id()
+        docs = {
+            doc["_id"]: doc
+            async for doc in self.db.stats.find({"_id": {"$in": [self.CONVERSATIONS_ID, today_id]}})
+        }
+        conversations = docs.get(self.CONVERSATIONS_ID, {})
+        return {
+            "active_conversations": conversations.get("active", 0),
+            "transferred_conversations": conversations.get("transferred", 0),
+            "messages_today": docs.get(today_id, {}).get("count", 0),
+            "total_users": conversations.get("total", 0)
+        }
+    
+    async def rebuild(self, batch_size: int = 500) -> Dict[str, Any]:
+        """
+        Recompute all counters from the conversations collection.
+        
+        Streams only statuses and message timestamps through a cursor, so memory
+        stays flat. Writes that land while it runs may be counted twice or
+        missed, so run it during a quiet period.
+        """
+        conversations = {"total": 0, **{s: 0 for s in CONVERSATION_STATUSES}}
+        days: Dict[str, int] = {}
+        
+        cursor = self.db.conversations.find(
+            {}, {"_id": 0, "status": 1, "messages.timestamp": 1}
+        ).batch_size(batch_size)
+        async for conv in cursor:
+            status = conv.get("status") or "active"
+            conversations[status] = conversations.get(status, 0) + 1
+            conversations["total"] += 1
+            for msg in conv.get("messages", []):
+                try:
+                    msg_time = parse_timestamp(msg.get("timestamp"))
+                except ValueError:
+                    continue
+                if msg_time:
+                    day = self.day_id(msg_time)
+                    days[day] = days.get(day, 0) + 1
+        
+        await self.db.stats.delete_many({"_id": {"$regex": "^messages:"}})
+        await self.db.stats.replace_one({"_id": self.CONVERSATIONS_ID}, conversations, upsert=True)
+        if days:
+            await self.db.stats.insert_many([{"_id": k, "count": v} for k, v in days.items()])
+        
+        logger.info(f"Stats rebuilt: {conversations['total']} conversations, {len(days)} days of messages")
+        return {"conversations": conversations, "days": len(days)}
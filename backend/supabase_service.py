@@ -1,32 +1,258 @@
-from supabase import create_client, Client
-from typing import Optional, Dict, Any, List
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Tuple
+import asyncio
 import logging
+import uuid
+
+import metrics
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
+# Queued by close() to wake the flush loop; never written
+_WAKE = object()
+
+class SupabaseMessageWriter:
+    """
+    Buffered writer that mirrors messages into the Supabase `messages` table.
+    
+    Rows are queued in memory (bounded by `max_pending`) and bulk-inserted by a
+    single background task, either when `batch_size` rows are waiting or every
+    `flush_interval` seconds. Only one insert runs at a time, so when Supabase is
+    slow the queue fills up and producers wait (up to `enqueue_timeout`) instead
+    of piling up more requests.
+    
+    Rows that still don't fit, or whose batch failed every retry, go to the
+    `spill` collection in Mongo when one is given, and are replayed from there
+    once Supabase takes writes again (every `replay_interval` seconds at most).
+    Only rows that couldn't be spilled either are lost; every outcome is
+    counted in `whatsapp_supabase_rows`.
+    """
+    def __init__(
+        self,
+        service: "SupabaseService",
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_pending: int = 5000,
+        enqueue_timeout: float = 1.0,
+        max_retries: int = 3,
+        spill=None,
+        replay_interval: float = 30.0
+    ):
+        self.service = service
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.spill = spill
+        self.replay_interval = replay_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: List[Dict[str, Any]] = []
+        self._closing = False
+        # Replay leftovers from an earlier run on the first idle moment
+        self._next_replay = 0.0
+    
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def put(self, row: Dict[str, Any]) -> bool:
+        """Queue a row, waiting up to enqueue_timeout when the buffer is full"""
+        if self._closing:
+            return await self._spill([row])
+        try:
+            await asyncio.wait_for(self.queue.put(row), timeout=self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Supabase writer buffer full, spilling message")
+            return await self._spill([row])
+    
+    async def put_many(self, rows: List[Dict[str, Any]]) -> bool:
+        """Queue several rows without waiting; what doesn't fit is spilled right away"""
+        if self._closing:
+            return await self._spill(rows)
+        for i, row in enumerate(rows):
+            try:
+                self.queue.put_nowait(row)
+            except asyncio.QueueFull:
+                logger.warning(f"Supabase writer buffer full, spilling {len(rows) - i} messages")
+                return await self._spill(rows[i:])
+        return True
+    
+    async def _spill(self, rows: List[Dict[str, Any]]) -> bool:
+        """Park rows in Mongo for a later replay; count them as dropped when that fails too"""
+        if self.spill is not None:
+            now = datetime.now(timezone.utc)
+            try:
+                await self.spill.insert_many([{"row": row, "spilled_at": now} for row in rows])
+                metrics.SUPABASE_ROWS.labels("spilled").inc(len(rows))
+                return True
+            except Exception as e:
+                logger.error(f"Supabase spill failed: {e}")
+        self.dropped += len(rows)
+        metrics.SUPABASE_ROWS.labels("dropped").inc(len(rows))
+        logger.error(f"Supabase writer dropped {len(rows)} messages ({self.dropped} dropped so far)")
+        return False
+    
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for the first row (up to flush_interval), then drain up to batch_size"""
+        batch = []
+        try:
+            first = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return batch
+        if first is _WAKE:
+            return batch
+        batch.append(first)
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                row = self.queue.get_nowait()
+                if row is not _WAKE:
+                    batch.append(row)
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._closing:
+                break
+            try:
+                row = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if row is not _WAKE:
+                batch.append(row)
+        return batch
+    
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """Bulk insert a batch, retrying with backoff before spilling it"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self.service.insert_messages(batch)
+                metrics.SUPABASE_ROWS.labels("written").inc(len(batch))
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Supabase batch insert failed, spilling {len(batch)} messages: {e}")
+                    await self._spill(batch)
+                    return
+                logger.warning(f"Supabase batch insert failed (attempt {attempt}/{self.max_retries}): {e}")
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+    
+    async def _replay(self):
+        """
+        Move spilled rows back to Supabase while it takes them.
+        
+        Rows are claimed for a while before the insert, so several workers
+        sharing the collection don't write the same rows twice.
+        """
+        loop = asyncio.get_running_loop()
+        if self.spill is None or loop.time() < self._next_replay:
+            return
+        self._next_replay = loop.time() + self.replay_interval
+        try:
+            while not self._closing and self.queue.empty():
+                now = datetime.now(timezone.utc)
+                claimable = {"$or": [{"claimed_until": {"$exists": False}}, {"claimed_until": {"$lt": now}}]}
+                docs = await self.spill.find(claimable, {"_id": 1}).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+                if not docs:
+                    return
+                token = str(uuid.uuid4())
+                await self.spill.update_many(
+                    {"_id": {"$in": [doc["_id"] for doc in docs]}, **claimable},
+                    {"$set": {"claimed_by": token, "claimed_until": now + timedelta(seconds=self.replay_interval * 2)}}
+                )
+                claimed = await self.spill.find({"claimed_by": token}, {"_id": 1, "row": 1}).to_list(self.batch_size)
+                if not claimed:
+                    continue
+                await self.service.insert_messages([doc["row"] for doc in claimed])
+                await self.spill.delete_many({"_id": {"$in": [doc["_id"] for doc in claimed]}})
+                metrics.SUPABASE_ROWS.labels("replayed").inc(len(claimed))
+                logger.info(f"Replayed {len(claimed)} spilled messages to Supabase")
+        except Exception as e:
+            # Claims expire on their own; try again after replay_interval
+            logger.warning(f"Supabase spill replay failed: {e}")
+    
+    async def _run(self):
+        while not (self._closing and self.queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                self._in_flight = batch
+                await self._write(batch)
+                self._in_flight = []
+            else:
+                await self._replay()
+    
+    async def close(self, timeout: float = 10.0):
+        """Stop accepting rows and flush whatever is still buffered"""
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            # Don't sit out flush_interval waiting for a row that won't come
+            self.queue.put_nowait(_WAKE)
+        except asyncio.QueueFull:
+            pass  # the loop is busy, not waiting
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Supabase writer flush timed out, spilling {self.queue.qsize()} messages")
+            self._task.cancel()
+            # The batch being written may or may not have landed; keep it rather than lose it
+            leftover = list(self._in_flight)
+            while not self.queue.empty():
+                row = self.queue.get_nowait()
+                if row is not _WAKE:
+                    leftover.append(row)
+            if leftover:
+                await self._spill(leftover)
+        self._task = None
+
 class SupabaseService:
     def __init__(self, url: str, key: str):
         self.url = url
         self.key = key
-        self.client: Optional[Client] = None
+        self.client: Optional["Client"] = None
+        self.writer: Optional[SupabaseMessageWriter] = None
     
     def connect(self):
-        """Connect to Supabase"""
+        """Connect to Supabase (blocking: the first call also imports the SDK)"""
         try:
+            # The SDK pulls in postgrest/gotrue/storage; only pay for it when Supabase is configured
+            from supabase import create_client
             self.client = create_client(self.url, self.key)
             logger.info("Supabase connected successfully")
         except Exception as e:
             logger.error(f"Supabase connection error: {e}")
             raise
     
+    def start_writer(self, **kwargs):
+        """Start the buffered message writer used by save_message (see SupabaseMessageWriter for the options)"""
+        if self.writer is None:
+            self.writer = SupabaseMessageWriter(self, **kwargs)
+        self.writer.start()
+    
+    async def close(self, timeout: float = 10.0):
+        """Flush buffered messages and stop the writer"""
+        if self.writer:
+            await self.writer.close(timeout=timeout)
+            self.writer = None
+    
     async def get_or_create_user(self, phone_number: str, name: str) -> Dict[str, Any]:
         """Get or create WhatsApp user in Supabase"""
         if not self.client:
             raise Exception("Supabase not connected")
         
         try:
-            # Try to get user
-            response = self.client.table('whatsapp_users').select('*').eq('phone_number', phone_number).execute()
+            # The supabase client is synchronous, so run it off the event loop
+            response = await asyncio.to_thread(
+                self.client.table('whatsapp_users').select('*').eq('phone_number', phone_number).execute
+            )
             
             if response.data:
                 return response.data[0]
@@ -36,24 +262,54 @@ class SupabaseService:
                 'phone_number': phone_number,
                 'name': name
             }
-            response = self.client.table('whatsapp_users').insert(new_user).execute()
+            response = await asyncio.to_thread(self.client.table('whatsapp_users').insert(new_user).execute)
             return response.data[0] if response.data else new_user
         except Exception as e:
             logger.error(f"Supabase get_or_create_user error: {e}")
             # Fallback to local storage
             return {'phone_number': phone_number, 'name': name}
     
+    async def insert_messages(self, rows: List[Dict[str, Any]]):
+        """Bulk insert message rows (raises on failure)"""
+        if not self.client:
+            raise Exception("Supabase not connected")
+        await asyncio.to_thread(self.client.table('messages').insert(rows).execute)
+    
+    async def save_messages(self, messages: List[Tuple[str, str, str]]):
+        """Save (conversation_id, sender, content) messages to Supabase in one go"""
+        if not self.client or not messages:
+            return
+        
+        rows = [
+            {'conversation_id': conversation_id, 'sender': sender, 'content': content}
+            for conversation_id, sender, content in messages
+        ]
+        
+        if self.writer:
+            await self.writer.put_many(rows)
+            return
+        
+        try:
+            await self.insert_messages(rows)
+        except Exception as e:
+            logger.error(f"Supabase save_messages error: {e}")
+    
     async def save_message(self, conversation_id: str, sender: str, content: str):
-        """Save message to Supabase"""
+        """Save message to Supabase (buffered when the writer is running)"""
         if not self.client:
             return
         
+        message = {
+            'conversation_id': conversation_id,
+            'sender': sender,
+            'content': content
+        }
+        
+        if self.writer:
+            await self.writer.put(message)
+            return
+        
         try:
-            message = {
-                'conversation_id': conversation_id,
-                'sender': sender,
-                'content': content
-            }
-            self.client.table('messages').insert(message).execute()
+            await self.insert_messages([message])
         except Exception as e:
-            logger.error(f"Supabase save_message error: {e}")
\ No newline at end of file
+            logger.error(f"Supabase save_message error: {e}")
@@ -0,0 +1,260 @@
+"""
+Tenants: one deployment serving several businesses, routed by webhook id.
+
+Each tenant points Evolution at `/api/webhook/{its webhook_id}` and can pick
+its own prompt and Evolution instance and override the reply settings
+(OpenAI key, transfer keywords, notification number). Anything not set
+falls back to the global configuration, which is also what webhook ids
+without a tenant get, so single-business installs keep working unchanged.
+
+Resolved configurations (prompt text, BotService, compiled keyword matcher)
+are cached for `ttl` seconds and dropped by `invalidate()` whenever the admin
+API changes settings, prompts, instances or tenants; other workers pick the
+change up when their cache expires.
+
+Each tenant also gets its own limits, so a busy one can't starve the rest:
+a cap on webhooks handled at once (callers wait up to `queue_timeout`, then
+get TenantBusy), a cap on concurrent LLM calls and an optional budget of LLM
+calls per minute.
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import logging
+import time
+
+from bot_service import BotService, keyword_matcher, DEFAULT_TRANSFER_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEY = "default"
+DEFAULT_PROMPT = "Você é um assistente virtual útil."
+# Tenant fields that override the global settings document when set
+SETTING_OVERRIDES = (
+    "openai_api_key", "notification_whatsapp", "transfer_keywords", "notify_every_keyword", "auto_close_after_hours"
+)
+
+class TenantBusy(Exception):
+    """No webhook slot freed up within the queue timeout"""
+
+class TokenBucket:
+    """`rate_per_minute` tokens per minute, bursting up to one minute's worth"""
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+    
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class TenantLimits:
+    """Concurrency caps and LLM budget of one tenant (0 = unlimited)"""
+    def __init__(self, max_webhooks: int, max_llm: int, llm_per_minute: int, queue_timeout: float):
+        self.config = (max_webhooks, max_llm, llm_per_minute)
+        self.queue_timeout = queue_timeout
+        self._webhooks = asyncio.Semaphore(max_webhooks) if max_webhooks else None
+        self._llm = asyncio.Semaphore(max_llm) if max_llm else None
+        self._budget = TokenBucket(llm_per_minute) if llm_per_minute else None
+        self.webhooks_in_flight = 0
+        self.llm_in_flight = 0
+        self.rejected = 0
+        self.over_budget = 0
+    
+    @asynccontextmanager
+    async def webhook_slot(self):
+        if self._webhooks is not None:
+            try:
+                await asyncio.wait_for(self._webhooks.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise TenantBusy()
+        self.webhooks_in_flight += 1
+        try:
+            yield
+        finally:
+            self.webhooks_in_flight -= 1
+            if self._webhooks is not None:
+                self._webhooks.release()
+    
+    @asynccontextmanager
+    async def llm_slot(self):
+        if self._llm is not None:
+            await self._llm.acquire()
+        self.llm_in_flight += 1
+        try:
+            yield
+        finally:
+            self.llm_in_flight -= 1
+            if self._llm is not None:
+                self._llm.release()
+    
+    def take_llm_budget(self) -> bool:
+        if self._budget is None or self._budget.take():
+            return True
+        self.over_budget += 1
+        return False
+    
+    def usage(self) -> Dict[str, Any]:
+        max_webhooks, max_llm, llm_per_minute = self.config
+        return {
+            "max_concurrent_webhooks": max_webhooks,
+            "max_concurrent_llm": max_llm,
+            "llm_requests_per_minute": llm_per_minute,
+            "webhooks_in_flight": self.webhooks_in_flight,
+            "llm_in_flight": self.llm_in_flight,
+            "llm_budget_left": int(self._budget.tokens) if self._budget else None,
+            "rejected_busy": self.rejected,
+            "rejected_llm_budget": self.over_budget,
+        }
+
+class TenantContext:
+    """Everything the webhook needs for one tenant, built once per cache period"""
+    def __init__(self, key: str, tenant: Optional[dict], settings: dict, system_prompt: str,
+                 instance: Optional[dict], limits: TenantLimits):
+        self.key = key
+        self.tenant_id = tenant["id"] if tenant else None
+        self.name = tenant["name"] if tenant else DEFAULT_KEY
+        self.active = tenant.get("is_active", True) if tenant else True
+        self.settings = settings
+        self.system_prompt = system_prompt
+        self.instance = instance
+        self.limits = limits
+        self.bot_service = BotService(settings.get("openai_api_key") or "", system_prompt)
+        self.transfer_matcher = keyword_matcher(tuple(settings.get("transfer_keywords") or DEFAULT_TRANSFER_KEYWORDS))
+        # Tenants don't share LLM sessions for the same phone number
+        self.session_prefix = f"session_{self.tenant_id}_" if self.tenant_id else "session_"
+
+class TenantRegistry:
+    CHANGED_EVENT = "tenant_config_changed"
+    
+    def __init__(
+        self,
+        db,
+        ttl: float = 30.0,
+        max_routes: int = 10000,
+        max_concurrent_webhooks: int = 0,
+        max_concurrent_llm: int = 0,
+        llm_requests_per_minute: int = 0,
+        queue_timeout: float = 10.0,
+        event_bus=None
+    ):
+        self.db = db
+        self.event_bus = event_bus
+        self.ttl = ttl
+        self.max_routes = max_routes
+        self.defaults = (max_concurrent_webhooks, max_concurrent_llm, llm_requests_per_minute)
+        self.queue_timeout = queue_timeout
+        # webhook_id -> (tenant id or None, expires_at); unknown ids are cached too
+        self._routes: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._contexts: Dict[str, Tuple[TenantContext, float]] = {}
+        # Kept across reloads: in-flight holders must release the semaphore they took
+        self._limits: Dict[str, TenantLimits] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._generation = 0
+        if event_bus is not None:
+            # Changes made through another worker; after a pub/sub outage
+            # (resync) some of those may have been missed
+            event_bus.add_listener(self.CHANGED_EVENT, lambda _: self.invalidate())
+            event_bus.add_listener("resync", lambda _: self.invalidate())
+    
+    async def ensure_indexes(self):
+        await self.db.tenants.create_index("id", unique=True)
+        await self.db.tenants.create_index("webhook_id", unique=True)
+    
+    async def changed(self):
+        """After an admin change: invalidate the caches of every worker"""
+        self.invalidate()
+        if self.event_bus is not None:
+            await self.event_bus.notify(self.CHANGED_EVENT)
+    
+    def invalidate(self):
+        """Forget this worker's cached routes and configurations"""
+        self._routes.clear()
+        self._contexts.clear()
+        # Loads already running must not cache what they read before the change
+        self._generation += 1
+    
+    async def resolve(self, webhook_id: str) -> TenantContext:
+        """Context for a webhook id (the default tenant if no tenant owns it)"""
+        route = self._routes.get(webhook_id)
+        if route is None or route[1] < time.monotonic():
+            tenant = await self.db.tenants.find_one({"webhook_id": webhook_id}, {"_id": 0, "id": 1})
+            route = (tenant["id"] if tenant else None, time.monotonic() + self.ttl)
+            self._routes[webhook_id] = route
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+        self._routes.move_to_end(webhook_id)
+        return await self.get(route[0])
+    
+    async def get(self, tenant_id: Optional[str]) -> TenantContext:
+        """Context by tenant id (None = default); concurrent misses share one load"""
+        key = tenant_id or DEFAULT_KEY
+        cached = self._contexts.get(key)
+        if cached and cached[1] >= time.monotonic():
+            return cached[0]
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, tenant_id))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _load(self, key: str, tenant_id: Optional[str]) -> TenantContext:
+        generation = self._generation
+        settings, tenant = await asyncio.gather(
+            self.db.settings.find_one({}, {"_id": 0}),
+            self.db.tenants.find_one({"id": tenant_id}, {"_id": 0}) if tenant_id else _none()
+        )
+        settings = dict(settings or {})
+        
+        prompt_query = {"is_active": True}
+        instance_query = {"is_default": True}
+        if tenant:
+            for field in SETTING_OVERRIDES:
+                if tenant.get(field) is not None:
+                    settings[field] = tenant[field]
+            if tenant.get("prompt_id"):
+                prompt_query = {"id": tenant["prompt_id"]}
+            if tenant.get("instance_id"):
+                instance_query = {"id": tenant["instance_id"]}
+        
+        prompt, instance = await asyncio.gather(
+            self.db.bot_prompts.find_one(prompt_query, {"_id": 0, "system_prompt": 1}),
+            self.db.evolution_instances.find_one(instance_query, {"_id": 0})
+        )
+        
+        limits_config = tuple(
+            tenant[field] if tenant and tenant.get(field) is not None else default
+            for field, default in zip(
+                ("max_concurrent_webhooks", "max_concurrent_llm", "llm_requests_per_minute"), self.defaults
+            )
+        )
+        limits = self._limits.get(key)
+        if limits is None or limits.config != limits_config:
+            limits = TenantLimits(*limits_config, queue_timeout=self.queue_timeout)
+            self._limits[key] = limits
+        
+        context = TenantContext(
+            key, tenant, settings,
+            prompt["system_prompt"] if prompt else DEFAULT_PROMPT,
+            instance, limits
+        )
+        if generation == self._generation:
+            self._contexts[key] = (context, time.monotonic() + self.ttl)
+        return context
+    
+    def usage(self, tenant_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Live limits/counters of this worker for a tenant (None until it got traffic)"""
+        limits = self._limits.get(tenant_id or DEFAULT_KEY)
+        return limits.usage() if limits else None
+
+async def _none():
+    return None
@@ -7,34 +7,174 @@ import { Badge } from '../components/ui/badge';
 import { ScrollArea } from '../components/ui/scroll-area';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs';
 import { toast } from 'sonner';
-import { MessageSquare, User, Bot, ArrowRight, X, Send, Bell, BellOff } from 'lucide-react';
+import { MessageSquare, User, Bot, ArrowRight, X, Send, Bell, BellOff, Search } from 'lucide-react';
 import { Textarea } from '../components/ui/textarea';
+import { Input } from '../components/ui/input';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const PAGE_SIZE = 100;
+const MESSAGE_PAGE_SIZE = 50;
+const SEARCH_PAGE_SIZE = 20;
+// Live events are folded in at most this often (one delta request per window)
+const CHANGE_THROTTLE_MS = 2000;
+
+const byLastMessage = (a, b) => new Date(b.last_message_at) - new Date(a.last_message_at);
+
+// Fold changed summaries into the loaded list: update or insert the ones that
+// still match the filter, drop the rest and the deleted ones, newest first
+const mergeSummaries = (list, changed, deleted, filter, hasOlderPages) => {
+  const loadedIds = new Set(list.map((c) => c.id));
+  const changedIds = new Set(changed.map((c) => c.id));
+  const oldest = list.length ? new Date(list[list.length - 1].last_message_at) : null;
+  const merged = list.filter((c) => !deleted.has(c.id) && !changedIds.has(c.id));
+  changed.forEach((c) => {
+    if (deleted.has(c.id)) return;
+    if (filter !== 'all' && c.status !== filter) return;
+    // Older than the loaded pages: it shows up when more are loaded
+    if (!loadedIds.has(c.id) && hasOlderPages && oldest && new Date(c.last_message_at) < oldest) return;
+    merged.push(c);
+  });
+  return merged.sort(byLastMessage);
+};
+
+// Wrap the [start, end) ranges returned by the search endpoint in <mark>
+const renderHighlighted = (snippet, highlights) => {
+  const parts = [];
+  let position = 0;
+  highlights.forEach(([start, end], index) => {
+    if (start > position) parts.push(snippet.slice(position, start));
+    parts.push(
+      <mark key={index} className="bg-amber-500/30 text-foreground rounded-sm">
+        {snippet.slice(start, end)}
+      </mark>
+    );
+    position = end;
+  });
+  parts.push(snippet.slice(position));
+  return parts;
+};
 
 const Conversations = () => {
-  const { getAuthHeader } = useAuth();
+  const { getAuthHeader, token } = useAuth();
   const [conversations, setConversations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedConversation, setSelectedConversation] = useState(null);
+  const [messages, setMessages] = useState([]);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState('all');
   const [message, setMessage] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchNextOffset, setSearchNextOffset] = useState(null);
+  const [searching, setSearching] = useState(false);
   const messagesEndRef = useRef(null);
   const selectedConversationRef = useRef(null);
+  const messagesRef = useRef([]);
+  const lastMessageIdRef = useRef(null);
+  const scrollViewportRef = useRef(null);
+  const fetchConversationsRef = useRef(null);
+  const applyChangesRef = useRef(null);
+  // Change cursor from the last full load; deltas continue from it
+  const sinceRef = useRef(null);
 
   // Keep track of selected conversation ID to prevent losing focus
   const selectedIdRef = useRef(null);
 
   useEffect(() => {
     fetchConversations();
-    const interval = setInterval(fetchConversations, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
+    if (searchResults !== null) runSearch();
   }, [filter]);
 
-  // Scroll to bottom when messages change
+  // Live updates: the server pushes conversation events instead of us polling
+  useEffect(() => {
+    if (!token) return undefined;
+    let source = null;
+    let closed = false;
+    let reconnectTimer = null;
+    let refreshTimer = null;
+    let changesTimer = null;
+    let lastChangesAt = 0;
+    let connectedOnce = false;
+
+    // Full reload, only when the server says we lost events (resync)
+    const scheduleRefresh = () => {
+      if (refreshTimer) return;
+      refreshTimer = setTimeout(() => {
+        refreshTimer = null;
+        fetchConversationsRef.current();
+      }, 300);
+    };
+
+    // Everything else: fetch just what changed, at most once per CHANGE_THROTTLE_MS
+    const scheduleChanges = () => {
+      if (changesTimer) return;
+      const wait = Math.max(300, lastChangesAt + CHANGE_THROTTLE_MS - Date.now());
+      changesTimer = setTimeout(() => {
+        changesTimer = null;
+        lastChangesAt = Date.now();
+        applyChangesRef.current();
+      }, wait);
+    };
+
+    const handleEvent = (message) => {
+      let event = {};
+      try {
+        event = JSON.parse(message.data);
+      } catch (error) {
+        return;
+      }
+      if (event.type === 'resync') scheduleRefresh();
+      else scheduleChanges();
+    };
+
+    // The stream URL carries a short-lived token of its own (never the login token),
+    // so each (re)connection asks for a fresh one
+    const connect = async () => {
+      try {
+        const response = await axios.post(`${API}/events/token`, {}, getAuthHeader());
+        if (closed) return;
+        source = new EventSource(`${API}/events/stream?token=${encodeURIComponent(response.data.token)}`);
+      } catch (error) {
+        console.error('Error opening event stream:', error);
+        if (!closed) reconnectTimer = setTimeout(connect, 5000);
+        return;
+      }
+      source.onmessage = handleEvent;
+      source.onopen = () => {
+        // After a reconnect we may have missed events; the delta catches up
+        if (connectedOnce) scheduleChanges();
+        connectedOnce = true;
+      };
+      source.onerror = () => {
+        // The browser retries by itself, but with the old (by now expired) token
+        if (source.readyState === EventSource.CLOSED && !closed) {
+          reconnectTimer = setTimeout(connect, 3000);
+        }
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      if (source) source.close();
+      clearTimeout(reconnectTimer);
+      clearTimeout(refreshTimer);
+      clearTimeout(changesTimer);
+    };
+  }, [token]);
+
+  // Scroll to bottom only when a newer message arrives (not when older pages are prepended)
   useEffect(() => {
-    scrollToBottom();
-  }, [selectedConversation?.messages]);
+    messagesRef.current = messages;
+    const last = messages[messages.length - 1];
+    if (last && last.id !== lastMessageIdRef.current) {
+      lastMessageIdRef.current = last.id;
+      scrollToBottom();
+    }
+  }, [messages]);
 
   const scrollToBottom = () => {
     if (messagesEndRef.current) {
@@ -42,27 +182,29 @@ const Conversations = () => {
     }
   };
 
+  const summaryUrl = (cursor) => {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (filter !== 'all') params.set('status', filter);
+    if (cursor) params.set('cursor', cursor);
+    return `${API}/conversations/summary?${params.toString()}`;
+  };
+
   const fetchConversations = async () => {
     try {
-      const url = filter === 'all' ? `${API}/conversations` : `${API}/conversations?status=${filter}`;
-      const response = await axios.get(url, getAuthHeader());
-      
-      // Sort conversations by last message time (newest first)
-      const sortedConversations = response.data.sort((a, b) => {
-        const timeA = new Date(a.last_message_at || a.started_at);
-        const timeB = new Date(b.last_message_at || b.started_at);
-        return timeB - timeA;
-      });
-      
-      setConversations(sortedConversations);
+      // List comes without transcripts, already sorted by last message (newest first)
+      const response = await axios.get(summaryUrl(), getAuthHeader());
+      setConversations(response.data.items);
+      setNextCursor(response.data.next_cursor);
+      sinceRef.current = response.data.since;
       
       // Update selected conversation without losing focus
       // Only update if we have a selected conversation
       if (selectedIdRef.current) {
-        const updated = sortedConversations.find(c => c.id === selectedIdRef.current);
+        const updated = response.data.items.find(c => c.id === selectedIdRef.current);
         if (updated) {
           setSelectedConversation(updated);
         }
+        fetchNewMessages(selectedIdRef.current);
       }
     } catch (error) {
       console.error('Error fetching conversations:', error);
@@ -71,9 +213,178 @@ const Conversations = () => {
     }
   };
 
+  fetchConversationsRef.current = fetchConversations;
+
+  // Apply what changed since the last load; messages are refetched only when
+  // the open conversation is among the changes
+  const applyChanges = async () => {
+    if (!sinceRef.current) return fetchConversations();
+    try {
+      let since = sinceRef.current;
+      let changed = [];
+      let deleted = [];
+      let hasMore = true;
+      while (hasMore) {
+        const response = await axios.get(
+          `${API}/conversations/summary?${new URLSearchParams({ since }).toString()}`,
+          getAuthHeader()
+        );
+        changed = [...changed.filter((c) => !response.data.items.some((i) => i.id === c.id)), ...response.data.items];
+        deleted = [...deleted, ...response.data.deleted];
+        since = response.data.since;
+        hasMore = response.data.has_more;
+      }
+      sinceRef.current = since;
+      if (changed.length === 0 && deleted.length === 0) return;
+
+      const gone = new Set(deleted);
+      setConversations((prev) => mergeSummaries(prev, changed, gone, filter, Boolean(nextCursor)));
+      const selectedId = selectedIdRef.current;
+      const updated = selectedId && changed.find((c) => c.id === selectedId);
+      if (updated) {
+        setSelectedConversation((prev) => ({ ...prev, ...updated }));
+        fetchNewMessages(selectedId);
+      }
+    } catch (error) {
+      console.error('Error fetching conversation changes:', error);
+    }
+  };
+
+  applyChangesRef.current = applyChanges;
+
+  const fetchMoreConversations = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(summaryUrl(nextCursor), getAuthHeader());
+      setConversations((prev) => [
+        ...prev,
+        ...response.data.items.filter((item) => !prev.some((c) => c.id === item.id))
+      ]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching more conversations:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const runSearch = async (offset = 0) => {
+    const query = searchQuery.trim();
+    if (query.length < 2) {
+      clearSearch();
+      return;
+    }
+    setSearching(true);
+    try {
+      const params = new URLSearchParams({ q: query, limit: SEARCH_PAGE_SIZE, offset });
+      if (filter !== 'all') params.set('status', filter);
+      const response = await axios.get(`${API}/conversations/search?${params.toString()}`, getAuthHeader());
+      setSearchResults((prev) => (offset > 0 && prev ? [...prev, ...response.data.items] : response.data.items));
+      setSearchNextOffset(response.data.next_offset);
+    } catch (error) {
+      toast.error('Erro ao buscar mensagens');
+      console.error('Error searching conversations:', error);
+    } finally {
+      setSearching(false);
+    }
+  };
+
+  const handleSearchSubmit = (e) => {
+    e.preventDefault();
+    runSearch();
+  };
+
+  const clearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+    setSearchNextOffset(null);
+  };
+
+  const messagesUrl = (conversationId, params) =>
+    `${API}/conversations/${conversationId}/messages?${new URLSearchParams({ limit: MESSAGE_PAGE_SIZE, ...params }).toString()}`;
+
+  // Newest page only; older pages are fetched on scroll
+  const fetchLatestMessages = async (conversationId) => {
+    try {
+      const response = await axios.get(messagesUrl(conversationId, {}), getAuthHeader());
+      if (selectedIdRef.current === conversationId) {
+        setMessages(response.data.messages);
+        setHasOlderMessages(response.data.has_more);
+      }
+    } catch (error) {
+      console.error('Error fetching messages:', error);
+    }
+  };
+
+  const fetchNewMessages = async (conversationId) => {
+    const current = messagesRef.current;
+    if (current.length === 0) {
+      return fetchLatestMessages(conversationId);
+    }
+    try {
+      const after = current[current.length - 1].timestamp;
+      const response = await axios.get(messagesUrl(conversationId, { after }), getAuthHeader());
+      if (selectedIdRef.current !== conversationId) return;
+      if (response.data.has_more) {
+        // Too far behind - just reload the newest page
+        return fetchLatestMessages(conversationId);
+      }
+      if (response.data.messages.length > 0) {
+        setMessages((prev) => [
+          ...prev,
+          ...response.data.messages.filter((m) => !prev.some((p) => p.id === m.id))
+        ]);
+      }
+    } catch (error) {
+      console.error('Error fetching new messages:', error);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    const conversationId = selectedIdRef.current;
+    const current = messagesRef.current;
+    if (!conversationId || !hasOlderMessages || loadingOlder || current.length === 0) return;
+    setLoadingOlder(true);
+    try {
+      const before = current[0].timestamp;
+      const response = await axios.get(messagesUrl(conversationId, { before }), getAuthHeader());
+      if (selectedIdRef.current !== conversationId) return;
+      const viewport = scrollViewportRef.current;
+      const previousHeight = viewport ? viewport.scrollHeight : 0;
+      setMessages((prev) => [...response.data.messages, ...prev]);
+      setHasOlderMessages(response.data.has_more);
+      // Keep the current message in view after prepending
+      if (viewport) {
+        requestAnimationFrame(() => {
+          viewport.scrollTop = viewport.scrollHeight - previousHeight;
+        });
+      }
+    } catch (error) {
+      console.error('Error fetching older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  const handleMessagesScroll = (e) => {
+    scrollViewportRef.current = e.target;
+    if (e.target.scrollTop < 80) {
+      loadOlderMessages();
+    }
+  };
+
   const handleSelectConversation = (conv) => {
     selectedIdRef.current = conv.id;
+    lastMessageIdRef.current = null;
     setSelectedConversation(conv);
+    setMessages([]);
+    setHasOlderMessages(false);
+    fetchLatestMessages(conv.id);
+    if (conv.unread_count > 0) {
+      axios.post(`${API}/conversations/${conv.id}/read`, {}, getAuthHeader()).catch(() => {});
+      setConversations((prev) => prev.map((c) => (c.id === conv.id ? { ...c, unread_count: 0 } : c)));
+    }
   };
 
   const handleTransfer = async (conversationId) => {
@@ -91,7 +402,9 @@ const Conversations = () => {
     try {
       await axios.post(`${API}/conversations/${conversationId}/close`, {}, getAuthHeader());
       toast.success('Conversa encerrada');
+      selectedIdRef.current = null;
       setSelectedConversation(null);
+      setMessages([]);
       fetchConversations();
     } catch (error) {
       toast.error('Erro ao encerrar conversa');
@@ -108,7 +421,9 @@ const Conversations = () => {
       await axios.delete(`${API}/conversations/${conversationId}`, getAuthHeader());
       toast.success('Conversa excluída');
       if (selectedConversation?.id === conversationId) {
+        selectedIdRef.current = null;
         setSelectedConversation(null);
+        setMessages([]);
       }
       fetchConversations();
     } catch (error) {
@@ -136,6 +451,7 @@ const Conversations = () => {
         `${API}/send-message`,
         {
           phone_number: selectedConversation.phone_number,
+          conversation_id: selectedConversation.id,
           message: message
         },
         getAuthHeader()
@@ -193,10 +509,79 @@ const Conversations = () => {
                 <TabsTrigger value="transferred" data-testid="filter-transferred">Transferidas</TabsTrigger>
               </TabsList>
             </Tabs>
+            <form onSubmit={handleSearchSubmit} className="flex gap-2 mt-3">
+              <div className="relative flex-1">
+                <Search className="w-4 h-4 absolute left-3 top-1/2 -translate-y-1/2 text-muted-foreground" />
+                <Input
+                  value={searchQuery}
+                  onChange={(e) => setSearchQuery(e.target.value)}
+                  placeholder="Buscar nas mensagens..."
+                  className="pl-9"
+                  data-testid="search-input"
+                />
+              </div>
+              {searchResults !== null && (
+                <Button type="button" variant="ghost" size="icon" onClick={clearSearch} title="Limpar busca" data-testid="search-clear">
+                  <X className="w-4 h-4" />
+                </Button>
+              )}
+            </form>
           </div>
 
           <ScrollArea className="flex-1">
-            {conversations.length === 0 ? (
+            {searchResults !== null ? (
+              searchResults.length === 0 ? (
+                <div className="p-8 text-center text-muted-foreground">
+                  {searching ? 'Buscando...' : 'Nenhuma mensagem encontrada'}
+                </div>
+              ) : (
+                <div className="space-y-2 p-4">
+                  {searchResults.map((hit) => (
+                    <Card
+                      key={hit.id}
+                      className={`cursor-pointer hover:border-zinc-700 transition-colors ${
+                        selectedConversation?.id === hit.id ? 'border-primary' : ''
+                      }`}
+                      onClick={() => handleSelectConversation(hit)}
+                      data-testid={`search-result-${hit.id}`}
+                    >
+                      <CardContent className="p-4">
+                        <div className="flex justify-between items-start mb-2">
+                          <div className="min-w-0 flex-1">
+                            <p className="font-semibold">{hit.user_name}</p>
+                            <p className="text-xs text-muted-foreground">{hit.phone_number}</p>
+                          </div>
+                          <Badge className={getStatusColor(hit.status)}>
+                            {getStatusLabel(hit.status)}
+                          </Badge>
+                        </div>
+                        {hit.matches.map((match) => (
+                          <p key={match.message_id} className="text-sm text-muted-foreground break-words mt-1">
+                            {renderHighlighted(match.snippet, match.highlights)}
+                          </p>
+                        ))}
+                        {hit.match_count > hit.matches.length && (
+                          <p className="text-xs text-muted-foreground mt-1">
+                            +{hit.match_count - hit.matches.length} mensagens
+                          </p>
+                        )}
+                      </CardContent>
+                    </Card>
+                  ))}
+                  {searchNextOffset !== null && (
+                    <Button
+                      variant="outline"
+                      className="w-full"
+                      onClick={() => runSearch(searchNextOffset)}
+                      disabled={searching}
+                      data-testid="load-more-search"
+                    >
+                      {searching ? 'Carregando...' : 'Carregar mais'}
+                    </Button>
+                  )}
+                </div>
+              )
+            ) : conversations.length === 0 ? (
               <div className="p-8 text-center text-muted-foreground">
                 Nenhuma conversa encontrada
               </div>
@@ -223,6 +608,11 @@ const Conversations = () => {
                           </div>
                         </div>
                         <div className="flex items-center gap-2 flex-shrink-0">
+                          {conv.unread_count > 0 && (
+                            <Badge className="bg-primary text-primary-foreground" data-testid={`unread-count-${conv.id}`}>
+                              {conv.unread_count}
+                            </Badge>
+                          )}
                           <Badge className={getStatusColor(conv.status)}>
                             {getStatusLabel(conv.status)}
                           </Badge>
@@ -243,14 +633,25 @@ const Conversations = () => {
                           </button>
                         </div>
                       </div>
-                      {conv.messages.length > 0 && (
+                      {conv.last_message_preview && (
                         <p className="text-sm text-muted-foreground break-words">
-                          {conv.messages[conv.messages.length - 1].content}
+                          {conv.last_message_preview}
                         </p>
                       )}
                     </CardContent>
                   </Card>
                 ))}
+                {nextCursor && (
+                  <Button
+                    variant="outline"
+                    className="w-full"
+                    onClick={fetchMoreConversations}
+                    disabled={loadingMore}
+                    data-testid="load-more-conversations"
+                  >
+                    {loadingMore ? 'Carregando...' : 'Carregar mais'}
+                  </Button>
+                )}
               </div>
             )}
           </ScrollArea>
@@ -311,11 +712,24 @@ const Conversations = () => {
               </div>
 
               {/* Messages */}
-              <ScrollArea className="flex-1 p-6">
+              <ScrollArea className="flex-1 p-6" onScrollCapture={handleMessagesScroll}>
                 <div className="space-y-4">
-                  {selectedConversation.messages.map((msg, idx) => (
+                  {hasOlderMessages && (
+                    <div className="flex justify-center">
+                      <Button
+                        variant="ghost"
+                        size="sm"
+                        onClick={loadOlderMessages}
+                        disabled={loadingOlder}
+                        data-testid="load-older-messages"
+                      >
+                        {loadingOlder ? 'Carregando...' : 'Carregar mensagens anteriores'}
+                      </Button>
+                    </div>
+                  )}
+                  {messages.map((msg, idx) => (
                     <div
-                      key={idx}
+                      key={msg.id || idx}
                       className={`flex ${msg.sender === 'user' ? 'justify-start' : 'justify-end'}`}
                       data-testid={`message-${idx}`}
                     >
@@ -29,7 +29,8 @@ const Settings = () => {
     redis_password: '',
     notification_whatsapp: '',
     transfer_keywords: [],
-    notify_every_keyword: false
+    notify_every_keyword: false,
+    auto_close_after_hours: null
   });
   const [newKeyword, setNewKeyword] = useState('');
 
@@ -203,6 +204,25 @@ const Settings = () => {
               Digite seu número com código do país (ex: 5511999999999). Você receberá notificações quando um cliente pedir para falar com o dono, gerente, comercial, etc.
             </p>
           </div>
+          <div className="space-y-2 pt-4">
+            <Label htmlFor="auto_close_after_hours">Encerrar conversas inativas após (horas)</Label>
+            <Input
+              id="auto_close_after_hours"
+              type="number"
+              min="0"
+              placeholder="Nunca"
+              value={settings.auto_close_after_hours == null ? '' : settings.auto_close_after_hours}
+              onChange={(e) => setSettings({
+                ...settings,
+                auto_close_after_hours: e.target.value === '' ? null : Number(e.target.value)
+              })}
+              className="w-40"
+              data-testid="settings-input-auto_close_after_hours"
+            />
+            <p className="text-xs text-muted-foreground">
+              Conversas sem novas mensagens por esse período são encerradas automaticamente. Deixe em branco para nunca encerrar.
+            </p>
+          </div>
         </CardContent>
       </Card>
 
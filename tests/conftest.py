@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def db():
+    """In-memory Mongo with the same tz-aware datetimes as the app's client"""
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient(tz_aware=True)["test"]
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+import gzip
+
+import pytest
+
+import archive_service
+from archive_service import ArchiveService
+from change_tracker import ChangeTracker
+from stats_service import StatsService
+
+pytestmark = pytest.mark.anyio
+
+# Whole milliseconds, like everything Mongo stores
+OLD = (datetime.now(timezone.utc) - timedelta(days=120)).replace(microsecond=0)
+
+@pytest.fixture
+def service(db, tmp_path):
+    return ArchiveService(db, StatsService(db), ChangeTracker(db), archive_dir=tmp_path)
+
+async def conversation(db, conversation_id, status="closed", last_message_at=OLD):
+    doc = {
+        "id": conversation_id, "phone_number": f"55119{conversation_id}", "status": status,
+        "started_at": OLD, "last_message_at": last_message_at, "changed_at": OLD,
+        "messages": [{"id": "m1", "sender": "user", "content": "olá, orçamento", "timestamp": OLD}]
+    }
+    await db.conversations.insert_one(dict(doc))
+    await StatsService(db).conversation_created(status)
+    return doc
+
+async def test_archive_and_restore_round_trip(db, service, tmp_path):
+    original = await conversation(db, "c1")
+    await conversation(db, "open", status="active")
+    await conversation(db, "recent", last_message_at=datetime.now(timezone.utc))
+    
+    assert await service.archive(90) == {"archived": 1, "skipped": 0}
+    assert {c["id"] for c in await db.conversations.find({}).to_list(None)} == {"open", "recent"}
+    assert [entry["conversation_id"] for entry in await service.find(phone_number="55119c1")] == ["c1"]
+    assert (await StatsService(db).get_dashboard())["total_users"] == 2
+    # Segments stay plain gzip NDJSON
+    segment, = tmp_path.iterdir()
+    assert b'"id": "c1"' in gzip.decompress(segment.read_bytes())
+    
+    restored = await service.restore("c1")
+    assert restored["messages"] == original["messages"]
+    assert restored["last_message_at"] == OLD
+    hot = await db.conversations.find_one({"id": "c1"}, {"_id": 0})
+    assert hot["messages"] == original["messages"] and hot["status"] == "closed"
+    assert await service.find(conversation_id="c1") == []
+    assert (await StatsService(db).get_dashboard())["total_users"] == 3
+
+async def test_archived_conversations_are_reported_as_deleted(db, service):
+    await conversation(db, "c1")
+    tracker = ChangeTracker(db)
+    
+    await service.archive(90)
+    _, deleted, _, _ = await tracker.changes((OLD, ""), 10)
+    assert deleted == ["c1"]
+
+async def test_conversation_changed_while_archiving_stays_hot(db, service, monkeypatch):
+    await conversation(db, "c1")
+    
+    async def write_then_touch(func, *args):
+        # A webhook lands between the segment write and the delete
+        result = func(*args)
+        await db.conversations.update_one({"id": "c1"}, {"$set": {"changed_at": datetime.now(timezone.utc)}})
+        return result
+    monkeypatch.setattr(archive_service.asyncio, "to_thread", write_then_touch)
+    
+    assert await service.archive(90) == {"archived": 0, "skipped": 1}
+    assert await db.conversations.find_one({"id": "c1"})
+    assert await service.find(conversation_id="c1") == []
+
+async def test_restore_unknown_returns_none(service):
+    assert await service.restore("missing") is None
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+from auth import LoginThrottle, TokenCache, create_access_token, decode_token
+
+class Clock:
+    """Stands in for time.monotonic and time.time"""
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    monkeypatch.setattr(auth.time, "time", clock)
+    return clock
+
+def test_throttle_locks_after_max_failures(clock):
+    throttle = LoginThrottle(max_failures=3, window=60, lockout=120)
+    for _ in range(2):
+        throttle.failure("admin", "10.0.0.1")
+    assert throttle.retry_after("admin", "10.0.0.1") == 0
+    
+    throttle.failure("admin", "10.0.0.1")
+    
+    assert throttle.retry_after("admin") == 121
+    assert throttle.retry_after("other", "10.0.0.1") == 121
+    assert throttle.retry_after("other", "10.0.0.2") == 0
+
+def test_throttle_lock_expires(clock):
+    throttle = LoginThrottle(max_failures=1, lockout=120)
+    throttle.failure("admin")
+    
+    clock.now += 120
+    assert throttle.retry_after("admin") == 0
+
+def test_throttle_failures_outside_window_start_over(clock):
+    throttle = LoginThrottle(max_failures=3, window=60)
+    throttle.failure("admin")
+    throttle.failure("admin")
+    
+    clock.now += 61
+    throttle.failure("admin")
+    assert throttle.retry_after("admin") == 0
+
+def test_throttle_success_clears_failures(clock):
+    throttle = LoginThrottle(max_failures=2)
+    throttle.failure("admin")
+    throttle.success("admin")
+    throttle.failure("admin")
+    
+    assert throttle.retry_after("admin") == 0
+
+def test_login_lockout_is_per_address(clock, monkeypatch):
+    monkeypatch.setattr(auth, "login_throttle", LoginThrottle(max_failures=2))
+    monkeypatch.setattr(auth, "login_ip_throttle", LoginThrottle(max_failures=3))
+    auth.login_failed("Admin", "10.0.0.1")
+    auth.login_failed("admin", "10.0.0.1")
+    assert auth.login_throttle_retry_after("admin", "10.0.0.1")
+    # The real admin, elsewhere, is not locked out
+    assert auth.login_throttle_retry_after("admin", "10.0.0.2") == 0
+    
+    auth.login_failed("other", "10.0.0.1")
+    assert auth.login_throttle_retry_after("someone", "10.0.0.1")
+    auth.login_succeeded("admin", "10.0.0.2")
+    assert auth.login_throttle_retry_after("someone", "10.0.0.1")
+
+def test_throttle_evicts_oldest_keys(clock):
+    throttle = LoginThrottle(max_failures=1, max_entries=2)
+    throttle.failure("a")
+    throttle.failure("b")
+    throttle.failure("c")
+    
+    assert throttle.retry_after("a") == 0
+    assert throttle.retry_after("b") and throttle.retry_after("c")
+
+def test_token_cache_entry_expires_after_ttl(clock):
+    cache = TokenCache(ttl=60)
+    cache.put("t", {"sub": "admin"})
+    assert cache.get("t") == {"sub": "admin"}
+    
+    clock.now += 60
+    assert cache.get("t") is None
+
+def test_token_cache_never_outlives_token_exp(clock):
+    cache = TokenCache(ttl=60)
+    cache.put("t", {"sub": "admin", "exp": clock.now + 10})
+    
+    clock.now += 10
+    assert cache.get("t") is None
+
+def test_token_cache_is_lru(clock):
+    cache = TokenCache(max_entries=2, ttl=60)
+    cache.put("a", {"sub": "a"})
+    cache.put("b", {"sub": "b"})
+    cache.get("a")
+    cache.put("c", {"sub": "c"})
+    
+    assert cache.get("a") == {"sub": "a"}
+    assert cache.get("b") is None
+
+def test_decode_token_caches_verified_claims(monkeypatch):
+    monkeypatch.setattr(auth, "token_cache", TokenCache(ttl=60))
+    token = create_access_token({"sub": "admin"})
+    assert decode_token(token)["sub"] == "admin"
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("token verified again")
+    monkeypatch.setattr(auth.jwt, "decode", fail)
+    assert decode_token(token)["sub"] == "admin"
+
+def test_decode_token_does_not_cache_invalid_tokens(monkeypatch):
+    monkeypatch.setattr(auth, "token_cache", TokenCache(ttl=60))
+    expired = create_access_token({"sub": "admin"}, expires_delta=timedelta(seconds=-1))
+    
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            decode_token(expired)
+        assert error.value.status_code == 401
+    assert auth.token_cache.get(expired) is None
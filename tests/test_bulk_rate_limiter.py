@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from bulk_send_service import BulkSendService, RateLimiter, normalize_phone
+
+pytestmark = pytest.mark.anyio
+
+async def slot_times(limiter: RateLimiter, count: int, halt: asyncio.Event):
+    times = []
+    
+    async def take():
+        assert await limiter.acquire(halt)
+        times.append(time.monotonic())
+    
+    await asyncio.gather(*(take() for _ in range(count)))
+    return sorted(times)
+
+async def test_slots_are_evenly_spaced_without_burst():
+    limiter = RateLimiter(1200)  # one every 50 ms
+    times = await slot_times(limiter, 4, asyncio.Event())
+    
+    # A waiter may wake late, never early: the n-th slot is at least n intervals in
+    offsets = [t - times[0] for t in times]
+    assert all(offset >= 0.045 * n for n, offset in enumerate(offsets)), offsets
+
+async def test_halt_wakes_waiters_and_refuses_the_slot():
+    limiter = RateLimiter(6)  # one every 10 s
+    halt = asyncio.Event()
+    assert await limiter.acquire(halt)
+    
+    waiter = asyncio.create_task(limiter.acquire(halt))
+    await asyncio.sleep(0.01)
+    start = time.monotonic()
+    halt.set()
+    
+    assert await waiter is False
+    assert time.monotonic() - start < 1
+
+async def test_jobs_on_one_instance_share_its_limiter():
+    service = BulkSendService(None, None, None, None, lambda: None, rate_per_minute=1200)
+    
+    assert service._limiter("instance-1") is service._limiter("instance-1")
+    assert service._limiter("instance-1") is not service._limiter("instance-2")
+    
+    # Two jobs drawing from the same instance get one combined rate
+    first, second = asyncio.Event(), asyncio.Event()
+    first_times, second_times = await asyncio.gather(
+        slot_times(service._limiter("instance-1"), 2, first),
+        slot_times(service._limiter("instance-1"), 2, second)
+    )
+    times = sorted(first_times + second_times)
+    # A waiter may wake late, never early: the n-th slot is at least n intervals in
+    offsets = [t - times[0] for t in times]
+    assert all(offset >= 0.045 * n for n, offset in enumerate(offsets)), offsets
+
+async def test_jobs_on_one_instance_share_its_client():
+    service = BulkSendService(None, None, None, None, lambda: None)
+    client = service._client("instance-1")
+    
+    assert service._client("instance-1") is client
+    await service.close()
+    assert client.is_closed
+
+async def test_job_rate_above_instance_rate_is_rejected():
+    service = BulkSendService(None, None, None, None, lambda: None, rate_per_minute=30)
+    
+    with pytest.raises(ValueError):
+        await service.create_job("oi", {"instance_name": "x"}, phone_numbers=["5511999990000"], rate_per_minute=60)
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+55 (11) 99999-0000", "5511999990000"),
+    ("5511999990000@s.whatsapp.net", "5511999990000"),
+    ("", ""),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import bulk_send_service
+from bulk_send_service import BulkSendService
+from change_tracker import ChangeTracker
+from event_bus import EventBus
+from stats_service import StatsService
+
+pytestmark = pytest.mark.anyio
+
+INSTANCE = {"id": "i1", "name": "main", "instance_name": "main", "api_url": "http://evolution", "api_key": "k"}
+
+class FakeSupabase:
+    def __init__(self):
+        self.rows = []
+    
+    async def save_messages(self, messages):
+        self.rows.extend(messages)
+
+class FlakyCollection:
+    """Proxies a collection, failing its next `failures` calls of `method`"""
+    def __init__(self, collection, method: str, failures: int):
+        self.collection = collection
+        self.method = method
+        self.failures = failures
+    
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if name != self.method:
+            return attr
+        
+        async def call(*args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("mongo unavailable")
+            return await attr(*args, **kwargs)
+        return call
+
+class FlakyDb:
+    def __init__(self, db, **flaky):
+        self.db = db
+        self.flaky = flaky
+    
+    def __getattr__(self, name):
+        return self.flaky.get(name) or getattr(self.db, name)
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    
+    async def send_text_message(self, instance_name, phone_number, message):
+        sent.append(phone_number)
+        return True
+    monkeypatch.setattr(bulk_send_service.EvolutionAPIService, "send_text_message", send_text_message)
+    return sent
+
+@pytest.fixture
+async def service(db):
+    supabase = FakeSupabase()
+    service = BulkSendService(
+        db, StatsService(db), ChangeTracker(db), EventBus(), lambda: supabase,
+        concurrency=2, rate_per_minute=6000, flush_interval=0.02
+    )
+    service.supabase = supabase
+    await db.evolution_instances.insert_one(dict(INSTANCE))
+    for i in range(4):
+        await db.conversations.insert_one({
+            "id": f"c{i}", "phone_number": f"551100000000{i}", "tenant_id": None,
+            "status": "active", "messages": [], "last_message_at": datetime.now(timezone.utc)
+        })
+    yield service
+    await service.close()
+
+async def create(service):
+    return await service.create_job("Promo", INSTANCE, phone_numbers=[f"551100000000{i}" for i in range(4)])
+
+async def test_results_survive_failed_writes(db, service, sent):
+    service.db = FlakyDb(db, bulk_job_recipients=FlakyCollection(db.bulk_job_recipients, "bulk_write", 3))
+    job = await create(service)
+    
+    await service.run(job["id"])
+    
+    job = await service.get_job(job["id"])
+    assert (job["status"], job["sent"], job["pending"]) == ("completed", 4, 0)
+    assert await db.bulk_job_recipients.count_documents({"status": "sent"}) == 4
+    assert sorted(sent) == [f"551100000000{i}" for i in range(4)]
+    for conversation in await db.conversations.find({}).to_list(None):
+        assert [m["content"] for m in conversation["messages"]] == ["Promo"]
+    assert len(service.supabase.rows) == 4
+
+async def test_heartbeat_keeps_going_while_results_fail(db, service, monkeypatch):
+    service.db = FlakyDb(db, bulk_job_recipients=FlakyCollection(db.bulk_job_recipients, "bulk_write", 10 ** 6))
+    job = await create(service)
+    
+    async def slow_send(self, instance_name, phone_number, message):
+        await asyncio.sleep(0.2)
+        return True
+    monkeypatch.setattr(bulk_send_service.EvolutionAPIService, "send_text_message", slow_send)
+    monkeypatch.setattr(bulk_send_service, "FINAL_FLUSH_ATTEMPTS", 1)
+    
+    run = asyncio.create_task(service.run(job["id"]))
+    await asyncio.sleep(0.1)
+    first = (await db.bulk_jobs.find_one({"id": job["id"]}))["heartbeat_at"]
+    await asyncio.sleep(0.1)
+    second = (await db.bulk_jobs.find_one({"id": job["id"]}))["heartbeat_at"]
+    await run
+    
+    assert second > first
+    # Results never stored: the job stays running for a later resume instead of being closed
+    job = await service.get_job(job["id"])
+    assert job["status"] == "running"
+    assert await db.bulk_job_recipients.count_documents({"status": "pending"}) == 4
+
+async def test_recording_a_batch_twice_does_not_duplicate(db, service):
+    job = await create(service)
+    recipients = await db.bulk_job_recipients.find({"job_id": job["id"]}).to_list(None)
+    delivered = [(recipient, datetime.now(timezone.utc)) for recipient in recipients]
+    
+    await service._record_sent(job["id"], "Promo", delivered[:2])
+    await service._record_sent(job["id"], "Promo", delivered)
+    
+    counts = {c["id"]: len(c["messages"]) for c in await db.conversations.find({}).to_list(None)}
+    assert counts == {"c0": 1, "c1": 1, "c2": 1, "c3": 1}
+    assert sorted(row[0] for row in service.supabase.rows) == ["c0", "c1", "c2", "c3"]
+    assert (await StatsService(db).get_dashboard())["messages_today"] == 4
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from change_tracker import SETTLE_SECONDS, ChangeTracker, decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+def ago(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+EPOCH = (datetime(2020, 1, 1, tzinfo=timezone.utc), "")
+
+async def changed(db, conversation_id, at):
+    await db.conversations.update_one(
+        {"id": conversation_id}, {"$set": {"id": conversation_id, "changed_at": at}}, upsert=True
+    )
+
+def test_cursor_round_trip():
+    at = datetime(2026, 3, 2, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor((at, "c1"))) == (at, "c1")
+    assert decode_cursor(encode_cursor((at, ""))) == (at, "")
+    with pytest.raises(ValueError):
+        decode_cursor("yesterday")
+
+async def test_pages_split_same_stamp_without_loss(db):
+    tracker = ChangeTracker(db)
+    at = ago(60)
+    for i in range(5):
+        await changed(db, f"c{i}", at)
+    
+    seen = []
+    cursor, has_more = EPOCH, True
+    while has_more:
+        docs, _, cursor, has_more = await tracker.changes(cursor, 2)
+        seen += [doc["id"] for doc in docs]
+    assert seen == ["c0", "c1", "c2", "c3", "c4"]
+    
+    docs, _, _, _ = await tracker.changes(cursor, 2)
+    assert docs == []
+
+async def test_settling_changes_are_seen_again(db):
+    tracker = ChangeTracker(db)
+    await changed(db, "old", ago(60))
+    await changed(db, "new", ago(0))
+    
+    docs, _, cursor, has_more = await tracker.changes(EPOCH, 10)
+    assert [doc["id"] for doc in docs] == ["old", "new"] and not has_more
+    # The cursor stays behind the settle window, so "new" comes back next poll
+    docs, _, _, _ = await tracker.changes(cursor, 10)
+    assert [doc["id"] for doc in docs] == ["new"]
+
+async def test_cursor_never_moves_backwards(db):
+    tracker = ChangeTracker(db)
+    ahead = (ago(-60), "")
+    _, _, cursor, _ = await tracker.changes(ahead, 10)
+    assert cursor == ahead
+
+async def test_deletes_show_up_as_tombstones(db):
+    tracker = ChangeTracker(db)
+    _, _, cursor, _ = await tracker.changes(EPOCH, 10)
+    await tracker.record_deleted("gone")
+    
+    _, deleted, _, _ = await tracker.changes(cursor, 10)
+    assert deleted == ["gone"]
+
+async def test_list_etag_waits_for_changes_to_settle(db):
+    tracker = ChangeTracker(db)
+    assert await tracker.list_etag() == "0"
+    
+    await changed(db, "c1", ago(60))
+    etag = await tracker.list_etag()
+    assert etag not in (None, "0")
+    assert await tracker.list_etag() == etag
+    
+    await changed(db, "c2", ago(SETTLE_SECONDS / 2))
+    assert await tracker.list_etag() is None
+    await changed(db, "c2", ago(30))
+    assert await tracker.list_etag() not in (None, etag)
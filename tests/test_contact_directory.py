@@ -0,0 +1,89 @@
+import pytest
+
+from contact_service import ContactDirectory, UNKNOWN_NAME
+
+pytestmark = pytest.mark.anyio
+
+class FakeRedis:
+    """The two RedisService calls the directory uses, backed by a dict"""
+    def __init__(self):
+        self.contacts = {}
+    
+    async def get_contact(self, phone_number):
+        return self.contacts.get(phone_number)
+    
+    async def set_contact(self, phone_number, profile, ttl=604800):
+        self.contacts[phone_number] = dict(profile)
+
+class CountingConversations:
+    """Wraps the conversations collection to count find_one calls"""
+    def __init__(self, collection):
+        self.collection = collection
+        self.lookups = 0
+    
+    async def find_one(self, *args, **kwargs):
+        self.lookups += 1
+        return await self.collection.find_one(*args, **kwargs)
+
+class CountingDb:
+    def __init__(self, db):
+        self.conversations = CountingConversations(db.conversations)
+
+@pytest.fixture
+def counting_db(db):
+    return CountingDb(db)
+
+async def test_unknown_number_is_negatively_cached(counting_db):
+    directory = ContactDirectory(counting_db, lambda: None)
+    
+    assert await directory.get("5511999990000") is None
+    assert await directory.get("5511999990000") is None
+    assert counting_db.conversations.lookups == 1
+
+async def test_negative_entry_expires_after_negative_ttl(counting_db):
+    directory = ContactDirectory(counting_db, lambda: None, negative_ttl=0)
+    
+    await directory.get("5511999990000")
+    await directory.get("5511999990000")
+    assert counting_db.conversations.lookups == 2
+
+async def test_negative_entry_is_shared_through_redis(counting_db):
+    redis = FakeRedis()
+    await ContactDirectory(counting_db, lambda: redis).get("5511999990000")
+    assert redis.contacts["5511999990000"] == {"missing": "1"}
+    
+    # Another worker: its own LRU is empty, Redis answers
+    assert await ContactDirectory(counting_db, lambda: redis).get("5511999990000") is None
+    assert counting_db.conversations.lookups == 1
+
+async def test_real_push_name_replaces_negative_entry(counting_db):
+    redis = FakeRedis()
+    directory = ContactDirectory(counting_db, lambda: redis)
+    await directory.get("5511999990000")
+    
+    assert await directory.resolve_name("5511999990000", "Maria") == "Maria"
+    assert (await directory.get("5511999990000"))["name"] == "Maria"
+    assert redis.contacts["5511999990000"]["name"] == "Maria"
+    assert counting_db.conversations.lookups == 1
+
+async def test_changed_push_name_invalidates_cached_name(counting_db):
+    directory = ContactDirectory(counting_db, lambda: None)
+    await directory.resolve_name("5511999990000", "Maria")
+    await directory.resolve_name("5511999990000", "Maria Souza")
+    
+    assert (await directory.get("5511999990000"))["name"] == "Maria Souza"
+
+async def test_stored_name_is_used_without_push_name(db, counting_db):
+    await db.conversations.insert_one({"phone_number": "5511999990000", "user_name": "João"})
+    directory = ContactDirectory(counting_db, lambda: None)
+    
+    assert await directory.resolve_name("5511999990000", UNKNOWN_NAME) == "João"
+    assert await directory.resolve_name("5511999990000", None) == "João"
+    assert counting_db.conversations.lookups == 1
+
+async def test_unknown_without_push_name_falls_back(counting_db):
+    directory = ContactDirectory(counting_db, lambda: None)
+    
+    assert await directory.resolve_name("5511999990000", None) == UNKNOWN_NAME
+    assert await directory.resolve_name("5511999990000", "") == UNKNOWN_NAME
+    assert counting_db.conversations.lookups == 1
@@ -0,0 +1,37 @@
+import pytest
+
+from event_bus import EventBus
+
+pytestmark = pytest.mark.anyio
+
+async def test_events_reach_every_subscriber():
+    bus = EventBus()
+    first, second = bus.subscribe(), bus.subscribe()
+    await bus.publish("message", "c1", sender="user")
+    
+    for queue in (first, second):
+        event = queue.get_nowait()
+        assert (event["type"], event["conversation_id"], event["sender"]) == ("message", "c1", "user")
+
+async def test_slow_subscriber_gets_a_resync_instead_of_a_backlog():
+    bus = EventBus(max_queue=2)
+    slow = bus.subscribe()
+    for i in range(3):
+        await bus.publish("message", f"c{i}")
+    
+    assert slow.get_nowait() == {"type": "resync"}
+    assert slow.empty()
+
+async def test_unsubscribed_queue_gets_nothing():
+    bus = EventBus()
+    queue = bus.subscribe()
+    bus.unsubscribe(queue)
+    await bus.publish("message", "c1")
+    assert queue.empty()
+
+async def test_close_streams_ends_every_stream():
+    bus = EventBus()
+    queue = bus.subscribe()
+    await bus.publish("message", "c1")
+    bus.close_streams()
+    assert queue.get_nowait() is None
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import export_service
+from export_service import ExportService
+
+pytestmark = pytest.mark.anyio
+
+def at(day: int, hour: int = 12) -> datetime:
+    return datetime(2026, 3, day, hour, 0, tzinfo=timezone.utc)
+
+@pytest.fixture
+async def service(db):
+    for i, day in enumerate((1, 3, 5)):
+        await db.conversations.insert_one({
+            "id": f"c{i}", "user_id": f"u{i}", "phone_number": f"5511{i}", "user_name": f"Cliente {i}",
+            "status": "closed" if i == 0 else "active", "started_at": at(day), "last_message_at": at(day, 13),
+            "messages": [
+                {"id": f"m{i}a", "sender": "user", "content": "oi, tudo bem?", "timestamp": at(day)},
+                {"id": f"m{i}b", "sender": "bot", "content": "Olá!", "timestamp": at(day, 13)},
+            ]
+        })
+    return ExportService(db)
+
+async def collect(service, **kwargs) -> bytes:
+    return b"".join([chunk async for chunk in service.stream(**kwargs)])
+
+async def test_ndjson_conversations_with_transcripts(service):
+    lines = (await collect(service)).splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row["id"] for row in rows] == ["c0", "c1", "c2"]
+    assert [m["id"] for m in rows[0]["messages"]] == ["m0a", "m0b"]
+    # Rendered like the API: São Paulo time
+    assert rows[0]["started_at"].endswith("-03:00")
+
+async def test_csv_messages_within_a_range(service):
+    data = await collect(service, format="csv", scope="messages", start=at(3), end=at(5, 12))
+    rows = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+    assert [row["message_id"] for row in rows] == ["m1a", "m1b"]
+    assert rows[0]["timestamp"] == "2026-03-03T09:00:00-03:00"
+    assert rows[0]["content"] == "oi, tudo bem?"
+
+async def test_csv_conversations_count_messages(service):
+    data = await collect(service, format="csv", status="closed")
+    rows = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+    assert [(row["id"], row["message_count"]) for row in rows] == [("c0", "2")]
+
+async def test_gzip_and_chunking_keep_the_content(service, monkeypatch):
+    plain = await collect(service, scope="messages")
+    monkeypatch.setattr(export_service, "CHUNK_BYTES", 100)
+    
+    chunks = [chunk async for chunk in service.stream(scope="messages", compress=True, batch_size=1)]
+    assert len(chunks) > 1
+    assert gzip.decompress(b"".join(chunks)) == plain
+    assert len(plain.splitlines()) == 6
+
+async def test_empty_csv_has_only_the_header(db):
+    data = await collect(ExportService(db), format="csv")
+    assert data.decode("utf-8").splitlines() == [",".join(export_service.CONVERSATION_COLUMNS)]
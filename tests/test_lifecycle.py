@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta, timezone
+
+import asyncio
+import time
+
+import pytest
+
+from change_tracker import ChangeTracker
+from event_bus import EventBus
+from lifecycle_service import ConversationSweeper
+from stats_service import StatsService
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+
+class FakeRedis:
+    """The RedisService calls the sweeper makes, with SET NX EX locks"""
+    def __init__(self):
+        self.locks = {}
+        self.deleted = []
+    
+    async def acquire_lock(self, key, token, ttl):
+        holder = self.locks.get(key)
+        if holder and holder[1] > time.monotonic():
+            return False
+        self.locks[key] = (token, time.monotonic() + ttl)
+        return True
+    
+    async def delete_conversations(self, phone_numbers):
+        self.deleted += phone_numbers
+
+class Migration:
+    def __init__(self, done):
+        self.done = done
+    
+    async def ready(self):
+        return self.done
+
+def sweeper(db, redis=None, migration=None):
+    return ConversationSweeper(
+        db, lambda: redis, StatsService(db), ChangeTracker(db), EventBus(), migration=migration
+    )
+
+async def count_sweeps(sweepers, monkeypatch):
+    """Run the sweepers' loops briefly; how many sweeps happened"""
+    sweeps = []
+    
+    async def sweep(self, now=None):
+        sweeps.append(self)
+    monkeypatch.setattr(ConversationSweeper, "sweep", sweep)
+    for s in sweepers:
+        s.start()
+    await asyncio.sleep(0.05)
+    for s in sweepers:
+        await s.stop()
+    return len(sweeps)
+
+async def conversation(db, conversation_id, idle_hours, tenant_id=None, **fields):
+    await db.conversations.insert_one({
+        "id": conversation_id, "phone_number": conversation_id, "tenant_id": tenant_id,
+        "status": "active", "last_message_at": NOW - timedelta(hours=idle_hours), **fields
+    })
+
+async def statuses(db):
+    return {c["id"]: c["status"] for c in await db.conversations.find({}).to_list(None)}
+
+async def test_tenants_close_on_their_own_schedule(db):
+    await db.settings.insert_one({"auto_close_after_hours": 24})
+    await db.tenants.insert_many([
+        {"id": "fast", "auto_close_after_hours": 2},
+        {"id": "never", "auto_close_after_hours": 0},
+        {"id": "inherits", "auto_close_after_hours": None},
+    ])
+    await conversation(db, "default-idle", 30)
+    await conversation(db, "default-recent", 5)
+    await conversation(db, "fast-idle", 5, "fast")
+    await conversation(db, "never-idle", 30, "never")
+    await conversation(db, "inherits-idle", 30, "inherits")
+    
+    assert (await sweeper(db).sweep(NOW))["closed"] == 3
+    assert await statuses(db) == {
+        "default-idle": "closed", "default-recent": "active", "fast-idle": "closed",
+        "never-idle": "active", "inherits-idle": "closed",
+    }
+
+async def test_no_global_setting_still_closes_tenants_that_ask(db):
+    await db.tenants.insert_one({"id": "fast", "auto_close_after_hours": 2})
+    await conversation(db, "default-idle", 30)
+    await conversation(db, "fast-idle", 5, "fast")
+    
+    await sweeper(db).sweep(NOW)
+    assert await statuses(db) == {"default-idle": "active", "fast-idle": "closed"}
+
+async def test_notifications_reset_after_two_idle_hours(db):
+    await conversation(db, "idle", 3, notified_owner=True)
+    await conversation(db, "recent", 1, notified_owner=True)
+    
+    assert (await sweeper(db).sweep(NOW))["notifications_reset"] == 1
+    flags = {c["id"]: c["notified_owner"] for c in await db.conversations.find({}).to_list(None)}
+    assert flags == {"idle": False, "recent": True}
+
+async def test_closing_drops_redis_state(db):
+    redis = FakeRedis()
+    await db.settings.insert_one({"auto_close_after_hours": 24})
+    await conversation(db, "idle", 30)
+    await conversation(db, "recent", 1)
+    
+    await sweeper(db, redis).sweep(NOW)
+    assert redis.deleted == ["idle"]
+
+async def test_lock_lets_one_worker_sweep_per_interval(db, monkeypatch):
+    redis = FakeRedis()
+    assert await count_sweeps([sweeper(db, redis), sweeper(db, redis)], monkeypatch) == 1
+    
+    # Once the lock expires, the next worker to try gets it
+    redis.locks[ConversationSweeper.LOCK_KEY] = ("old", time.monotonic() - 1)
+    assert await count_sweeps([sweeper(db, redis)], monkeypatch) == 1
+
+async def test_without_redis_every_worker_sweeps(db, monkeypatch):
+    assert await count_sweeps([sweeper(db), sweeper(db)], monkeypatch) == 2
+
+async def test_sweeps_wait_for_the_timestamp_migration(db, monkeypatch):
+    assert await count_sweeps([sweeper(db, migration=Migration(False))], monkeypatch) == 0
+    assert await count_sweeps([sweeper(db, migration=Migration(True))], monkeypatch) == 1
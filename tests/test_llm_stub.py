@@ -0,0 +1,23 @@
+import pytest
+
+import bot_service
+from loadtest.llm_stub import check_database
+
+def test_stub_needs_the_load_test_flag(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.delenv("LOAD_TEST", raising=False)
+    with pytest.raises(RuntimeError):
+        bot_service.chat_classes()
+    
+    monkeypatch.setenv("LOAD_TEST", "1")
+    assert bot_service.chat_classes()[0].__name__ == "StubLlmChat"
+
+@pytest.mark.anyio
+async def test_stub_refuses_real_keys_and_instances(db):
+    await db.settings.insert_one({"openai_api_key": "teste"})
+    await db.evolution_instances.insert_one({"name": "stub", "api_url": "http://127.0.0.1:8081"})
+    assert await check_database(db) == []
+    
+    await db.tenants.insert_one({"id": "t1", "openai_api_key": "sk-proj-abc"})
+    await db.evolution_instances.insert_one({"name": "main", "api_url": "https://evolution.example.com"})
+    assert len(await check_database(db)) == 2
@@ -0,0 +1,67 @@
+import json
+import logging
+import queue
+
+from log_config import BackgroundQueueHandler, JsonFormatter, SamplingFilter, parse_pairs, redact
+
+def record(msg="event %s", args=(), level=logging.INFO, name="server.webhook", **extra):
+    rec = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    rec.__dict__.update(extra)
+    return rec
+
+def test_redact_masks_secrets_at_any_depth():
+    payload = {"apikey": "secret", "data": {"Authorization": "Bearer x", "settings": [{"openai_api_key": "sk-1"}]}}
+    assert redact(payload, 100) == {"apikey": "***", "data": {"Authorization": "***", "settings": [{"openai_api_key": "***"}]}}
+    assert payload["apikey"] == "secret"
+
+def test_redact_bounds_strings_lists_and_depth():
+    assert redact("x" * 12, 10) == "xxxxxxxxxx… (+2 chars)"
+    assert redact(list(range(25)), 10)[-1] == "… (+5 items)"
+    assert redact((1, 2), 10) == (1, 2)
+    assert redact({"a": {"b": {"c": {"d": {"e": 1}}}}}, 10) == {"a": {"b": {"c": {"d": "…"}}}}
+
+def test_queued_arguments_are_redacted_copies():
+    log_queue = queue.Queue()
+    handler = BackgroundQueueHandler(log_queue, max_chars=10)
+    payload = {"password": "hunter2", "text": "x" * 50}
+    
+    handler.handle(record("payload %s", (payload,)))
+    payload["text"] = "changed"
+    
+    queued = log_queue.get_nowait()
+    # logging unwraps a lone dict argument
+    assert queued.args == {"password": "***", "text": "xxxxxxxxxx… (+40 chars)"}
+    assert "hunter2" not in queued.getMessage()
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = BackgroundQueueHandler(queue.Queue(1), max_chars=10)
+    handler.handle(record())
+    handler.handle(record())
+    assert handler.dropped == 1
+
+def test_after_stop_records_go_straight_to_the_output():
+    written = []
+    
+    class Output(logging.Handler):
+        def emit(self, rec):
+            written.append(rec.getMessage())
+    handler = BackgroundQueueHandler(queue.Queue(), max_chars=10)
+    handler.direct = Output()
+    handler.handle(record("bye %s", ("now",)))
+    assert written == ["bye now"]
+
+def test_json_lines_carry_redacted_extras():
+    line = JsonFormatter(max_chars=10).format(record("login %s", ("admin",), token="abc", body={"token": "t", "n": 1}))
+    entry = json.loads(line)
+    assert entry["msg"] == "login admin" and entry["level"] == "INFO"
+    assert entry["body"] == {"token": "***", "n": 1}
+    assert entry["token"] == "***"
+
+def test_sampling_keeps_warnings_and_uses_the_most_specific_rate():
+    sampling = SamplingFilter({"server": 1.0, "server.webhook": 0.0})
+    assert not sampling.filter(record(name="server.webhook.events"))
+    assert sampling.filter(record(name="server.api"))
+    assert sampling.filter(record(name="server.webhook", level=logging.WARNING))
+
+def test_parse_pairs():
+    assert parse_pairs("httpx=WARNING, server.webhook = DEBUG,junk") == {"httpx": "WARNING", "server.webhook": "DEBUG"}
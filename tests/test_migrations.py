@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from migrations import TIMESTAMP_FIELDS, TimestampMigration
+
+pytestmark = pytest.mark.anyio
+
+async def test_ready_once_every_collection_is_migrated(db):
+    await db.conversations.insert_one({"id": "c1", "last_message_at": "2024-05-01T10:00:00-03:00"})
+    migration = TimestampMigration(db)
+    assert not await migration.ready()
+    
+    await migration.run()
+    assert await migration.ready()
+    assert await TimestampMigration(db).ready()
+
+async def test_one_worker_at_a_time(db):
+    first, second = TimestampMigration(db), TimestampMigration(db)
+    first.owner = "first"
+    assert await first._hold_lease()
+    
+    assert await second.run_exclusive("second") is None
+    assert not await second.ready()
+    
+    await db.migrations.delete_one({"_id": "timestamps:lease", "owner": "first"})
+    assert len(await second.run_exclusive("second")) == len(TIMESTAMP_FIELDS)
+    # Released when the run ends
+    assert await db.migrations.find_one({"_id": "timestamps:lease"}) is None
+
+async def test_expired_lease_is_taken_over(db):
+    await db.migrations.insert_one({
+        "_id": "timestamps:lease", "owner": "dead", "expires_at": datetime(2020, 1, 1, tzinfo=timezone.utc)
+    })
+    assert await TimestampMigration(db).run_exclusive("alive") is not None
+
+async def test_losing_the_lease_stops_the_run(db):
+    await db.conversations.insert_one({"id": "c1", "last_message_at": "2024-05-01T10:00:00-03:00"})
+    migration = TimestampMigration(db)
+    migration.owner = "me"
+    assert await migration._hold_lease()
+    await db.migrations.update_one({"_id": "timestamps:lease"}, {"$set": {"owner": "other"}})
+    
+    with pytest.raises(RuntimeError):
+        await migration.migrate_collection("conversations")
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from benchmarks.payloads import upsert_payload
+from records import InboundMessage, MessageRecord, ConversationRecord, decode_upsert
+
+def body(payload) -> bytes:
+    return json.dumps(payload).encode()
+
+def test_decodes_evolution_upsert():
+    inbound = decode_upsert(body(upsert_payload("5511999990000", "Maria", "Olá")))
+    
+    assert isinstance(inbound, InboundMessage)
+    assert inbound.event == "messages.upsert"
+    assert inbound.from_me is False
+    assert inbound.phone_number == "5511999990000"
+    assert inbound.push_name == "Maria"
+    assert inbound.content == "Olá"
+
+@pytest.mark.parametrize("raw", [b"", b"not json", b"{\"event\": ", b"\xff\xfe"])
+def test_invalid_json_raises_value_error(raw):
+    with pytest.raises(ValueError):
+        decode_upsert(raw)
+
+@pytest.mark.parametrize("payload", [[], "text", 1, None])
+def test_non_object_payload_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_upsert(body(payload))
+
+@pytest.mark.parametrize("payload", [
+    {},
+    {"event": "messages.upsert"},
+    {"event": "messages.upsert", "data": None},
+    {"event": "messages.upsert", "data": "oops"},
+    {"event": "messages.upsert", "data": {"key": [], "message": "oi"}},
+    {"event": "messages.upsert", "data": {"key": {"remoteJid": 5511}, "message": {"conversation": 42}}},
+])
+def test_missing_or_mistyped_fields_come_back_empty(payload):
+    inbound = decode_upsert(body(payload))
+    
+    assert inbound.phone_number == ""
+    assert inbound.content == ""
+    assert inbound.from_me is False
+
+def test_event_and_push_name_defaults():
+    inbound = decode_upsert(body({"event": 7, "pushName": None}))
+    
+    assert inbound.event == ""
+    assert inbound.push_name == "Unknown"
+
+def test_from_me_and_jid_suffix():
+    payload = upsert_payload("5511999990000", "Bot", "oi")
+    payload["data"]["key"]["fromMe"] = True
+    payload["data"]["key"]["remoteJid"] = "5511999990000@c.us"
+    
+    inbound = decode_upsert(body(payload))
+    assert inbound.from_me is True
+    assert inbound.phone_number == "5511999990000"
+
+def test_records_match_model_documents():
+    from models import Conversation, Message
+    
+    record = MessageRecord(conversation_id="c1", sender="user", content="oi")
+    assert set(record.to_doc()) == set(Message.model_fields)
+    
+    conversation = ConversationRecord(user_id="u1", phone_number="55", user_name="Maria", messages=[record])
+    doc = conversation.to_doc()
+    assert set(doc) == set(Conversation.model_fields)
+    assert doc["messages"] == [record.to_doc()]
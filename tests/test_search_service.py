@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+import re
+
+import pytest
+
+from search_service import SearchService, build_snippet, fold, highlight_pattern, search_terms
+
+def at(day: int) -> datetime:
+    return datetime(2026, 3, day, 12, 0, tzinfo=timezone.utc)
+
+class NoTextSearch:
+    """
+    mongomock has no $text: match every conversation (score 1) and run the
+    rest of the pipeline as is, so ranges, filtering and snippets are covered.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+    
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+    
+    def aggregate(self, pipeline):
+        match = {k: v for k, v in pipeline[0]["$match"].items() if k != "$text"}
+        project = {**pipeline[1]["$project"], "score": {"$literal": 1}}
+        return self.collection.aggregate([{"$match": match}, {"$project": project}, *pipeline[2:]])
+
+class SearchDb:
+    def __init__(self, db):
+        self.db = db
+    
+    def __getattr__(self, name):
+        collection = getattr(self.db, name)
+        return NoTextSearch(collection) if name == "conversations" else collection
+
+def test_fold_strips_accents():
+    assert fold("Orçamento AÇÃO") == "orcamento acao"
+
+def test_search_terms_skip_negated_and_short_words():
+    assert search_terms('"reforma da Cozinha" -piso de orçamento') == ["reforma", "cozinha", "orcamento"]
+
+def test_highlight_follows_accents_and_endings():
+    regex = re.compile(highlight_pattern(["reformas", "orcamento"]), re.IGNORECASE)
+    assert [m.group() for m in regex.finditer("Reforma e orçamentos, não reformulação")] == [
+        "Reforma", "orçamentos", "reformulação"
+    ]
+    assert highlight_pattern([]) is None
+
+def test_snippet_is_cut_around_the_first_match():
+    content = "x" * 100 + " orçamento " + "y" * 200
+    regex = re.compile(highlight_pattern(["orcamento"]), re.IGNORECASE)
+    result = build_snippet(content, regex)
+    
+    assert result["snippet"].startswith("…") and result["snippet"].endswith("…")
+    start, end = result["highlights"][0]
+    assert result["snippet"][start:end] == "orçamento"
+
+@pytest.mark.anyio
+async def test_range_keeps_only_matches_inside_it(db):
+    await db.conversations.insert_many([
+        {
+            "id": "c1", "status": "active", "started_at": at(1), "last_message_at": at(5),
+            "messages": [
+                {"id": "m1", "sender": "user", "content": "orçamento antigo", "timestamp": at(1)},
+                {"id": "m2", "sender": "user", "content": "novo orçamento", "timestamp": at(5)},
+            ]
+        },
+        {
+            "id": "c2", "status": "closed", "started_at": at(1), "last_message_at": at(2),
+            "messages": [{"id": "m3", "sender": "user", "content": "orçamento", "timestamp": at(2)}]
+        },
+    ])
+    service = SearchService(SearchDb(db))
+    
+    result = await service.search("orçamento", start=at(4))
+    assert [item["id"] for item in result["items"]] == ["c1"]
+    assert [m["message_id"] for m in result["items"][0]["matches"]] == ["m2"]
+    
+    result = await service.search("orçamento", status="closed")
+    assert [item["id"] for item in result["items"]] == ["c2"]
+
+@pytest.mark.anyio
+async def test_pages_with_next_offset(db):
+    for i in range(3):
+        await db.conversations.insert_one({
+            "id": f"c{i}", "status": "active", "started_at": at(1), "last_message_at": at(1 + i),
+            "messages": [{"id": f"m{i}", "content": "orçamento", "timestamp": at(1 + i)}]
+        })
+    service = SearchService(SearchDb(db))
+    
+    first = await service.search("orçamento", limit=2)
+    assert [item["id"] for item in first["items"]] == ["c2", "c1"] and first["next_offset"] == 2
+    rest = await service.search("orçamento", offset=2, limit=2)
+    assert [item["id"] for item in rest["items"]] == ["c0"] and rest["next_offset"] is None
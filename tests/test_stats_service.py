@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from models import get_brazil_time
+from stats_service import StatsService
+
+pytestmark = pytest.mark.anyio
+
+async def create(db, stats, conversation_id, status="active", messages=0):
+    now = get_brazil_time()
+    await db.conversations.insert_one({
+        "id": conversation_id,
+        "status": status,
+        "messages": [{"content": str(i), "timestamp": now} for i in range(messages)]
+    })
+    await stats.conversation_created(status)
+    if messages:
+        await stats.message_added(messages)
+
+async def test_incremental_counters_match_rebuild(db):
+    stats = StatsService(db)
+    await create(db, stats, "a", messages=2)
+    await create(db, stats, "b", messages=1)
+    await create(db, stats, "c")
+    
+    await db.conversations.update_one({"id": "b"}, {"$set": {"status": "transferred"}})
+    await stats.status_changed("active", "transferred")
+    await db.conversations.update_one({"id": "c"}, {"$set": {"status": "closed"}})
+    await stats.status_changed(None, "closed")
+    await db.conversations.delete_one({"id": "a"})
+    await stats.conversation_removed("active")
+    await stats.message_added(-2)
+    
+    incremental = await stats.get_dashboard()
+    assert incremental == {
+        "active_conversations": 0,
+        "transferred_conversations": 1,
+        "messages_today": 1,
+        "total_users": 2
+    }
+    await stats.rebuild()
+    assert await stats.get_dashboard() == incremental
+
+async def test_rebuild_repairs_drifted_counters(db):
+    stats = StatsService(db)
+    await create(db, stats, "a", messages=3)
+    await db.stats.update_one({"_id": "conversations"}, {"$inc": {"active": 5, "total": 5}})
+    await db.stats.update_one({"_id": stats.day_id()}, {"$set": {"count": 99}})
+    await db.stats.insert_one({"_id": "messages:2000-01-01", "count": 7})
+    
+    result = await stats.rebuild()
+    
+    assert result["conversations"]["total"] == 1
+    assert (await stats.get_dashboard())["messages_today"] == 3
+    assert await db.stats.find_one({"_id": "messages:2000-01-01"}) is None
+
+async def test_status_change_to_same_status_is_a_no_op(db):
+    stats = StatsService(db)
+    await stats.conversation_created("active")
+    await stats.status_changed(None, "active")
+    
+    assert (await stats.get_dashboard())["active_conversations"] == 1
+
+async def test_rebuild_counts_messages_on_the_sao_paulo_day(db):
+    stats = StatsService(db)
+    # 01:00 UTC on the 2nd is still the 1st in São Paulo
+    late_evening = datetime(2024, 3, 2, 1, 0, tzinfo=timezone.utc)
+    await db.conversations.insert_one({"id": "a", "status": "active", "messages": [
+        {"timestamp": late_evening},
+        {"timestamp": late_evening.isoformat()},
+        {"timestamp": "not a date"},
+    ]})
+    
+    await stats.rebuild()
+    
+    assert await db.stats.find_one({"_id": "messages:2024-03-01"}) == {"_id": "messages:2024-03-01", "count": 2}
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from supabase_service import SupabaseMessageWriter
+
+pytestmark = pytest.mark.anyio
+
+class FakeSupabase:
+    """Records every insert_messages call; fails the first `failures` calls"""
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        self.batches = []
+        self.calls = 0
+        self.failures = failures
+        self.delay = delay
+    
+    async def insert_messages(self, rows):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("supabase down")
+        self.batches.append(list(rows))
+    
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+def row(i: int) -> dict:
+    return {"conversation_id": "c1", "sender": "user", "content": str(i)}
+
+async def test_full_batches_are_written_without_waiting_for_the_interval():
+    service = FakeSupabase()
+    writer = SupabaseMessageWriter(service, batch_size=3, flush_interval=5.0)
+    writer.start()
+    for i in range(6):
+        await writer.put(row(i))
+    await asyncio.sleep(0.05)
+    
+    assert [len(batch) for batch in service.batches] == [3, 3]
+    await writer.close()
+
+async def test_partial_batch_is_written_after_flush_interval():
+    service = FakeSupabase()
+    writer = SupabaseMessageWriter(service, batch_size=100, flush_interval=0.05)
+    writer.start()
+    await writer.put(row(1))
+    await writer.put(row(2))
+    await asyncio.sleep(0.2)
+    
+    assert [r["content"] for r in service.rows] == ["1", "2"]
+    await writer.close()
+
+async def test_failed_batch_is_retried():
+    service = FakeSupabase(failures=2)
+    writer = SupabaseMessageWriter(service, batch_size=2, flush_interval=0.01, max_retries=3)
+    writer.start()
+    await writer.put(row(1))
+    await writer.put(row(2))
+    # Backoff is 0.5s then 1s before the third attempt
+    await writer.close(timeout=5.0)
+    
+    assert service.calls == 3
+    assert [r["content"] for r in service.rows] == ["1", "2"]
+    assert writer.dropped == 0
+
+async def test_close_flushes_buffered_rows():
+    service = FakeSupabase()
+    writer = SupabaseMessageWriter(service, batch_size=100, flush_interval=10.0)
+    writer.start()
+    for i in range(5):
+        await writer.put(row(i))
+    await writer.close()
+    
+    assert [r["content"] for r in service.rows] == ["0", "1", "2", "3", "4"]
+
+async def test_full_buffer_without_spill_drops_and_counts():
+    service = FakeSupabase(delay=0.5)
+    writer = SupabaseMessageWriter(service, batch_size=1, flush_interval=0.01, max_pending=1, enqueue_timeout=0.01)
+    writer.start()
+    await writer.put(row(0))
+    await asyncio.sleep(0.02)  # row 0 is being written
+    assert await writer.put(row(1))
+    
+    assert not await writer.put(row(2))
+    assert writer.dropped == 1
+    await writer.close()
+
+async def test_rows_that_cannot_be_written_are_spilled_and_replayed(db):
+    service = FakeSupabase(failures=1)
+    writer = SupabaseMessageWriter(
+        service, batch_size=10, flush_interval=0.01, max_retries=1,
+        spill=db.supabase_spill, replay_interval=0.05
+    )
+    writer.start()
+    await writer.put(row(1))
+    await writer.put(row(2))
+    await asyncio.sleep(0.3)
+    await writer.close()
+    
+    assert [r["content"] for r in service.rows] == ["1", "2"]
+    assert await db.supabase_spill.count_documents({}) == 0
+    assert writer.dropped == 0
+
+async def test_put_after_close_spills(db):
+    writer = SupabaseMessageWriter(FakeSupabase(), spill=db.supabase_spill)
+    writer.start()
+    await writer.close()
+    
+    assert await writer.put(row(1))
+    spilled = await db.supabase_spill.find_one({}, {"_id": 0, "row": 1})
+    assert spilled == {"row": row(1)}
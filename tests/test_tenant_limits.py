@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import tenant_service
+from tenant_service import TenantBusy, TenantLimits, TokenBucket
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tenant_service.time, "monotonic", clock)
+    return clock
+
+def test_bucket_allows_one_minute_burst(clock):
+    bucket = TokenBucket(3)
+    
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+def test_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(60)
+    for _ in range(60):
+        bucket.take()
+    assert not bucket.take()
+    
+    clock.now += 1
+    assert bucket.take()
+    assert not bucket.take()
+
+def test_bucket_never_holds_more_than_capacity(clock):
+    bucket = TokenBucket(2)
+    clock.now += 3600
+    
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+
+def test_llm_budget_counts_refusals(clock):
+    limits = TenantLimits(max_webhooks=0, max_llm=0, llm_per_minute=1, queue_timeout=0.1)
+    
+    assert limits.take_llm_budget()
+    assert not limits.take_llm_budget()
+    assert limits.over_budget == 1
+
+def test_zero_means_unlimited(clock):
+    limits = TenantLimits(max_webhooks=0, max_llm=0, llm_per_minute=0, queue_timeout=0.1)
+    
+    assert all(limits.take_llm_budget() for _ in range(1000))
+
+@pytest.mark.anyio
+async def test_webhook_slot_rejects_when_busy_past_queue_timeout():
+    limits = TenantLimits(max_webhooks=1, max_llm=0, llm_per_minute=0, queue_timeout=0.05)
+    
+    async with limits.webhook_slot():
+        assert limits.webhooks_in_flight == 1
+        with pytest.raises(TenantBusy):
+            async with limits.webhook_slot():
+                pass
+    assert limits.rejected == 1
+    assert limits.webhooks_in_flight == 0
+    
+    async with limits.webhook_slot():
+        pass
+
+@pytest.mark.anyio
+async def test_webhook_slot_waits_for_a_free_slot():
+    limits = TenantLimits(max_webhooks=1, max_llm=0, llm_per_minute=0, queue_timeout=1.0)
+    
+    async def hold():
+        async with limits.webhook_slot():
+            await asyncio.sleep(0.05)
+    
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    async with limits.webhook_slot():
+        assert limits.webhooks_in_flight == 1
+    await holder
+    assert limits.rejected == 0
+
+@pytest.mark.anyio
+async def test_llm_slot_caps_concurrency():
+    limits = TenantLimits(max_webhooks=0, max_llm=2, llm_per_minute=0, queue_timeout=0.1)
+    peak = 0
+    
+    async def call():
+        nonlocal peak
+        async with limits.llm_slot():
+            peak = max(peak, limits.llm_in_flight)
+            await asyncio.sleep(0.01)
+    
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+    assert limits.llm_in_flight == 0
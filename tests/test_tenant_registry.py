@@ -0,0 +1,42 @@
+import pytest
+
+from event_bus import EventBus
+from tenant_service import TenantRegistry
+
+pytestmark = pytest.mark.anyio
+
+async def rename(db, name):
+    await db.tenants.update_one({"id": "t1"}, {"$set": {"name": name}})
+
+@pytest.fixture
+async def registry(db):
+    await db.tenants.insert_one({"id": "t1", "name": "Loja", "webhook_id": "w1"})
+    return TenantRegistry(db, ttl=300, event_bus=EventBus())
+
+async def test_cached_until_invalidated(db, registry):
+    assert (await registry.resolve("w1")).name == "Loja"
+    await rename(db, "Loja 2")
+    assert (await registry.resolve("w1")).name == "Loja"
+    
+    await registry.changed()
+    assert (await registry.resolve("w1")).name == "Loja 2"
+
+async def test_change_on_another_worker_invalidates(db, registry):
+    await registry.get("t1")
+    await rename(db, "Loja 2")
+    
+    # What the pub/sub listener delivers when another worker calls changed()
+    registry.event_bus._dispatch({"type": TenantRegistry.CHANGED_EVENT, "internal": True})
+    assert (await registry.get("t1")).name == "Loja 2"
+
+async def test_resync_invalidates(db, registry):
+    await registry.get("t1")
+    await rename(db, "Loja 2")
+    
+    registry.event_bus._dispatch({"type": "resync"})
+    assert (await registry.get("t1")).name == "Loja 2"
+
+async def test_change_events_stay_off_panel_streams(registry):
+    queue = registry.event_bus.subscribe()
+    await registry.changed()
+    assert queue.empty()